@@ -0,0 +1,780 @@
+# benchmarks.py
+#
+# Headless performance checks. Run with: python benchmarks.py <benchmark> [options]
+
+import os
+import sys
+import math
+import time
+import random
+import argparse
+import timeit
+import tempfile
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+from constants import *  # before pygame.init(): constants briefly inits and quits pygame itself
+import pygame
+import numpy as np
+
+import rng
+from entities import Boat, AIBoat, Buoy, Sandbar, WakeParticle, SailingStyle
+from course import CoursePreparer
+from simulation import RaceSimulation, create_ai_fleet, place_boats_on_start_grid
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where it can't be measured."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def current_rss_mb():
+    """Resident set size of this process right now in MB, from /proc, or None where there isn't one."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def run_headless_race(boats, course, laps=1, time_limit=600.0, telemetry=None):
+    """Races an AI fleet over course in simulation time until everyone finishes or time runs out."""
+    place_boats_on_start_grid(boats)
+    sim = RaceSimulation(boats, course.course_buoys_coords, course.sandbar_index, laps,
+                         random.uniform(MIN_WIND_SPEED, MAX_WIND_SPEED), course.wind_direction, telemetry=telemetry,
+                         navigation=course.navigation, heightfield=course.heightfield)
+    while sim.time < time_limit and not all(boat.is_finished for boat in boats):
+        sim.step(SIM_TIMESTEP)
+    return sim
+
+def bench_memory(args):
+    """
+    Prepares and races a series of courses, reporting resident memory after each and the
+    traced Python allocation peaks of preparing and racing it, then the depth map's footprint.
+    Times include tracemalloc's overhead.
+    """
+    rng.seed_all(args.seed)
+    boats = create_ai_fleet(args.boats)
+    depth_map = None
+    worst = 0.0
+    tracemalloc.start()
+    print(f"{'race':>4} {'prep s':>7} {'race s':>7} {'RSS MB':>7} {'traced':>7} {'prep pk':>7} {'race pk':>7}")
+    for race in range(1, args.races + 1):
+        tracemalloc.reset_peak()
+        t0 = time.perf_counter()
+        course = CoursePreparer(depth_map).finish()
+        depth_map = course.depth_map
+        t1 = time.perf_counter()
+        prep_peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.reset_peak()
+        if args.sim_time > 0:
+            run_headless_race(boats, course, time_limit=args.sim_time)
+        t2 = time.perf_counter()
+        traced, race_peak = (n / 2**20 for n in tracemalloc.get_traced_memory())
+        rss = current_rss_mb()
+        rss_text = f"{rss:7.1f}" if rss is not None else f"{'n/a':>7}"
+        print(f"{race:>4} {t1 - t0:7.2f} {t2 - t1:7.2f} {rss_text} {traced:7.1f} {prep_peak:7.1f} {race_peak:7.1f}")
+        if rss is not None:
+            worst = max(worst, rss)
+    tracemalloc.stop()
+
+    width, height = depth_map.get_size()
+    full_bytes = width * height * 4
+    print(f"depth map: {depth_map.surface.get_width()}x{depth_map.surface.get_height()} @ 8-bit, "
+          f"{depth_map.nbytes / 2**20:.1f} MB (full-resolution 32-bit: {full_bytes / 2**20:.1f} MB)")
+    peak = peak_rss_mb()
+    if peak is not None:
+        print(f"peak RSS over the whole run: {peak:.1f} MB")
+
+    if args.max_rss_mb is not None:
+        if current_rss_mb() is None:
+            print("current RSS is not available on this platform; threshold not checked")
+        elif worst > args.max_rss_mb:
+            print(f"FAIL: RSS {worst:.1f} MB after a race exceeds {args.max_rss_mb} MB")
+            return 1
+    return 0
+
+def bytes_per_instance(factory, count):
+    """Average traced allocation per object (including the containers it owns) over count objects."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [factory(i) for i in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return (after - before) / count
+
+def bench_entities(args):
+    """Reports bytes per entity and attribute read/write speed for a fleet of boats."""
+    rng.seed_all(args.seed)
+    n = args.fleet
+    styles = list(SailingStyle)
+    sizes = [
+        ('Boat', bytes_per_instance(lambda i: Boat(0, 0, name=f"Boat {i}"), n)),
+        ('AIBoat', bytes_per_instance(lambda i: AIBoat(0, 0, f"AI {i}", styles[i % len(styles)], AI_BOAT_COLORS[0]), n)),
+        ('Sandbar', bytes_per_instance(lambda i: Sandbar(i, i, random.randint(MIN_SANDBAR_SIZE, MAX_SANDBAR_SIZE)), n)),
+        ('Buoy', bytes_per_instance(lambda i: Buoy(i, i, i), n)),
+        ('WakeParticle', bytes_per_instance(lambda i: WakeParticle(i, i), n * MAX_WAKE_PARTICLES)),
+    ]
+    print(f"{'entity':<13} {'bytes each':>10}")
+    for name, size in sizes:
+        print(f"{name:<13} {size:10.0f}")
+    fleet_bytes = sizes[1][1] + sizes[4][1] * MAX_WAKE_PARTICLES
+    print(f"fleet of {n} AI boats with full wakes: {fleet_bytes * n / 2**20:.2f} MB")
+
+    fleet = [AIBoat(0, 0, f"AI {i}", styles[i % len(styles)], AI_BOAT_COLORS[0]) for i in range(n)]
+
+    def read_fleet():
+        total = 0.0
+        for boat in fleet:
+            total += boat.world_x + boat.world_y + boat.heading + boat.speed
+        return total
+
+    def write_fleet():
+        for boat in fleet:
+            boat.prev_world_x = boat.world_x
+            boat.prev_world_y = boat.world_y
+            boat.world_x += 1.0
+            boat.world_y -= 1.0
+
+    for label, fn, accesses in (('read', read_fleet, 4), ('write', write_fleet, 8)):
+        best = min(timeit.repeat(fn, number=args.repeat, repeat=5))
+        print(f"attribute {label}: {best / (args.repeat * n * accesses) * 1e9:.1f} ns per access")
+    return 0
+
+def bench_env(args):
+    """Measures VectorSailingEnv throughput under a random policy."""
+    from env import VectorSailingEnv, ACTION_SIZE
+    gen = np.random.default_rng(args.seed)
+    print(f"{'envs':>6} {'env steps/s':>12} {'sim steps/s':>12}")
+    for num_envs in args.envs:
+        env = VectorSailingEnv(num_envs, seed=args.seed)
+        env.reset()
+        actions = gen.uniform(-1.0, 1.0, (args.steps, num_envs, ACTION_SIZE))
+        start = time.perf_counter()
+        for step_actions in actions:
+            env.step(step_actions)
+        rate = num_envs * args.steps / (time.perf_counter() - start)
+        print(f"{num_envs:>6} {rate:12.0f} {rate * env.action_repeat:12.0f}")
+    return 0
+
+def bench_telemetry(args):
+    """Measures what telemetry recording costs a headless race, then times the columnar export."""
+    from telemetry import TelemetryRecorder, load_telemetry
+    rng.seed_all(args.seed)
+    course = CoursePreparer().finish()
+    boats = create_ai_fleet(args.boats)
+    telemetry = TelemetryRecorder(boats, args.rate)
+    start = time.perf_counter()
+    sim = run_headless_race(boats, course, time_limit=args.sim_time, telemetry=telemetry)
+    race_seconds = time.perf_counter() - start
+    step_us = race_seconds / (sim.time / SIM_TIMESTEP) * 1e6
+    print(f"race: {sim.time:.1f}s simulated, {len(telemetry)} samples x {len(boats)} boats, "
+          f"{telemetry.nbytes / 2**20:.2f} MB of ring buffers")
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        telemetry.export(directory)
+        elapsed = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        columns = load_telemetry(directory)
+        print(f"export: {size / 2**10:.0f} KB in {elapsed * 1000:.1f} ms; "
+              f"{columns['speed'].shape[0]} rows, mean speed {float(np.mean(columns['speed'])):.2f}")
+        del columns
+
+    def sample():
+        telemetry.next_sample_time = 0.0 # Force a sample on every call
+        telemetry.record(sim)
+
+    sample_us = min(timeit.repeat(sample, number=args.repeat, repeat=5)) / args.repeat * 1e6
+    samples_per_step = args.rate * SIM_TIMESTEP
+    print(f"sample: {sample_us:.1f} us; sim step: {step_us:.0f} us; "
+          f"overhead at {args.rate:g} Hz: {sample_us * samples_per_step / step_us * 100:.2f}%")
+    return 0
+
+def bench_collision(args):
+    """Compares discrete and swept collision: cost per simulated second, and contacts missed by coarse steps."""
+    from course import generate_random_buoys, generate_random_sandbars
+    from spatial import build_sandbar_index
+    from collision import sweep_circle_circle, sweep_circle_polygon, sweep_boat_sandbars
+    rng.seed_all(args.seed)
+    course_buoys_coords = generate_random_buoys(NUM_COURSE_BUOYS)
+    sandbars = generate_random_sandbars(NUM_SANDBARS, course_buoys_coords)
+    sandbar_index = build_sandbar_index(sandbars)
+
+    for swept in (False, True):
+        rng.seed_all(args.seed)
+        boats = create_ai_fleet(args.boats)
+        place_boats_on_start_grid(boats)
+        sim = RaceSimulation(boats, course_buoys_coords, sandbar_index, 1, MIN_WIND_SPEED, random.uniform(0, 360), swept=swept)
+        start = time.perf_counter()
+        while sim.time < args.sim_time:
+            sim.step(SIM_TIMESTEP)
+        elapsed = time.perf_counter() - start
+        print(f"{'swept' if swept else 'discrete'}: {elapsed / sim.time * 1000:.2f} ms per simulated second")
+
+    # Straight moves at top speed over one coarse step. Ground truth walks the path a unit at a time.
+    radius = Boat.collision_radius
+    step = MAX_BOAT_SPEED * BOAT_DISTANCE_MULTIPLIER * args.coarse_dt
+    buoy_radius = radius + BUOY_RADIUS
+    buoys = list(course_buoys_coords) + list(START_FINISH_LINE)
+    contacts = missed_discrete = missed_swept = 0
+    for _ in range(args.probes):
+        # Aim near a random buoy or sandbar so most moves pass close to something
+        if random.random() < 0.5:
+            tx, ty = random.choice(buoys)
+        else:
+            target = random.choice(sandbars)
+            tx, ty = target.world_x, target.world_y
+        angle = random.uniform(0, 2 * math.pi)
+        dx, dy = math.cos(angle) * step, math.sin(angle) * step
+        x0 = tx - dx / 2 + random.uniform(-60, 60)
+        y0 = ty - dy / 2 + random.uniform(-60, 60)
+
+        def touching(x, y):
+            if any((x - bx)**2 + (y - by)**2 <= buoy_radius**2 for bx, by in buoys):
+                return True
+            return any(sweep_circle_polygon(x, y, 0.0, 0.0, radius, sb.vertices) == 0.0 for sb in sandbar_index.query_rect(x - radius, y - radius, x + radius, y + radius))
+
+        samples = max(1, int(step))
+        if touching(x0, y0) or not any(touching(x0 + dx * k / samples, y0 + dy * k / samples) for k in range(samples + 1)):
+            continue
+        contacts += 1
+        missed_discrete += not touching(x0 + dx, y0 + dy)
+        hit = sweep_boat_sandbars(x0, y0, x0 + dx, y0 + dy, radius, sandbar_index) is not None
+        hit = hit or any(sweep_circle_circle(x0, y0, dx, dy, bx, by, buoy_radius) is not None for bx, by in buoys)
+        missed_swept += not hit
+    print(f"{contacts} contacts during {step:.0f}-unit moves (dt {args.coarse_dt}s at top speed): "
+          f"discrete missed {missed_discrete} ({missed_discrete / max(1, contacts) * 100:.0f}%), swept missed {missed_swept}")
+    return 0 if missed_swept == 0 else 1
+
+def bench_navigation(args):
+    """Navigation graph build time, and seconds spent grounded with and without waypoints."""
+    from course import generate_random_buoys, generate_random_sandbars
+    from spatial import build_sandbar_index
+    from navigation import build_navigation
+    totals = {False: [0.0, 0.0], True: [0.0, 0.0]}
+    for seed in range(args.seed, args.seed + args.courses):
+        rng.seed_all(seed)
+        course_buoys_coords = generate_random_buoys(NUM_COURSE_BUOYS)
+        sandbars = generate_random_sandbars(NUM_SANDBARS, course_buoys_coords)
+        sandbar_index = build_sandbar_index(sandbars)
+        start = time.perf_counter()
+        navigation = build_navigation(sandbars, course_buoys_coords)
+        build_ms = (time.perf_counter() - start) * 1000
+        line = f"course {seed}: {len(navigation.nodes)} nodes, {navigation.edge_count} edges, built in {build_ms:.0f} ms;"
+        for use_navigation in (False, True):
+            rng.seed_all(seed)
+            boats = create_ai_fleet(args.boats)
+            place_boats_on_start_grid(boats)
+            sim = RaceSimulation(boats, course_buoys_coords, sandbar_index, 1, MIN_WIND_SPEED, random.uniform(0, 360),
+                                 navigation=navigation if use_navigation else None)
+            grounded = 0
+            while sim.time < args.time_limit and not all(boat.is_finished for boat in boats):
+                sim.step(SIM_TIMESTEP)
+                grounded += sum(boat.on_sandbar and not boat.is_finished for boat in boats)
+            grounded *= SIM_TIMESTEP
+            totals[use_navigation][0] += grounded
+            totals[use_navigation][1] += sim.time
+            line += f" {'waypoints' if use_navigation else 'direct'} {grounded:.1f}s grounded / {sim.time:.0f}s"
+        print(line)
+    for use_navigation, (grounded, race_time) in totals.items():
+        print(f"{'waypoints' if use_navigation else 'direct'}: {grounded:.1f}s grounded over {race_time:.0f}s of racing")
+    return 0
+
+def bench_frames(args):
+    """Renders steady-state racing frames and reports net traced allocation and garbage collections per frame."""
+    import gc
+    from main import render_view
+    from graphics import Minimap
+    from quality import QUALITY_LEVELS
+    from spatial import build_fleet_index
+    from utils import create_wave_layer
+    rng.seed_all(args.seed)
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    font = pygame.font.Font(None, 30)
+    lap_font = pygame.font.Font(None, 24)
+    course = CoursePreparer().finish()
+    player = Boat(0, 0, name="Player 1", boat_color=WHITE)
+    ai_boats = create_ai_fleet(args.boats)
+    boats = [player] + ai_boats
+    place_boats_on_start_grid(boats)
+    sim = RaceSimulation(boats, course.course_buoys_coords, course.sandbar_index, 1, MIN_WIND_SPEED, course.wind_direction,
+                         pre_race_timer=0, navigation=course.navigation, heightfield=course.heightfield)
+    wave_layers = [create_wave_layer(SCREEN_WIDTH + 100, SCREEN_HEIGHT // 2 + 100, WAVE_DENSITY, WAVE_LAYER_ALPHA, WAVE_LINE_THICKNESS) for _ in range(NUM_WAVE_LAYERS)]
+    wave_offsets = [[0.0, 0.0] for _ in range(NUM_WAVE_LAYERS)]
+    minimap = Minimap(MAP_RECT_P1)
+    quality = QUALITY_LEVELS[0]
+    fleet_index = None
+    race_info = {'wind_speed': 0.0, 'wind_dir': 0.0, 'current_race': 1, 'total_races': 1, 'total_laps': 1, 'time': 0.0}
+    dt = 1.0 / FRAME_RATE_CAP
+    steps_per_frame = max(1, round(dt / SIM_TIMESTEP))
+
+    def frame():
+        nonlocal fleet_index
+        for _ in range(steps_per_frame):
+            player.turn(1)
+            sim.step(SIM_TIMESTEP)
+        fleet_index = build_fleet_index(boats, fleet_index)
+        race_info['wind_speed'] = sim.wind_speed
+        race_info['wind_dir'] = sim.wind_direction
+        race_info['time'] = sim.time
+        render_view(screen, player, [player], ai_boats, course.sandbars, course.buoys, START_FINISH_LINE, course.depth_map,
+                    wave_layers, wave_offsets, sim.wind_direction, dt, font, lap_font, race_info, 1.0, quality, fleet_index)
+        minimap.draw(screen, quality.map_interval, player, ai_boats, course.sandbars, course.buoys, player.next_buoy_index, START_FINISH_LINE, [player])
+
+    for _ in range(args.warmup): # Fill the wakes and let every cache reach its working size
+        frame()
+    collections = [0]
+    def count_collection(phase, info):
+        if phase == 'start':
+            collections[0] += 1
+    gc.collect()
+    gc.callbacks.append(count_collection)
+    tracemalloc.start()
+    try:
+        start_bytes = tracemalloc.get_traced_memory()[0]
+        transient = 0
+        start = time.perf_counter()
+        for _ in range(args.frames):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            frame()
+            transient += tracemalloc.get_traced_memory()[1] - before
+        elapsed = time.perf_counter() - start
+        net = (tracemalloc.get_traced_memory()[0] - start_bytes) / args.frames
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+        gc.callbacks.remove(count_collection)
+    print(f"{args.frames} frames, {len(boats)} boats: {elapsed / args.frames * 1000:.2f} ms per frame (traced), "
+          f"net {net:+.1f} bytes per frame, peak {transient / args.frames:.0f} bytes in flight, {collections[0]} garbage collections")
+    if args.verbose:
+        for stat in snapshot.statistics('lineno')[:10]:
+            print(f"  {stat}")
+    if args.max_bytes_per_frame is not None and net > args.max_bytes_per_frame:
+        print(f"FAIL: {net:.1f} net bytes per frame exceeds {args.max_bytes_per_frame}")
+        return 1
+    return 0
+
+def bench_snapshot(args):
+    """Times race snapshot save/restore and forking, and checks a restored race carries on bit-identically."""
+    from snapshot import capture_race, restore_race, restore_course, snapshot_to_bytes, snapshot_from_bytes, RaceFork
+    from statehash import fleet_state
+    rng.seed_all(args.seed)
+    course = CoursePreparer().finish()
+    boats = create_ai_fleet(args.boats)
+    sim = run_headless_race(boats, course, time_limit=args.at)
+
+    def best_ms(fn):
+        return min(timeit.repeat(fn, number=args.repeat, repeat=5)) / args.repeat * 1000
+
+    data = snapshot_to_bytes(capture_race(sim, course))
+    print(f"snapshot at {sim.time:.1f}s, {len(boats)} boats: {len(data) / 1024:.1f} KB")
+    print(f"save (capture + serialise): {best_ms(lambda: snapshot_to_bytes(capture_race(sim, course))):.2f} ms")
+    print(f"restore (deserialise + rebuild, same course): {best_ms(lambda: restore_race(snapshot_from_bytes(data), course)):.2f} ms")
+    print(f"fork: {best_ms(lambda: RaceFork(sim)):.2f} ms")
+    start = time.perf_counter()
+    restore_course(snapshot_from_bytes(data)['course'])
+    print(f"restore onto a rebuilt course (redraws the depth map): {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    # The original carrying on, against a restored copy and a fork doing the same
+    restore_race(snapshot_from_bytes(data), course) # Rewinds the random streams to the snapshot
+    fork = RaceFork(sim)
+    outside = rng.get_state()
+    fork.run(args.steps)
+    forked = fleet_state(fork.sim)
+    untouched = rng.get_state() == outside
+    for _ in range(args.steps):
+        sim.step(SIM_TIMESTEP)
+    expected = fleet_state(sim)
+    restored = restore_race(snapshot_from_bytes(data), course)
+    for _ in range(args.steps):
+        restored.step(SIM_TIMESTEP)
+    identical = np.array_equal(fleet_state(restored), expected) and np.array_equal(forked, expected)
+    print(f"after {args.steps} more steps: restored and forked races {'identical' if identical else 'DIVERGED'}; "
+          f"fork {'left' if untouched else 'DISTURBED'} the outside random streams")
+    return 0 if identical and untouched else 1
+
+def bench_planner(args):
+    """Race times with the rollout planner against the default tactics, and what planning costs per step."""
+    from course import generate_random_buoys, generate_random_sandbars
+    from spatial import build_sandbar_index
+    from navigation import build_navigation
+    from planner import RolloutPlanner
+    class TimedPlanner(RolloutPlanner):
+        seconds = 0.0
+        steps = 0
+        worst = 0.0
+
+        def advance(self, sim):
+            start = time.perf_counter()
+            super().advance(sim)
+            elapsed = time.perf_counter() - start
+            TimedPlanner.seconds += elapsed
+            TimedPlanner.steps += 1
+            TimedPlanner.worst = max(TimedPlanner.worst, elapsed)
+
+    totals = {False: [0.0, 0], True: [0.0, 0]}
+    for seed in range(args.seed, args.seed + args.courses):
+        rng.seed_all(seed)
+        course_buoys_coords = generate_random_buoys(NUM_COURSE_BUOYS)
+        sandbars = generate_random_sandbars(NUM_SANDBARS, course_buoys_coords)
+        sandbar_index = build_sandbar_index(sandbars)
+        navigation = build_navigation(sandbars, course_buoys_coords)
+        wind_direction = rng.course.uniform(0, 360)
+        line = f"course {seed}:"
+        for plan in (False, True):
+            rng.seed_all(seed)
+            boats = create_ai_fleet(args.boats)
+            place_boats_on_start_grid(boats)
+            sim = RaceSimulation(boats, course_buoys_coords, sandbar_index, 1, rng.wind.uniform(MIN_WIND_SPEED, MAX_WIND_SPEED),
+                                 wind_direction, navigation=navigation, plan=False)
+            sim.planner = TimedPlanner(budget=args.budget) if plan else None
+            while sim.time < args.time_limit and not all(boat.is_finished for boat in boats):
+                sim.step(SIM_TIMESTEP)
+            times = [boat.finish_time if boat.is_finished else args.time_limit for boat in boats]
+            totals[plan][0] += sum(times)
+            totals[plan][1] += sum(not boat.is_finished for boat in boats)
+            line += f" {'planned' if plan else 'default'} {sum(times) / len(times):.1f}s mean"
+        print(line)
+    races = args.courses * args.boats
+    for plan, (total, unfinished) in totals.items():
+        print(f"{'planned' if plan else 'default'}: {total / races:.1f}s mean race time, {unfinished} of {races} unfinished "
+              f"(counted as {args.time_limit:.0f}s)")
+    if TimedPlanner.steps:
+        print(f"planner: {TimedPlanner.seconds / TimedPlanner.steps * 1000:.3f} ms per step on average, "
+              f"{TimedPlanner.worst * 1000:.3f} ms at worst "
+              f"({args.budget} rollout updates per step)")
+    return 0
+
+def bench_render(args):
+    """Times the world pass of racing frames at several internal render scales, HUD and upscale included."""
+    from main import render_view
+    from graphics import WorldCanvas
+    from quality import QUALITY_LEVELS
+    from spatial import build_fleet_index
+    from utils import create_wave_layer
+    width, height = (int(v) for v in args.size.lower().split('x')) if args.size else (SCREEN_WIDTH, SCREEN_HEIGHT)
+    rng.seed_all(args.seed)
+    screen = pygame.display.set_mode((width, height))
+    font = pygame.font.Font(None, 30)
+    lap_font = pygame.font.Font(None, 24)
+    course = CoursePreparer().finish()
+    player = Boat(0, 0, name="Player 1", boat_color=WHITE)
+    ai_boats = create_ai_fleet(args.boats)
+    boats = [player] + ai_boats
+    place_boats_on_start_grid(boats)
+    sim = RaceSimulation(boats, course.course_buoys_coords, course.sandbar_index, 1, MIN_WIND_SPEED, course.wind_direction,
+                         pre_race_timer=0, navigation=course.navigation, heightfield=course.heightfield)
+    wave_layers = [create_wave_layer(width + 100, height // 2 + 100, WAVE_DENSITY, WAVE_LAYER_ALPHA, WAVE_LINE_THICKNESS) for _ in range(NUM_WAVE_LAYERS)]
+    wave_offsets = [[0.0, 0.0] for _ in range(NUM_WAVE_LAYERS)]
+    quality = QUALITY_LEVELS[0]
+    race_info = {'wind_speed': 0.0, 'wind_dir': 0.0, 'current_race': 1, 'total_races': 1, 'total_laps': 1, 'time': 0.0}
+    dt = 1.0 / FRAME_RATE_CAP
+    for _ in range(args.warmup): # Let the wakes reach their steady size
+        sim.step(SIM_TIMESTEP)
+    fleet_index = build_fleet_index(boats)
+    print(f"{width}x{height}, {len(boats)} boats, {'smooth' if args.smooth else 'nearest'} upscale")
+    baseline = None
+    for scale in args.scales:
+        canvas = WorldCanvas(scale, args.smooth) if scale != 1 else None
+        def frame():
+            render_view(screen, player, [player], ai_boats, course.sandbars, course.buoys, START_FINISH_LINE, course.depth_map,
+                        wave_layers, wave_offsets, sim.wind_direction, dt, font, lap_font, race_info, 1.0, quality, fleet_index, canvas)
+        frame() # Builds the canvas and its wave layers
+        per_frame = min(timeit.repeat(frame, number=args.frames, repeat=3)) / args.frames * 1000
+        if baseline is None:
+            baseline = per_frame
+        print(f"  scale {scale:g}: {per_frame:.2f} ms per frame ({per_frame / baseline:.2f}x of scale {args.scales[0]:g})")
+    return 0
+
+def bench_courses(args):
+    """Times choosing a course from many scored candidates, and races AI fleets on the first candidate and the chosen one."""
+    from course import Course, candidate_workers, start_candidate_pool, select_course_steps, generate_candidate, score_course, estimate_lap_time
+    from spatial import build_sandbar_index
+    from navigation import build_navigation
+    from terrain import generate_heightfield
+    from utils import run_to_completion
+    workers = candidate_workers(args.workers)
+    pool = start_candidate_pool(workers)
+    try:
+        if pool is not None:
+            start = time.perf_counter()
+            run_to_completion(select_course_steps(0.0, COURSE_CANDIDATE_BATCH * workers, pool)) # Start every worker
+            print(f"{workers} workers started in {time.perf_counter() - start:.2f}s")
+        totals = {'first': [0.0, 0.0, 0, 0], 'chosen': [0.0, 0.0, 0, 0]} # score, race time, races, unfinished
+        for seed in range(args.seed, args.seed + args.courses):
+            rng.seed_all(seed)
+            wind_direction = rng.course.uniform(0, 360)
+            first_seed = rng.course.getstate() # select_course_steps draws its seeds next; the first is the old single course
+            start = time.perf_counter()
+            chosen_seed, _ = run_to_completion(select_course_steps(wind_direction, args.candidates, pool))
+            elapsed = time.perf_counter() - start
+            rng.course.setstate(first_seed)
+            first_seed = rng.course.getrandbits(32)
+            line = f"course {seed}: {args.candidates} candidates in {elapsed:.2f}s;"
+            for label, candidate in (('first', first_seed), ('chosen', chosen_seed)):
+                course_buoys_coords, sandbars = generate_candidate(candidate)
+                score = score_course(wind_direction, course_buoys_coords, build_sandbar_index(sandbars))
+                line += f" {label} score {score:.2f} est {estimate_lap_time(wind_direction, course_buoys_coords):.0f}s"
+                totals[label][0] += score
+                if args.race:
+                    course = Course(wind_direction, course_buoys_coords, sandbars, None,
+                                    build_navigation(sandbars, course_buoys_coords) if NAV_ENABLED else None, generate_heightfield(sandbars))
+                    boats = create_ai_fleet(args.boats)
+                    run_headless_race(boats, course, time_limit=args.time_limit)
+                    times = [boat.finish_time for boat in boats if boat.is_finished]
+                    line += f" raced {sum(times) / len(times):.0f}s" if times else " raced -"
+                    totals[label][1] += sum(times)
+                    totals[label][2] += len(times)
+                    totals[label][3] += len(boats) - len(times)
+            print(line)
+        for label, (score, race_time, races, unfinished) in totals.items():
+            line = f"{label}: mean score {score / args.courses:.2f}"
+            if args.race:
+                line += f", {race_time / max(1, races):.1f}s mean race time, {unfinished} unfinished"
+            print(line)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return 0
+
+def bench_prep(args):
+    """Times each frame's CoursePreparer.advance against the per-frame budget, on seeded courses, with frames paced like the game's."""
+    from course import candidate_workers, start_candidate_pool, select_course_steps
+    from utils import run_to_completion
+    workers = candidate_workers(args.workers)
+    pool = start_candidate_pool(workers) if COURSE_CANDIDATES > 1 else None
+    try:
+        if pool is not None:
+            start = time.perf_counter()
+            run_to_completion(select_course_steps(0.0, COURSE_CANDIDATE_BATCH * workers, pool)) # Start every worker
+            print(f"{workers} workers started in {time.perf_counter() - start:.2f}s")
+        depth_map = None
+        frames = []
+        for seed in range(args.seed, args.seed + args.courses):
+            preparer = CoursePreparer(depth_map, seed, pool=pool)
+            start = time.perf_counter()
+            while True:
+                frame_start = time.perf_counter()
+                ready = preparer.advance(args.budget / 1000)
+                frames.append(time.perf_counter() - frame_start)
+                if ready:
+                    break
+                time.sleep(max(0.0, frame_start + 1.0 / (FRAME_RATE_CAP or 60) - time.perf_counter())) # The rest of the frame
+            depth_map = preparer.course.depth_map
+            print(f"course {seed}: ready in {time.perf_counter() - start:.2f}s")
+        frames = np.array(frames) * 1000
+        over = int(np.count_nonzero(frames > 2 * args.budget))
+        print(f"{len(frames)} frames at {args.budget:.1f} ms budget ({'in-process' if pool is None else f'{workers} workers'}): "
+              f"{np.median(frames):.2f} ms median, {np.percentile(frames, 99):.2f} ms p99, "
+              f"longest {frames.max():.2f} ms, {over} over twice the budget")
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return 0
+
+def bench_terrain(args):
+    """Times generating the heightfield and drawing the depth map from it, slice by slice, on seeded courses."""
+    from course import generate_random_buoys, generate_random_sandbars
+    from terrain import generate_heightfield_steps, generate_depth_map_steps
+
+    def slices(steps):
+        times = []
+        start = time.perf_counter()
+        while True:
+            try:
+                next(steps)
+            except StopIteration as done:
+                times.append(time.perf_counter() - start)
+                return done.value, times
+            times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+
+    depth_map = None
+    totals = {'heightfield': [], 'depth map': []}
+    longest = {'heightfield': 0.0, 'depth map': 0.0}
+    for seed in range(args.seed, args.seed + args.courses):
+        rng.seed_all(seed)
+        course_buoys_coords = generate_random_buoys(NUM_COURSE_BUOYS)
+        sandbars = generate_random_sandbars(NUM_SANDBARS, course_buoys_coords)
+        for _ in range(args.repeat):
+            heightfield, hf_times = slices(generate_heightfield_steps(sandbars, seed))
+            depth_map, dm_times = slices(generate_depth_map_steps(WORLD_BOUNDS * 2, WORLD_BOUNDS * 2, sandbars, depth_map, heightfield))
+            for name, times in (('heightfield', hf_times), ('depth map', dm_times)):
+                totals[name].append(sum(times))
+                longest[name] = max(longest[name], max(times))
+    for name, times in totals.items():
+        times = np.array(times) * 1000
+        print(f"{name}: {np.median(times):.2f} ms median, {times.min():.2f} ms best, longest slice {longest[name] * 1000:.2f} ms")
+    both = (np.array(totals['heightfield']) + np.array(totals['depth map'])) * 1000
+    print(f"together: {np.median(both):.2f} ms median, {both.min():.2f} ms best ({args.courses} courses x {args.repeat})")
+    return 0
+
+def bench_bundles(args):
+    """Generates seeded courses, then times saving and loading them as bundles and checks they load back identical."""
+    from bundle import CourseCache, load_bundle
+    from utils import run_to_completion
+    from course import prepare_course_steps
+    with tempfile.TemporaryDirectory() as root:
+        cache = CourseCache(root, args.max_mb * 2**20)
+        depth_map = None
+        for seed in range(args.seed, args.seed + args.courses):
+            start = time.perf_counter()
+            course = run_to_completion(prepare_course_steps(depth_map, seed))
+            generated = time.perf_counter() - start
+            start = time.perf_counter()
+            directory = cache.put(course)
+            saved = time.perf_counter() - start
+            heights = np.array(course.heightfield.depths)
+            codes = pygame.surfarray.array2d(course.depth_map.surface)
+            start = time.perf_counter()
+            fresh = load_bundle(directory)
+            loaded = time.perf_counter() - start
+            start = time.perf_counter()
+            course = load_bundle(directory, course.depth_map) # Into the surface it came from, as between races
+            reloaded = time.perf_counter() - start
+            same = all(np.array_equal(c.heightfield.depths, heights) and np.array_equal(pygame.surfarray.array2d(c.depth_map.surface), codes)
+                       and c.course_buoys_coords == fresh.course_buoys_coords for c in (fresh, course))
+            depth_map = course.depth_map
+            print(f"seed {seed}: generated {generated:.2f}s, saved {saved * 1000:.0f}ms, loaded {loaded * 1000:.1f}ms "
+                  f"({reloaded * 1000:.1f}ms reusing the depth map), {sum(size for name, _, size in cache.bundles() if name == str(seed)) / 2**20:.1f}MB"
+                  f"{'' if same else ', MISMATCH'}")
+            if not same:
+                return 1
+        bundles = cache.bundles()
+        print(f"{len(bundles)} bundles kept in {sum(size for _, _, size in bundles) / 2**20:.1f}MB (limit {args.max_mb}MB)")
+    return 0
+
+BENCHMARKS = {
+    'memory': bench_memory,
+    'entities': bench_entities,
+    'env': bench_env,
+    'telemetry': bench_telemetry,
+    'collision': bench_collision,
+    'navigation': bench_navigation,
+    'frames': bench_frames,
+    'snapshot': bench_snapshot,
+    'planner': bench_planner,
+    'render': bench_render,
+    'courses': bench_courses,
+    'prep': bench_prep,
+    'bundles': bench_bundles,
+    'terrain': bench_terrain,
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless performance benchmarks")
+    sub = parser.add_subparsers(dest='benchmark', required=True)
+
+    memory = sub.add_parser('memory', help=bench_memory.__doc__)
+    memory.add_argument('--races', type=int, default=5)
+    memory.add_argument('--boats', type=int, default=4)
+    memory.add_argument('--sim-time', type=float, default=60.0, help="simulated seconds per race (0 = course prep only)")
+    memory.add_argument('--seed', type=int, default=1)
+    memory.add_argument('--max-rss-mb', type=float, default=None, help="exit non-zero if RSS after any race exceeds this")
+
+    entities = sub.add_parser('entities', help=bench_entities.__doc__)
+    entities.add_argument('--fleet', type=int, default=1000)
+    entities.add_argument('--repeat', type=int, default=200)
+    entities.add_argument('--seed', type=int, default=1)
+
+    env = sub.add_parser('env', help=bench_env.__doc__)
+    env.add_argument('--envs', type=int, nargs='+', default=[1, 64, 256, 1024])
+    env.add_argument('--steps', type=int, default=100)
+    env.add_argument('--seed', type=int, default=1)
+
+    telemetry = sub.add_parser('telemetry', help=bench_telemetry.__doc__)
+    telemetry.add_argument('--boats', type=int, default=NUM_AI_BOATS)
+    telemetry.add_argument('--sim-time', type=float, default=120.0)
+    telemetry.add_argument('--rate', type=float, default=TELEMETRY_SAMPLE_RATE, help="samples per simulated second")
+    telemetry.add_argument('--repeat', type=int, default=10000)
+    telemetry.add_argument('--seed', type=int, default=1)
+
+    collision = sub.add_parser('collision', help=bench_collision.__doc__)
+    collision.add_argument('--boats', type=int, default=NUM_AI_BOATS)
+    collision.add_argument('--sim-time', type=float, default=120.0)
+    collision.add_argument('--coarse-dt', type=float, default=0.1, help="step length for the tunnelling probes")
+    collision.add_argument('--probes', type=int, default=2000)
+    collision.add_argument('--seed', type=int, default=1)
+
+    navigation = sub.add_parser('navigation', help=bench_navigation.__doc__)
+    navigation.add_argument('--courses', type=int, default=6)
+    navigation.add_argument('--boats', type=int, default=NUM_AI_BOATS)
+    navigation.add_argument('--time-limit', type=float, default=900.0, help="simulated seconds before a race is called off")
+    navigation.add_argument('--seed', type=int, default=1)
+
+    frames = sub.add_parser('frames', help=bench_frames.__doc__)
+    frames.add_argument('--boats', type=int, default=NUM_AI_BOATS)
+    frames.add_argument('--warmup', type=int, default=1200, help="frames run before measuring, so wakes reach their steady size")
+    frames.add_argument('--frames', type=int, default=600)
+    frames.add_argument('--seed', type=int, default=1)
+    frames.add_argument('--max-bytes-per-frame', type=float, default=None, help="exit non-zero if net allocation per frame exceeds this")
+    frames.add_argument('--verbose', action='store_true', help="list the lines holding the most traced memory")
+
+    snapshot = sub.add_parser('snapshot', help=bench_snapshot.__doc__)
+    snapshot.add_argument('--boats', type=int, default=NUM_AI_BOATS)
+    snapshot.add_argument('--at', type=float, default=60.0, help="simulated seconds raced before the snapshot")
+    snapshot.add_argument('--steps', type=int, default=1200, help="steps raced after it to compare")
+    snapshot.add_argument('--repeat', type=int, default=50)
+    snapshot.add_argument('--seed', type=int, default=1)
+
+    planner = sub.add_parser('planner', help=bench_planner.__doc__)
+    planner.add_argument('--courses', type=int, default=6)
+    planner.add_argument('--boats', type=int, default=NUM_AI_BOATS)
+    planner.add_argument('--budget', type=int, default=PLANNER_STEP_BUDGET, help="rollout boat updates per simulation step")
+    planner.add_argument('--time-limit', type=float, default=600.0, help="simulated seconds before a race is called off")
+    planner.add_argument('--seed', type=int, default=1)
+
+    render = sub.add_parser('render', help=bench_render.__doc__)
+    render.add_argument('--scales', type=float, nargs='+', default=[1.0, 0.75, 0.5])
+    render.add_argument('--size', default=None, help="display size as WxH, e.g. 3840x2160 (default: this display)")
+    render.add_argument('--smooth', action='store_true', default=RENDER_SMOOTH_UPSCALE, help="upscale with smoothscale instead of repeating pixels")
+    render.add_argument('--boats', type=int, default=NUM_AI_BOATS)
+    render.add_argument('--warmup', type=int, default=600, help="simulation steps before measuring")
+    render.add_argument('--frames', type=int, default=100)
+    render.add_argument('--seed', type=int, default=1)
+
+    courses = sub.add_parser('courses', help=bench_courses.__doc__)
+    courses.add_argument('--courses', type=int, default=5)
+    courses.add_argument('--candidates', type=int, default=COURSE_CANDIDATES)
+    courses.add_argument('--workers', type=int, default=COURSE_CANDIDATE_WORKERS, help="scoring processes (default: one per spare CPU, up to COURSE_CANDIDATE_MAX_WORKERS; 0 or 1 = in-process)")
+    courses.add_argument('--race', action='store_true', help="race an AI fleet on the first and chosen candidates")
+    courses.add_argument('--boats', type=int, default=NUM_AI_BOATS)
+    courses.add_argument('--time-limit', type=float, default=600.0, help="simulated seconds before a race is called off")
+    courses.add_argument('--seed', type=int, default=1)
+
+    prep = sub.add_parser('prep', help=bench_prep.__doc__)
+    prep.add_argument('--courses', type=int, default=3)
+    prep.add_argument('--workers', type=int, default=COURSE_CANDIDATE_WORKERS, help="scoring processes (default: one per spare CPU, up to COURSE_CANDIDATE_MAX_WORKERS; 0 or 1 = in-process)")
+    prep.add_argument('--budget', type=float, default=COURSE_PREP_FRAME_BUDGET * 1000, help="milliseconds per frame")
+    prep.add_argument('--seed', type=int, default=1)
+
+    bundles = sub.add_parser('bundles', help=bench_bundles.__doc__)
+    bundles.add_argument('--courses', type=int, default=3)
+    bundles.add_argument('--max-mb', type=float, default=COURSE_CACHE_MAX_MB, help="cache size limit to evict down to")
+    bundles.add_argument('--seed', type=int, default=1)
+
+    terrain = sub.add_parser('terrain', help=bench_terrain.__doc__)
+    terrain.add_argument('--courses', type=int, default=5)
+    terrain.add_argument('--repeat', type=int, default=20)
+    terrain.add_argument('--seed', type=int, default=1)
+
+    args = parser.parse_args(argv)
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    try:
+        return BENCHMARKS[args.benchmark](args)
+    finally:
+        pygame.quit()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,187 @@
+# bundle.py
+#
+# Course bundles: a seeded course saved as built, so it never has to be generated
+# again. A bundle is a directory holding course.json (wind, marks, sandbar outlines,
+# the AI's routes) and the course's two rasters as .npy files: the heightfield the
+# physics reads depth and drag from, and the depth map's 8-bit storage. Loading maps
+# the rasters straight from disk, so a known course is ready in milliseconds, and a
+# bundle directory can be copied to another machine as it is. Each bundle records a
+# hash of the settings it was generated under, and one made under others is ignored.
+#
+# CourseCache keeps bundles under one directory, one per seed, and deletes the least
+# recently raced ones once they take up more than COURSE_CACHE_MAX_MB.
+
+import os
+import json
+import shutil
+import hashlib
+
+from constants import *
+import pygame
+import numpy as np
+
+from entities import Sandbar
+from course import Course, prepare_course_steps
+from navigation import NavigationGraph
+from terrain import Heightfield, DepthMap, DEPTH_PALETTE
+
+BUNDLE_VERSION = 2
+
+def generation_hash():
+    """
+    Hash of every setting a generated course depends on. A bundle made under other
+    settings isn't the course its seed would give now, so it's treated as missing.
+    """
+    settings = (
+        WORLD_BOUNDS, NUM_COURSE_BUOYS, START_FINISH_LINE, BUOY_RADIUS, MIN_OBJ_SEPARATION,
+        NUM_SANDBARS, MIN_SANDBAR_SIZE, MAX_SANDBAR_SIZE, MIN_SANDBAR_VERTICES, MAX_SANDBAR_VERTICES, SANDBAR_RADIUS_VARIATION,
+        COURSE_CANDIDATES, COURSE_MIN_LEG, COURSE_TARGET_LAP_TIME, COURSE_TIME_FACTOR, COURSE_SCORE_WEIGHTS,
+        MAX_BOAT_SPEED, BOAT_ACCEL_FACTOR, BOAT_DRAG, BOAT_DISTANCE_MULTIPLIER, MIN_SAILING_ANGLE, MIN_WIND_SPEED, MAX_WIND_SPEED,
+        NAV_ENABLED, NAV_CORNER_CLEARANCE, NAV_PATH_CLEARANCE,
+        HEIGHTFIELD_CELL, DEPTH_MAP_SCALE, TERRAIN_BASE_DEPTH, TERRAIN_EDGE_DEPTH, TERRAIN_NOISE_DEPTH, TERRAIN_NOISE_CELLS,
+        TERRAIN_SHOAL_SLOPE, TERRAIN_SHOAL_VARIATION, TERRAIN_SHOAL_REACH, TERRAIN_OUTLINE_BINS, TERRAIN_DEPTH_RANGE,
+        [tuple(color) for color in DEPTH_PALETTE],
+    )
+    return hashlib.sha1(repr(settings).encode()).hexdigest()
+
+def save_bundle(directory, course):
+    """
+    Writes course to directory as a bundle. It's written to a temporary directory next
+    to it first and renamed into place, so a bundle on disk is always complete.
+    """
+    temp = f"{directory}.tmp{os.getpid()}"
+    shutil.rmtree(temp, ignore_errors=True)
+    os.makedirs(temp)
+    navigation = None
+    nav = course.navigation
+    if nav is not None:
+        navigation = {'nodes': [list(node) for node in nav.nodes], 'marks': list(nav.marks),
+                      'paths': [[a, b, [list(p) for p in path]] for (a, b), path in nav.paths.items()]}
+    heightfield = course.heightfield
+    depth_map = course.depth_map
+    meta = {
+        'version': BUNDLE_VERSION,
+        'generation': generation_hash(),
+        'seed': course.seed,
+        'wind_direction': course.wind_direction,
+        'course_buoys_coords': [list(c) for c in course.course_buoys_coords],
+        'sandbars': [list(sandbar.vertices) for sandbar in course.sandbars],
+        'navigation': navigation,
+        'heightfield': {'cell': heightfield.cell, 'seed': heightfield.seed},
+        'depth_map': {'width': depth_map.width, 'height': depth_map.height, 'scale': depth_map.scale},
+    }
+    np.save(os.path.join(temp, "heights.npy"), heightfield.depths)
+    pixels = pygame.surfarray.pixels2d(depth_map.surface)
+    np.save(os.path.join(temp, "depth.npy"), pixels)
+    del pixels # Unlocks the surface
+    with open(os.path.join(temp, "course.json"), 'w') as f:
+        json.dump(meta, f)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(temp, directory)
+    return directory
+
+def load_bundle(directory, depth_map=None):
+    """
+    Reads a Course back from a bundle. The heightfield stays memory-mapped from its file;
+    the depth map is copied into depth_map's surface when it's the right size (pass the
+    previous course's to reuse its storage), otherwise into a new DepthMap.
+    """
+    with open(os.path.join(directory, "course.json")) as f:
+        meta = json.load(f)
+    if meta.get('version') != BUNDLE_VERSION:
+        raise ValueError(f"Unsupported course bundle version {meta.get('version')!r}")
+    if meta.get('generation') != generation_hash():
+        raise ValueError("Course bundle was generated under different settings")
+    sandbars = [Sandbar.from_polygon(list(zip(v[0::2], v[1::2]))) for v in meta['sandbars']]
+    navigation = None
+    nav = meta['navigation']
+    if nav is not None:
+        nodes = [tuple(node) for node in nav['nodes']]
+        navigation = NavigationGraph(nodes, [[] for _ in nodes], nav['marks'])
+        navigation.paths = {(a, b): [tuple(p) for p in path] for a, b, path in nav['paths']}
+    hf = meta['heightfield']
+    heightfield = Heightfield(np.load(os.path.join(directory, "heights.npy"), mmap_mode='r'), hf['cell'], hf['seed'])
+    dm = meta['depth_map']
+    if depth_map is None or depth_map.get_size() != (dm['width'], dm['height']) or depth_map.scale != dm['scale']:
+        depth_map = DepthMap(dm['width'], dm['height'], dm['scale'])
+    codes = np.load(os.path.join(directory, "depth.npy"), mmap_mode='r')
+    pixels = pygame.surfarray.pixels2d(depth_map.surface)
+    if pixels.shape != codes.shape:
+        raise ValueError(f"Course bundle depth map is {codes.shape}, expected {pixels.shape}")
+    pixels[:] = codes
+    del pixels, codes
+    course_buoys_coords = [tuple(c) for c in meta['course_buoys_coords']]
+    return Course(meta['wind_direction'], course_buoys_coords, sandbars, depth_map, navigation, heightfield, meta['seed'])
+
+def bundle_size(directory):
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+class CourseCache:
+    """
+    Course bundles kept on disk by seed. get() touches a bundle it loads, so eviction
+    removes the ones raced longest ago first.
+    """
+    def __init__(self, root=COURSE_CACHE_DIR, max_bytes=COURSE_CACHE_MAX_MB * 2**20):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def path(self, seed):
+        return os.path.join(self.root, str(seed))
+
+    def __contains__(self, seed):
+        return os.path.isfile(os.path.join(self.path(seed), "course.json"))
+
+    def get(self, seed, depth_map=None):
+        """The cached Course for seed, or None if there isn't a usable one (unreadable, or from another version or settings)."""
+        if seed not in self:
+            return None
+        directory = self.path(seed)
+        try:
+            course = load_bundle(directory, depth_map)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring course bundle {directory}: {e}")
+            return None
+        os.utime(os.path.join(directory, "course.json"))
+        return course
+
+    def put(self, course):
+        """Stores a seeded course, then evicts old bundles (never this one) to get back under max_bytes."""
+        os.makedirs(self.root, exist_ok=True)
+        directory = save_bundle(self.path(course.seed), course)
+        self.evict(keep=course.seed)
+        return directory
+
+    def bundles(self):
+        """(seed, last used, bytes) for every bundle, least recently used first."""
+        if not os.path.isdir(self.root):
+            return []
+        found = []
+        for entry in os.scandir(self.root):
+            meta = os.path.join(entry.path, "course.json")
+            if entry.is_dir() and os.path.isfile(meta):
+                found.append((entry.name, os.path.getmtime(meta), bundle_size(entry.path)))
+        found.sort(key=lambda bundle: bundle[1])
+        return found
+
+    def evict(self, keep=None):
+        """Deletes least recently used bundles until the cache fits in max_bytes. Returns the seeds deleted."""
+        bundles = self.bundles()
+        total = sum(size for _, _, size in bundles)
+        evicted = []
+        for seed, _, size in bundles:
+            if total <= self.max_bytes:
+                break
+            if seed == str(keep):
+                continue
+            shutil.rmtree(os.path.join(self.root, seed), ignore_errors=True)
+            total -= size
+            evicted.append(seed)
+        return evicted
+
+    def prepare_steps(self, seed, depth_map=None, pool=None):
+        """Generator for CoursePreparer: the cached course if there is one, otherwise generates it (on pool) and caches it."""
+        course = self.get(seed, depth_map)
+        if course is None:
+            course = yield from prepare_course_steps(depth_map, seed, pool)
+            self.put(course)
+        return course
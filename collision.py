@@ -0,0 +1,126 @@
+# collision.py
+#
+# Swept (continuous) circle tests. Each takes a circle moving from (x0, y0) by
+# (dx, dy) over one step and returns the time of impact as a fraction of the step:
+# 0.0 if it starts out touching, None if it doesn't touch anything during the step.
+
+import math
+
+from constants import *
+
+def sweep_circle_circle(x0, y0, dx, dy, cx, cy, radius):
+    """Time of impact of a moving point against a static circle (combine both radii into radius)."""
+    fx = x0 - cx
+    fy = y0 - cy
+    c = fx * fx + fy * fy - radius * radius
+    if c <= 0:
+        return 0.0
+    a = dx * dx + dy * dy
+    b = fx * dx + fy * dy
+    if a == 0 or b >= 0: # Not moving, or moving away
+        return None
+    disc = b * b - a * c
+    if disc < 0:
+        return None
+    t = (-b - math.sqrt(disc)) / a
+    return t if t <= 1.0 else None
+
+def sweep_circles(ax, ay, adx, ady, bx, by, bdx, bdy, radius):
+    """Time of impact of two moving circles whose radii sum to radius, solved in a's frame."""
+    return sweep_circle_circle(bx, by, bdx - adx, bdy - ady, ax, ay, radius)
+
+def point_in_polygon(x, y, vertices):
+    """Even-odd test against a flat x0, y0, x1, y1, ... outline."""
+    inside = False
+    n = len(vertices)
+    px, py = vertices[n - 2], vertices[n - 1]
+    for i in range(0, n, 2):
+        qx, qy = vertices[i], vertices[i + 1]
+        if (qy > y) != (py > y) and x < (px - qx) * (y - qy) / (py - qy) + qx:
+            inside = not inside
+        px, py = qx, qy
+    return inside
+
+def sweep_circle_polygon(x0, y0, dx, dy, radius, vertices):
+    """
+    Time of impact of a moving circle against a polygon given as a flat outline.
+    The polygon inflated by radius is a set of capsules, one per edge; the first
+    one the centre's path enters is the hit.
+    """
+    if point_in_polygon(x0, y0, vertices):
+        return 0.0
+    n = len(vertices)
+    r_sq = radius * radius
+    best = None
+    ax, ay = vertices[n - 2], vertices[n - 1]
+    for i in range(0, n, 2):
+        bx, by = vertices[i], vertices[i + 1]
+        ex = bx - ax
+        ey = by - ay
+        length_sq = ex * ex + ey * ey
+        if length_sq > 0:
+            # Already within radius of this edge?
+            u = ((x0 - ax) * ex + (y0 - ay) * ey) / length_sq
+            u = 0.0 if u < 0 else 1.0 if u > 1 else u
+            if (x0 - ax - u * ex)**2 + (y0 - ay - u * ey)**2 <= r_sq:
+                return 0.0
+            # Flat side of the capsule, offset toward the start point
+            length = math.sqrt(length_sq)
+            nx = -ey / length
+            ny = ex / length
+            side = (x0 - ax) * nx + (y0 - ay) * ny
+            if side < 0:
+                nx, ny, side = -nx, -ny, -side
+            closing = dx * nx + dy * ny
+            if closing < 0 and side >= radius:
+                t = (side - radius) / -closing
+                if t <= 1.0 and (best is None or t < best):
+                    u = ((x0 + t * dx - ax) * ex + (y0 + t * dy - ay) * ey) / length_sq
+                    if 0 <= u <= 1:
+                        best = t
+        # Rounded end of the capsule
+        t = sweep_circle_circle(x0, y0, dx, dy, bx, by, radius)
+        if t is not None and (best is None or t < best):
+            best = t
+        ax, ay = bx, by
+    return best
+
+def sweep_boat_sandbars(x0, y0, x1, y1, radius, sandbar_index):
+    """Earliest time of impact of a boat moving (x0, y0) -> (x1, y1) with any sandbar, or None."""
+    dx = x1 - x0
+    dy = y1 - y0
+    best = None
+    candidates = sandbar_index.query_rect(min(x0, x1) - radius, min(y0, y1) - radius,
+                                          max(x0, x1) + radius, max(y0, y1) + radius)
+    for sandbar in candidates:
+        t = sweep_circle_polygon(x0, y0, dx, dy, radius, sandbar.vertices)
+        if t is not None and (best is None or t < best):
+            best = t
+            if t == 0.0:
+                break
+    return best
+
+def slide_off_circle(x0, y0, dx, dy, cx, cy, radius, t):
+    """
+    Where a circle that hits a static circle at time t ends the step: it stops at the
+    contact point and the rest of its motion slides along the tangent. Returns (x, y).
+    """
+    px = x0 + dx * t
+    py = y0 + dy * t
+    nx = px - cx
+    ny = py - cy
+    dist = math.hypot(nx, ny)
+    if dist == 0:
+        nx, ny, dist = 1.0, 0.0, 1.0
+    nx /= dist
+    ny /= dist
+    # Started overlapping: put it back on the surface first
+    px = cx + nx * radius
+    py = cy + ny * radius
+    rx = dx * (1.0 - t)
+    ry = dy * (1.0 - t)
+    into = rx * nx + ry * ny
+    if into < 0:
+        rx -= into * nx
+        ry -= into * ny
+    return px + rx, py + ry
@@ -29,6 +29,7 @@ MAP_BORDER_COLOR = (200, 200, 200)
 MAP_BOAT_COLOR = (233, 196, 106)
 BUTTON_COLOR = pygame.Color("#264653")
 BUTTON_HOVER_COLOR = pygame.Color("#2A9D8F")
+BUTTON_DISABLED_COLOR = pygame.Color("#3D4F58")
 BUTTON_TEXT_COLOR = WHITE
 BUOY_COLOR = pygame.Color("#E76F51")
 START_FINISH_BUOY_COLOR = pygame.Color("#F4A261")
@@ -50,6 +51,7 @@ LIGHT_BLUE = (173, 216, 230) # A lighter, more visible blue for waves
 BOAT_TURN_SPEED = 2.5
 BOAT_ACCEL_FACTOR = 0.08
 BOAT_DRAG = 0.985
+BOAT_DISTANCE_MULTIPLIER = 40
 BOAT_COLLISION_SPEED_REDUCTION = 0.95
 SANDBAR_DRAG_MULTIPLIER = 25.0
 NO_POWER_DECEL = 0.75
@@ -62,6 +64,10 @@ SAIL_MAX_CURVE = 8
 MIN_SAILING_ANGLE = 45
 OPTIMAL_INDICATOR_LENGTH = 25
 NUM_AI_BOATS = 4
+AI_LOOKAHEAD_DISTANCE = 150
+AI_LOOKAHEAD_SPEED_FACTOR = 20
+AI_AVOID_ANGLE_STEP = 15
+AI_AVOID_MAX_STEPS = 4
 AI_BOAT_COLORS = [
     pygame.Color("#E63946"),
     pygame.Color("#F4A261"),
@@ -90,6 +96,46 @@ MIN_SANDBAR_VERTICES = 7
 MAX_SANDBAR_VERTICES = 12
 SANDBAR_RADIUS_VARIATION = 0.4
 MIN_OBJ_SEPARATION = 150
+DEPTH_MAP_SCALE = 2 # Depth map stored at 1/scale resolution (8-bit); 1 = full resolution
+HEIGHTFIELD_CELL = 8 # World units between heightfield samples; a multiple of DEPTH_MAP_SCALE
+TERRAIN_BASE_DEPTH = 4.5 # Metres of water in the middle of the course
+TERRAIN_EDGE_DEPTH = 7.5 # Extra metres towards the edge of the world
+TERRAIN_NOISE_DEPTH = 1.5 # Metres either way the smooth noise moves the bottom
+TERRAIN_NOISE_CELLS = (5, 13) # Noise lattice cells across the world, one octave each, coarse first
+TERRAIN_SHOAL_SLOPE = 1 / 60 # Metres deeper per world unit away from a sandbar
+TERRAIN_SHOAL_VARIATION = 0.5 # How much the noise steepens or flattens each shoal
+TERRAIN_SHOAL_REACH = 280 # World units around a sandbar its shoal is worked out for
+TERRAIN_SHOAL_CHUNK = 5 # Sandbars whose shoals are worked out and laid on the bottom in one slice
+TERRAIN_OUTLINE_BINS = 1024 # Directions each sandbar's outline radius is tabulated at for working out its shoal
+TERRAIN_DEPTH_RANGE = (-2.0, 14.0) # Depths the 8-bit depth map can hold; the palette bands them
+TERRAIN_DEPTH_BANDS = (9.0, 6.0, 3.0, 1.5, 0.0) # Depths where the deep, mid, light, shallow and shoal colours give way
+SHALLOW_DRAG_DEPTH = 1.5 # Water shallower than this drags on a boat, more the shallower it gets
+SHALLOW_DRAG_MULTIPLIER = 4.0 # Drag multiplier at zero depth, short of running aground
+COURSE_PREP_FRAME_BUDGET = 0.004 # Seconds per frame spent preparing the next course in the background
+
+SPATIAL_NODE_CAPACITY = 8
+SPATIAL_MAX_DEPTH = 8
+
+# --- AI Navigation ---
+NAV_ENABLED = True # AI boats follow precomputed waypoints around sandbars instead of steering straight at marks
+NAV_CORNER_CLEARANCE = 45 # How far outside a sandbar's corners the waypoints sit
+NAV_PATH_CLEARANCE = 25 # Closest a straight leg between waypoints may pass a sandbar
+NAV_WAYPOINT_RADIUS = 60 # Distance at which an AI boat moves on to its next waypoint
+NAV_NODES_PER_SLICE = 2 # Graph nodes linked per slice when building in the background
+
+# --- AI Planner ---
+AI_PLANNER_ENABLED = False # AI boats pick headings and tack points by sailing a few seconds ahead in rollouts
+PLANNER_STEP_BUDGET = 60 # Rollout boat updates per simulation step, shared by the whole fleet
+PLANNER_HORIZON = 6.0 # Simulated seconds each rollout looks ahead
+PLANNER_ROLLOUT_DT = 0.1 # Step length inside rollouts; coarse, since only the outcome matters
+PLANNER_SAMPLES = 2 # Rollouts per candidate, each under a different wind shift
+PLANNER_WIND_NOISE = 5 # Degrees either way the sampled wind shifts spread over
+PLANNER_REPLAN_INTERVAL = 2.0 # Seconds a plan is followed before the boat queues for a fresh one
+PLANNER_TARGET_TOLERANCE = 60 # A plan is dropped once the boat's target moves further than this from the planned one
+PLANNER_HEADING_OFFSETS = (-20, -10, 0, 10, 20) # Degrees off the direct heading tried when the target can be laid
+PLANNER_TACK_MARGIN = 20 # Tacks are tried whenever the target is within this many degrees of the no-go zone
+PLANNER_TACK_ANGLES = (8, 16) # Degrees beyond MIN_SAILING_ANGLE tried on each tack
+PLANNER_TACK_TIMES = (2.0,) # Seconds into a rollout to tack, besides holding the first tack throughout
 
 # --- Wake Properties ---
 MAX_WAKE_PARTICLES = 150
@@ -98,7 +144,125 @@ WAKE_LIFETIME = 2.0
 WAKE_START_SIZE = 5
 WAKE_END_SIZE = 1
 
+# --- Rendering ---
+BOAT_DRAW_RADIUS = 60 # Farthest any part of a drawn boat (hull, sail, trim indicator) reaches from its centre
+RENDER_CULL_MARGIN = 32 # Extra world units around a viewport that still count as visible
+RENDER_SCALE = 1.0 # World pass resolution relative to the display (0.5 draws a quarter of the pixels); the HUD and minimap stay native
+RENDER_SMOOTH_UPSCALE = False # True upscales the world pass with smoothscale: softer, but at 4K it costs more than a 0.5 scale saves
+
+# --- Simulation Timing ---
+SIM_TIMESTEP = 1.0 / 120.0 # Fixed physics step; results don't depend on the frame rate
+SIM_MAX_STEPS_PER_FRAME = 12 # Backlog beyond this is dropped (0.1s, the old dt cap)
+SIM_ADAPTIVE_SUBSTEPS = True
+SIM_MAX_STEP_DISTANCE = 9 # Max world units a boat may travel per physics substep
+SIM_SWEPT_COLLISION = True # Swept tests against sandbars, buoys and boats: nothing tunnels at any step size
+SIM_SWEPT_MAX_STEP_DISTANCE = 30 # Max travel per substep when collisions are swept
+FRAME_RATE_CAP = 60 # 0 = uncapped rendering
+
+# --- Determinism ---
+DETERMINISTIC_SEED = None # Set to an int to seed every random stream (rng.py) and step one fixed frame per frame
+STATE_HASH_INTERVAL = 1 # Ticks between recorded fleet states in statehash.py golden runs
+STATE_HASH_TOLERANCE = 1e-6 # Default largest per-field difference `statehash.py check --tolerance` accepts
+
+# --- Soak Testing ---
+SOAK_SERIES = 3 # Series soak.py plays back to back (0 = until a threshold fails or it's interrupted)
+SOAK_RACES = 3 # Races per soak series
+SOAK_LAPS = 1
+SOAK_RACE_TIME = 60.0 # Simulated seconds of each race, countdown included, before the soak forfeits it
+SOAK_WARMUP_RACES = 3 # Races before the baseline is taken, so caches and reused buffers have reached their working size
+SOAK_MAX_RSS_GROWTH_MB = 64.0 # Fail when resident memory grows this far past the baseline
+SOAK_MAX_SURFACE_GROWTH = 8 # Fail when this many more pygame Surfaces are alive than at the baseline
+SOAK_MAX_OBJECT_GROWTH = 20000 # Fail when this many more gc-tracked objects are alive than at the baseline
+SOAK_MAX_P99_GROWTH = 1.5 # Fail when a race's 99th-percentile frame time exceeds the baseline's by this factor
+
+# --- Snapshots ---
+SNAPSHOT_FILE = "race_snapshot.bin" # F5 saves the race in progress here, F9 loads it back
+SNAPSHOT_COMPRESSION = 1 # zlib level; random-stream state barely compresses, so higher levels only cost time
+
+# --- Quality Governor ---
+QUALITY_GOVERNOR_ENABLED = True
+QUALITY_FRAME_BUDGET_MS = 1000.0 / (FRAME_RATE_CAP or 60) # Work time allowed per frame
+QUALITY_WINDOW_FRAMES = 30 # Frames measured per decision
+QUALITY_DOWNGRADE_RATIO = 1.0 # Drop a level when the median frame exceeds budget * this
+QUALITY_UPGRADE_RATIO = 0.6 # Headroom needed (median below budget * this) to climb back
+QUALITY_UPGRADE_WINDOWS = 4 # Consecutive headroom windows before climbing a level
+
+# --- Shared-Memory Spectators ---
+SHARED_STATE_ENABLED = False # Publish race state so renderers in other processes can attach
+SPECTATOR_RENDERERS = 0 # Spectator windows to launch alongside the game (implies publishing)
+SHARED_STATE_NAME = "dinghy_race_state"
+SHARED_STATE_READ_RETRIES = 8
+MAX_SHARED_BOATS = 64
+MAX_SHARED_BUOYS = 16
+MAX_SHARED_SANDBARS = 256
+MAX_SHARED_SANDBAR_VERTICES = MAX_SHARED_SANDBARS * 12
+
+# --- Video Export ---
+EXPORT_WIDTH = 1280
+EXPORT_HEIGHT = 720
+EXPORT_FPS = 30
+EXPORT_MAX_RACE_TIME = 900.0 # Simulated seconds before an unfinished race is cut off
+EXPORT_FINISH_HOLD = 3.0 # Seconds kept rolling after the last boat finishes
+EXPORT_QUEUE_PER_WORKER = 4 # Frames allowed in flight per encoder process
+EXPORT_PNG_COMPRESSION = 1 # zlib level for exported PNGs; higher is smaller but slower
+
+# --- Training Environment ---
+ENV_ACTION_REPEAT = 12 # Fixed sim steps each action is held for (0.1s)
+ENV_MAX_EPISODE_TIME = 300.0 # Simulated seconds before an episode is truncated
+ENV_COURSE_POOL_SIZE = 64 # Courses generated up front and reused by vectorized envs
+ENV_SANDBAR_RAYS = 8 # Look-out directions around the bow in each observation
+ENV_RAY_LENGTH = 400
+ENV_PROGRESS_SCALE = 100.0 # World units of progress toward the next mark worth a reward of 1
+ENV_REWARD_START = 1.0
+ENV_REWARD_BUOY = 1.0
+ENV_REWARD_FINISH = 10.0
+ENV_REWARD_TIME_PENALTY = 0.1 # Per simulated second
+ENV_REWARD_OUT_OF_BOUNDS = 5.0
+
+# --- Telemetry ---
+TELEMETRY_ENABLED = True # Record per-boat telemetry during races
+TELEMETRY_SAMPLE_RATE = 10.0 # Samples per simulated second
+TELEMETRY_CAPACITY = 9000 # Samples kept per boat (15 minutes at 10 Hz); older ones are overwritten
+TELEMETRY_EXPORT_DIR = None # Directory each finished race's columns are written to (None = don't export)
+TELEMETRY_OVERLAY = False # Live chart in each player's view; toggle in game with T
+TELEMETRY_CHART_SAMPLES = 300 # Samples shown by the live chart (30s at 10 Hz)
+TELEMETRY_CHART_WIDTH = 300
+TELEMETRY_CHART_HEIGHT = 90
+HUD_LINES_HEIGHT = 95 # Bottom strip of each view taken by the HUD text; the chart sits above it
+TELEMETRY_SPEED_COLOR = (0, 200, 255)
+TELEMETRY_EFFECTIVENESS_COLOR = (233, 196, 106)
+
+# --- AI Tuning ---
+AI_PRESETS_FILE = "ai_presets.json" # Written by tuning.py; the game falls back to the hand-picked ranges without it
+AI_DIFFICULTY = "medium" # Tier from AI_DIFFICULTY_TIERS used when presets exist (None = hand-picked ranges)
+AI_DIFFICULTY_TIERS = {"hard": 1.0, "medium": 1.1, "easy": 1.25} # Target race time relative to the tuned preset
+TUNING_CACHE_FILE = "tuning_cache.json"
+TUNING_MAX_RACE_TIME = 600.0 # Simulated seconds before a candidate's race is cut off
+TUNING_DNF_PENALTY = 60.0 # Seconds added per mark a cut-off boat still had to round
+TUNING_POPULATION = 16
+TUNING_GENERATIONS = 12
+TUNING_SEEDS = 6 # Seeded courses every candidate is scored on
+TUNING_ELITE = 2 # Best candidates carried unchanged into the next generation
+TUNING_MUTATION = 0.15 # Mutation step as a fraction of each parameter's range
+TUNING_CALIBRATION_STEPS = 6 # Bisection steps when fitting a difficulty tier
+
+# --- Course Selection ---
+COURSE_CANDIDATES = 1000 # Candidate courses generated and scored for each race; the best is raced (1 = first one generated)
+COURSE_CANDIDATE_BATCH = 50 # Candidates per job handed to a worker (in-process, each is scored in a slice of its own)
+COURSE_CANDIDATE_WORKERS = None # Worker processes scoring candidates (None = one per spare CPU, up to the cap below); 0 or 1 scores them in-process
+COURSE_CANDIDATE_MAX_WORKERS = 4 # Cap on the default worker count, which the pool keeps for the whole session
+COURSE_MIN_LEG = 1200 # World units; legs shorter than this are penalised
+COURSE_TARGET_LAP_TIME = 90.0 # Estimated seconds per lap a course should take
+COURSE_TIME_FACTOR = 3.3 # Race seconds per second of ideal sailing (fitted to AI races with benchmarks.py courses --race)
+COURSE_SCORE_WEIGHTS = (1.0, 2.0, 0.5, 1.0) # Penalty weights: short legs, dead-upwind legs, sandbars on the legs, lap time off target
+
+# --- Course Bundles ---
+COURSE_SEEDS = None # Course seeds raced in turn, e.g. favourites or a tournament's (None = a new random course every race)
+COURSE_CACHE_DIR = "course_cache" # Seeded courses are kept here as bundles and loaded instead of regenerated (None = don't cache)
+COURSE_CACHE_MAX_MB = 256 # Least recently raced bundles are deleted once the cache grows past this
+
 # --- Course & Race Properties ---
+PRE_RACE_COUNTDOWN = 10.0
 DEFAULT_RACE_LAPS = 3
 NUM_COURSE_BUOYS = 3
 START_FINISH_LINE = [(-100, -150), (-100, 150)]
@@ -108,6 +272,8 @@ BUOY_RADIUS = 15
 BUOY_ROUNDING_RADIUS = 40
 LINE_CROSSING_DEBOUNCE = 1.0
 POINTS_AWARDED = [5, 4, 3, 2, 1, 0]
+RACE_COMPLETION_FRAME_BUDGET = 0.008 # Seconds per results-screen frame spent racing the AI boats still out to the finish
+RACE_COMPLETION_TIME_LIMIT = 180.0 # Simulated seconds after the players are done before boats still racing are retired
 
 # --- UI Properties ---
 MAP_WIDTH = 150
@@ -136,6 +302,15 @@ MAP_BUOY_MARKER_RADIUS = 4
 MAP_BOAT_MARKER_SIZE = 5
 MAP_AI_BOAT_COLOR = (210, 210, 210)
 
+# Setup Screen Buttons
+START_SERIES_BUTTON_RECT = pygame.Rect(CENTER_X - SETUP_BUTTON_WIDTH // 2, SCREEN_HEIGHT * 0.4, SETUP_BUTTON_WIDTH, SETUP_BUTTON_HEIGHT)
+ONE_PLAYER_BUTTON_RECT = pygame.Rect(CENTER_X - 120, SCREEN_HEIGHT * 0.2, 100, 40)
+TWO_PLAYER_BUTTON_RECT = pygame.Rect(CENTER_X + 20, SCREEN_HEIGHT * 0.2, 100, 40)
+LAPS_MINUS_BUTTON_RECT = pygame.Rect(CENTER_X - 100, SCREEN_HEIGHT * 0.3, LAP_BUTTON_SIZE, LAP_BUTTON_SIZE)
+LAPS_PLUS_BUTTON_RECT = pygame.Rect(CENTER_X - 40, SCREEN_HEIGHT * 0.3, LAP_BUTTON_SIZE, LAP_BUTTON_SIZE)
+RACES_MINUS_BUTTON_RECT = pygame.Rect(CENTER_X + 40, SCREEN_HEIGHT * 0.3, LAP_BUTTON_SIZE, LAP_BUTTON_SIZE)
+RACES_PLUS_BUTTON_RECT = pygame.Rect(CENTER_X + 100, SCREEN_HEIGHT * 0.3, LAP_BUTTON_SIZE, LAP_BUTTON_SIZE)
+
 # Pause Menu Buttons
 RESUME_BUTTON_RECT = pygame.Rect(CENTER_X - PAUSE_BUTTON_WIDTH // 2, CENTER_Y - 90, PAUSE_BUTTON_WIDTH, PAUSE_BUTTON_HEIGHT)
 RESTART_BUTTON_RECT = pygame.Rect(CENTER_X - PAUSE_BUTTON_WIDTH // 2, CENTER_Y - 30, PAUSE_BUTTON_WIDTH, PAUSE_BUTTON_HEIGHT)
@@ -1,14 +1,24 @@
 # course.py
 
-import random
+import os
 import math
+import random
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 from constants import *
 from utils import *
+import rng
 from entities import Sandbar, Buoy
+from spatial import SpatialIndex, build_sandbar_index
+from terrain import generate_heightfield_steps, generate_depth_map_steps
+from navigation import build_navigation_steps
 
-def is_too_close(new_pos, existing_objects, min_dist_sq):
+def is_too_close(new_pos, existing_objects, min_dist_sq, index=None):
     """Checks if new_pos is too close to any existing object position."""
+    if index is not None:
+        existing_objects = index.query_circle(new_pos[0], new_pos[1], math.sqrt(min_dist_sq))
     for obj in existing_objects:
         obj_pos = (getattr(obj, 'world_x', 0), getattr(obj, 'world_y', 0))
         if distance_sq(new_pos, obj_pos) < min_dist_sq:
@@ -17,15 +27,19 @@ def is_too_close(new_pos, existing_objects, min_dist_sq):
 
 def generate_random_sandbars(count, course_buoys_coords):
     """Generates a list of Sandbar objects with random positions."""
+    return run_to_completion(generate_random_sandbars_steps(count, course_buoys_coords))
+
+def generate_random_sandbars_steps(count, course_buoys_coords):
+    """Generator form of generate_random_sandbars: yields after each placed sandbar, returns the list."""
     sandbars = []
-    min_dist_sq = MIN_OBJ_SEPARATION**2
+    placed_index = SpatialIndex()
     attempts = 0
     max_attempts = count * 20
     while len(sandbars) < count and attempts < max_attempts:
         attempts += 1
-        size = random.randint(MIN_SANDBAR_SIZE, MAX_SANDBAR_SIZE)
-        wx = random.uniform(-WORLD_BOUNDS * 0.85, WORLD_BOUNDS * 0.85)
-        wy = random.uniform(-WORLD_BOUNDS * 0.85, WORLD_BOUNDS * 0.85)
+        size = rng.course.randint(MIN_SANDBAR_SIZE, MAX_SANDBAR_SIZE)
+        wx = rng.course.uniform(-WORLD_BOUNDS * 0.85, WORLD_BOUNDS * 0.85)
+        wy = rng.course.uniform(-WORLD_BOUNDS * 0.85, WORLD_BOUNDS * 0.85)
         pos = (wx, wy)
         line_x = START_FINISH_LINE[0][0]
         line_y1 = START_FINISH_LINE[0][1]
@@ -39,9 +53,12 @@ def generate_random_sandbars(count, course_buoys_coords):
                 break
         if too_close_to_buoy:
             continue
-        if is_too_close(pos, sandbars, (size/2 + MIN_SANDBAR_SIZE/2)**2):
+        if is_too_close(pos, sandbars, (size/2 + MIN_SANDBAR_SIZE/2)**2, index=placed_index):
             continue
-        sandbars.append(Sandbar(wx, wy, size))
+        sandbar = Sandbar(wx, wy, size)
+        sandbars.append(sandbar)
+        placed_index.insert(sandbar, (sandbar.rect.left, sandbar.rect.top, sandbar.rect.right, sandbar.rect.bottom))
+        yield
     if attempts >= max_attempts:
         print(f"Warning: Could only generate {len(sandbars)}/{count} sandbars.")
     return sandbars
@@ -55,15 +72,15 @@ def generate_random_buoys(count):
     areas = [ (0.25, 0.75, -0.75, -0.25), (-0.75, -0.25, -0.75, -0.25), (-0.5, 0.5, 0.25, 0.75) ]
     if count > 3:
         areas.extend([ (-0.75, -0.25, 0.25, 0.75), (0.25, 0.75, 0.25, 0.75) ])
-    random.shuffle(areas)
+    rng.course.shuffle(areas)
     area_index = 0
     while len(buoy_coords) < count and attempts < max_attempts:
         attempts += 1
         if area_index >= len(areas):
             break
         min_x_factor, max_x_factor, min_y_factor, max_y_factor = areas[area_index]
-        wx = random.uniform(min_x_factor * WORLD_BOUNDS, max_x_factor * WORLD_BOUNDS)
-        wy = random.uniform(min_y_factor * WORLD_BOUNDS, max_y_factor * WORLD_BOUNDS)
+        wx = rng.course.uniform(min_x_factor * WORLD_BOUNDS, max_x_factor * WORLD_BOUNDS)
+        wy = rng.course.uniform(min_y_factor * WORLD_BOUNDS, max_y_factor * WORLD_BOUNDS)
         pos = (wx, wy)
         line_x = START_FINISH_LINE[0][0]
         line_y1 = START_FINISH_LINE[0][1]
@@ -78,8 +95,230 @@ def generate_random_buoys(count):
     if attempts >= max_attempts:
         print(f"Warning: Could only generate {len(buoy_coords)}/{count} buoys.")
     while len(buoy_coords) < min(count, 1):
-         wx = random.uniform(-WORLD_BOUNDS * 0.7, WORLD_BOUNDS * 0.7)
-         wy = random.uniform(-WORLD_BOUNDS * 0.7, WORLD_BOUNDS * 0.7)
+         wx = rng.course.uniform(-WORLD_BOUNDS * 0.7, WORLD_BOUNDS * 0.7)
+         wy = rng.course.uniform(-WORLD_BOUNDS * 0.7, WORLD_BOUNDS * 0.7)
          buoy_coords.append((wx, wy))
          print("Warning: Adding fallback buoy.")
-    return buoy_coords
\ No newline at end of file
+    return buoy_coords
+
+def create_course_buoys(course_buoys_coords):
+    """Builds the drawable buoy list: the two start/finish gate buoys followed by the course marks."""
+    buoys = [Buoy(START_FINISH_LINE[0][0], START_FINISH_LINE[0][1], -1, is_gate=True),
+             Buoy(START_FINISH_LINE[1][0], START_FINISH_LINE[1][1], -1, is_gate=True)]
+    for i, (bx, by) in enumerate(course_buoys_coords):
+        buoys.append(Buoy(bx, by, i))
+    return buoys
+
+def course_legs(course_buoys_coords, start_finish_line=START_FINISH_LINE):
+    """One lap's legs as (from, to) point pairs: off the line, round each mark in turn, and back."""
+    (ax, ay), (bx, by) = start_finish_line
+    line = ((ax + bx) / 2, (ay + by) / 2)
+    points = [line] + [tuple(c) for c in course_buoys_coords] + [line]
+    return list(zip(points, points[1:]))
+
+def sailing_speed(wind_angle, wind_speed=(MIN_WIND_SPEED + MAX_WIND_SPEED) / 2):
+    """Steady speed in world units per second, perfectly trimmed, wind_angle degrees off the wind (0 = head to wind)."""
+    if wind_angle <= MIN_SAILING_ANGLE:
+        return 0.0
+    effectiveness = max(0.1, math.cos(deg_to_rad(wind_angle - 90)))
+    speed = (wind_speed * BOAT_ACCEL_FACTOR * effectiveness / (1.0 - BOAT_DRAG)) ** (1 / 1.8) # Where drag balances drive
+    return min(speed, MAX_BOAT_SPEED) * BOAT_DISTANCE_MULTIPLIER
+
+def leg_speed(heading, wind_direction):
+    """Speed made good along a leg: sailed straight, or tacked at the best angle when it's too close to the wind."""
+    angle = abs(angle_difference(heading, wind_direction))
+    if angle > MIN_SAILING_ANGLE:
+        return sailing_speed(angle)
+    return max(sailing_speed(tack) * math.cos(deg_to_rad(tack - angle)) for tack in range(MIN_SAILING_ANGLE + 1, 91))
+
+def estimate_lap_time(wind_direction, course_buoys_coords):
+    """Seconds a well-sailed boat might take over one lap, from the ideal speed on each leg and COURSE_TIME_FACTOR."""
+    lap_time = 0.0
+    for (x1, y1), (x2, y2) in course_legs(course_buoys_coords):
+        heading = rad_to_deg(math.atan2(y2 - y1, x2 - x1))
+        lap_time += math.hypot(x2 - x1, y2 - y1) / leg_speed(heading, wind_direction)
+    return lap_time * COURSE_TIME_FACTOR
+
+def score_course(wind_direction, course_buoys_coords, sandbar_index):
+    """
+    How poor a course is to race in this wind; lower is better. Adds up, weighted by
+    COURSE_SCORE_WEIGHTS: how far legs fall short of COURSE_MIN_LEG, how close legs
+    point to dead upwind, the sandbars lying across the legs, and how far the
+    estimated lap time is from COURSE_TARGET_LAP_TIME.
+    """
+    short = upwind = blocked = 0.0
+    for (x1, y1), (x2, y2) in course_legs(course_buoys_coords):
+        heading = rad_to_deg(math.atan2(y2 - y1, x2 - x1))
+        short += max(0.0, 1.0 - math.hypot(x2 - x1, y2 - y1) / COURSE_MIN_LEG)
+        upwind += max(0.0, 1.0 - abs(angle_difference(heading, wind_direction)) / MIN_SAILING_ANGLE)
+        blocked += len(sandbar_index.query_segment(x1, y1, x2, y2))
+    off_target = abs(estimate_lap_time(wind_direction, course_buoys_coords) / COURSE_TARGET_LAP_TIME - 1.0)
+    w_short, w_upwind, w_blocked, w_time = COURSE_SCORE_WEIGHTS
+    return w_short * short + w_upwind * upwind + w_blocked * blocked + w_time * off_target
+
+def generate_candidate(seed):
+    """
+    One candidate course's marks and sandbars, drawn from rng.course reseeded with
+    seed, so any process can rebuild it. The stream's own state is put back after.
+    """
+    state = rng.course.getstate()
+    rng.course.seed(seed)
+    try:
+        course_buoys_coords = generate_random_buoys(NUM_COURSE_BUOYS)
+        sandbars = generate_random_sandbars(NUM_SANDBARS, course_buoys_coords)
+    finally:
+        rng.course.setstate(state)
+    return course_buoys_coords, sandbars
+
+def score_candidates(seeds, wind_direction):
+    """Scores the candidate courses generated from seeds. Runs in the worker processes."""
+    scores = []
+    for seed in seeds:
+        course_buoys_coords, sandbars = generate_candidate(seed)
+        scores.append(score_course(wind_direction, course_buoys_coords, build_sandbar_index(sandbars)))
+    return scores
+
+def candidate_workers(workers=COURSE_CANDIDATE_WORKERS):
+    """
+    Worker processes to score candidates on: workers, or when that's None one per CPU
+    the game isn't running on, at most COURSE_CANDIDATE_MAX_WORKERS.
+    """
+    if workers is None:
+        return min(COURSE_CANDIDATE_MAX_WORKERS, (os.cpu_count() or 1) - 1)
+    return workers
+
+def start_candidate_pool(workers=COURSE_CANDIDATE_WORKERS):
+    """
+    A pool of worker processes to score candidates on, or None when they're scored
+    in-process. Whoever starts one shuts it down.
+    """
+    workers = candidate_workers(workers)
+    if workers <= 1:
+        return None
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+
+def select_course_steps(wind_direction, count=COURSE_CANDIDATES, pool=None, stream=None):
+    """
+    Generator: draws count candidate seeds from stream (rng.course by default) and scores their courses,
+    in batches on pool's workers when given one (yielding the future it waits on), otherwise one per slice.
+    Returns (seed, score) of the best, the earliest on ties, so the choice doesn't
+    depend on how many workers there are.
+    """
+    stream = stream or rng.course
+    seeds = [stream.getrandbits(32) for _ in range(count)]
+    if pool is None:
+        scores = []
+        for seed in seeds:
+            scores.extend(score_candidates([seed], wind_direction))
+            yield
+    else:
+        # One submit per slice, so pickling the batches is spread out too. While the oldest
+        # batch is still out, its future is yielded to say the slice is only waiting on it
+        futures = []
+        for i in range(0, count, COURSE_CANDIDATE_BATCH):
+            futures.append(pool.submit(score_candidates, seeds[i:i + COURSE_CANDIDATE_BATCH], wind_direction))
+            yield
+        scores = []
+        for future in futures:
+            while not future.done():
+                yield future
+            scores.extend(future.result())
+    best = min(range(count), key=scores.__getitem__)
+    return seeds[best], scores[best]
+
+class Course:
+    """
+    Everything a race needs about its water: wind, marks, sandbars, their index, the
+    heightfield and the depth map drawn from it, and the AI's navigation graph.
+    seed is the course seed it was generated from, if it was.
+    """
+    def __init__(self, wind_direction, course_buoys_coords, sandbars, depth_map, navigation=None, heightfield=None, seed=None):
+        self.wind_direction = wind_direction
+        self.course_buoys_coords = course_buoys_coords
+        self.sandbars = sandbars
+        self.sandbar_index = build_sandbar_index(sandbars)
+        self.buoys = create_course_buoys(course_buoys_coords)
+        self.depth_map = depth_map
+        self.navigation = navigation
+        self.heightfield = heightfield
+        self.seed = seed
+
+def prepare_course_steps(depth_map=None, seed=None, pool=None):
+    """
+    Generates a complete Course in small slices. Yields between slices and returns the Course.
+    With a seed, everything is drawn from a stream of its own seeded from it, so the same
+    seed gives the same course whatever came before; without one, from rng.course and rng.terrain.
+    Candidates are scored on pool's workers when given one (see start_candidate_pool).
+    """
+    stream = rng.course if seed is None else random.Random(f"{seed}/course")
+    wind_direction = stream.uniform(0, 360)
+    if COURSE_CANDIDATES > 1:
+        candidate, _ = yield from select_course_steps(wind_direction, COURSE_CANDIDATES, pool, stream)
+        course_buoys_coords, sandbars = generate_candidate(candidate)
+        yield
+    elif seed is not None:
+        course_buoys_coords, sandbars = generate_candidate(stream.getrandbits(32))
+        yield
+    else:
+        course_buoys_coords = generate_random_buoys(NUM_COURSE_BUOYS)
+        yield
+        sandbars = yield from generate_random_sandbars_steps(NUM_SANDBARS, course_buoys_coords)
+    navigation = (yield from build_navigation_steps(sandbars, course_buoys_coords)) if NAV_ENABLED else None
+    heightfield = yield from generate_heightfield_steps(sandbars, None if seed is None else stream.getrandbits(32))
+    depth_map = yield from generate_depth_map_steps(WORLD_BOUNDS * 2, WORLD_BOUNDS * 2, sandbars, depth_map, heightfield)
+    return Course(wind_direction, course_buoys_coords, sandbars, depth_map, navigation, heightfield, seed)
+
+class CoursePreparer:
+    """
+    Builds the next course a slice at a time inside a per-frame time budget,
+    so preparing a race never freezes the screen. A seeded course comes from cache
+    (a bundle.CourseCache) when one is given: loaded if it's there, generated and
+    stored if not. Candidates are scored on pool when given one; otherwise the
+    preparer starts a pool of its own and shuts it down once the course is ready.
+    """
+    def __init__(self, depth_map=None, seed=None, cache=None, pool=None):
+        self.own_pool = None
+        if pool is None and COURSE_CANDIDATES > 1:
+            pool = self.own_pool = start_candidate_pool()
+        if cache is not None and seed is not None:
+            self.steps = cache.prepare_steps(seed, depth_map, pool)
+        else:
+            self.steps = prepare_course_steps(depth_map, seed, pool)
+        self.course = None
+
+    @property
+    def done(self):
+        return self.course is not None
+
+    def advance(self, budget_s=COURSE_PREP_FRAME_BUDGET):
+        """
+        Runs slices until the budget is spent or the course is ready. Returns True when ready.
+        Stops early when a slice is only waiting on the pool's workers, leaving them the CPU.
+        """
+        if self.course is not None:
+            return True
+        deadline = time.perf_counter() + budget_s
+        while True:
+            try:
+                waiting = next(self.steps)
+            except StopIteration as done:
+                self.course = done.value
+                self.close()
+                return True
+            if waiting is not None or time.perf_counter() >= deadline:
+                return False
+
+    def finish(self):
+        """Completes any remaining work immediately and returns the Course."""
+        if self.course is None:
+            try:
+                self.course = run_to_completion(self.steps)
+            finally:
+                self.close()
+        return self.course
+
+    def close(self):
+        """Shuts down the pool this preparer started, if it started one. Safe to call more than once."""
+        if self.own_pool is not None:
+            self.own_pool.shutdown(cancel_futures=True)
+            self.own_pool = None
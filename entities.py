@@ -1,13 +1,16 @@
 # entities.py
 
 import pygame
-import random
 import math
+from array import array
 from collections import deque
+from itertools import islice
 from enum import Enum, auto
 
 from constants import *
 from utils import *
+import rng
+from collision import sweep_circle_polygon
 
 class SailingStyle(Enum):
     PERFECTIONIST = auto()
@@ -15,9 +18,18 @@ class SailingStyle(Enum):
     CAUTIOUS = auto()
     ERRATIC = auto()
 
+# Reused by every WakeParticle.draw call instead of building a colour and centre per particle
+_wake_color = pygame.Color(*WAKE_COLOR[:3])
+_wake_center = [0, 0]
+
 class WakeParticle:
     """Represents a single particle in the boat's wake."""
+    __slots__ = ('world_x', 'world_y', 'lifetime', 'max_lifetime')
+
     def __init__(self, world_x, world_y):
+        self.reset(world_x, world_y)
+    def reset(self, world_x, world_y):
+        """Brings a spent particle back to life at a new spot, so wakes can recycle them."""
         self.world_x = world_x
         self.world_y = world_y
         self.lifetime = WAKE_LIFETIME
@@ -25,24 +37,49 @@ class WakeParticle:
     def update(self, dt):
         self.lifetime -= dt
         return self.lifetime > 0
-    def draw(self, surface, offset_x, offset_y, view_center):
+    def draw(self, surface, offset_x, offset_y, view_center, scale=1.0):
         if self.lifetime <= 0: return
-        screen_x = int(self.world_x - offset_x + view_center[0])
-        screen_y = int(self.world_y - offset_y + view_center[1])
+        screen_x = int((self.world_x - offset_x) * scale + view_center[0])
+        screen_y = int((self.world_y - offset_y) * scale + view_center[1])
         
         if not (0 < screen_x < surface.get_width() and 0 < screen_y < surface.get_height()): return
 
         life_ratio = max(0, self.lifetime / self.max_lifetime)
-        current_size = int(lerp(WAKE_END_SIZE, WAKE_START_SIZE, life_ratio))
+        current_size = int(lerp(WAKE_END_SIZE, WAKE_START_SIZE, life_ratio) * scale)
         current_alpha = int(lerp(0, 150, life_ratio))
         if current_size >= 1:
-            try:
-                pygame.draw.circle(surface, (*WAKE_COLOR[:3], current_alpha), (screen_x, screen_y), current_size)
-            except (TypeError, ValueError):
-                pygame.draw.circle(surface, WAKE_COLOR, (screen_x, screen_y), current_size)
+            _wake_color.a = current_alpha
+            _wake_center[0] = screen_x
+            _wake_center[1] = screen_y
+            pygame.draw.circle(surface, _wake_color, _wake_center, current_size)
 
 class Boat:
     """Represents the player's sailing dinghy with improved physics."""
+    __slots__ = (
+        'screen_x', 'screen_y', 'world_x', 'world_y', 'prev_world_x', 'prev_world_y', 'heading',
+        'render_prev_x', 'render_prev_y', 'render_prev_heading', 'speed', 'rudder_angle',
+        'sail_angle_rel', 'visual_sail_angle_rel', 'wind_effectiveness', 'optimal_sail_trim',
+        'on_sandbar', 'shallow_drag', 'name', 'score', 'color', 'rotated_shape', 'rotated_deck_shape',
+        'mast_pos_abs', 'sail_curve_points', 'wake_particles', 'spare_wake', 'wake_bounds', 'time_since_last_wake',
+        'collision_rect',
+        'last_line_crossing_time', 'race_started', 'is_finished', 'current_lap',
+        'next_buoy_index', 'lap_start_time', 'race_start_time', 'finish_time', 'lap_times',
+    )
+
+    # Hull geometry is the same for every boat, so it lives on the class
+    # --- New, more detailed hull shape ---
+    base_shape = (
+        (25, 0), (20, -4), (5, -8), (-15, -8),
+        (-20, -5), (-20, 5), (-15, 8), (5, 8), (20, 4)
+    )
+    # --- Shape for the deck/cockpit ---
+    deck_shape = (
+        (18, 0), (15, -2.5), (5, -5), (-13, -5),
+        (-17, -3), (-17, 3), (-13, 5), (5, 5), (15, 2.5)
+    )
+    mast_pos_rel = (8, 0) # Moved mast slightly forward
+    collision_radius = 18 # Slightly increased collision radius
+
     def __init__(self, x, y, name="Player", boat_color=WHITE):
         self.screen_x = x
         self.screen_y = y
@@ -51,6 +88,9 @@ class Boat:
         self.prev_world_x = 0.0
         self.prev_world_y = 0.0
         self.heading = 90.0
+        self.render_prev_x = 0.0
+        self.render_prev_y = 0.0
+        self.render_prev_heading = 90.0
         self.speed = 0.0
         self.rudder_angle = 0
         self.sail_angle_rel = 0.0
@@ -58,26 +98,19 @@ class Boat:
         self.wind_effectiveness = 0.0
         self.optimal_sail_trim = 0.0
         self.on_sandbar = False
+        self.shallow_drag = 1.0 # Drag multiplier from the water depth under the hull (see Heightfield.drag_at)
         self.name = name
         self.score = 0
         self.color = boat_color
-        # --- New, more detailed hull shape ---
-        self.base_shape = [
-            (25, 0), (20, -4), (5, -8), (-15, -8),
-            (-20, -5), (-20, 5), (-15, 8), (5, 8), (20, 4)
-        ]
-        # --- Shape for the deck/cockpit ---
-        self.deck_shape = [
-            (18, 0), (15, -2.5), (5, -5), (-13, -5),
-            (-17, -3), (-17, 3), (-13, 5), (5, 5), (15, 2.5)
-        ]
-        self.rotated_shape = self.base_shape[:]
-        self.rotated_deck_shape = self.deck_shape[:]
-        self.mast_pos_rel = (8, 0) # Moved mast slightly forward
-        self.mast_pos_abs = (0, 0)
-        self.sail_curve_points = []
-        self.collision_radius = 18 # Slightly increased collision radius
+        # Drawing buffers, rewritten in place every frame rather than rebuilt
+        self.rotated_shape = [list(point) for point in self.base_shape]
+        self.rotated_deck_shape = [list(point) for point in self.deck_shape]
+        self.mast_pos_abs = [0.0, 0.0]
+        self.sail_curve_points = [[0.0, 0.0], [0.0, 0.0], [0.0, 0.0]]
         self.wake_particles = deque()
+        self.spare_wake = [] # Expired particles waiting to be reused
+        self.collision_rect = pygame.Rect(0, 0, self.collision_radius * 2, self.collision_radius * 2)
+        self.wake_bounds = None # (min_x, min_y, max_x, max_y) of the live wake, None when it's empty
         self.time_since_last_wake = 0.0
         self.last_line_crossing_time = 0.0
 
@@ -101,7 +134,23 @@ class Boat:
         self.speed = 0.0
         self.sail_angle_rel = 0.0
         self.visual_sail_angle_rel = 0.0
+        self.spare_wake.extend(self.wake_particles)
         self.wake_particles.clear()
+        self.wake_bounds = None
+        self.snapshot_render_state()
+
+    def snapshot_render_state(self):
+        """Remembers the pose at the end of the last simulation step for render interpolation."""
+        self.render_prev_x = self.world_x
+        self.render_prev_y = self.world_y
+        self.render_prev_heading = self.heading
+
+    def interpolated_pose(self, alpha):
+        """Returns (x, y, heading) blended between the previous and current simulation step."""
+        x = lerp(self.render_prev_x, self.world_x, alpha)
+        y = lerp(self.render_prev_y, self.world_y, alpha)
+        heading = normalize_angle(self.render_prev_heading + angle_difference(self.heading, self.render_prev_heading) * alpha)
+        return x, y, heading
 
     def trim_sail(self, direction):
         self.sail_angle_rel += direction * SAIL_TRIM_SPEED
@@ -153,6 +202,8 @@ class Boat:
         drag_factor = (1.0 - BOAT_DRAG)
         if self.on_sandbar:
             drag_factor *= SANDBAR_DRAG_MULTIPLIER
+        else:
+            drag_factor *= self.shallow_drag
         drag_force = (self.speed ** 1.8) * drag_factor
         self.speed -= drag_force * dt
         if force_magnitude < 0.01 and self.speed > 0:
@@ -161,17 +212,24 @@ class Boat:
 
         # Position Update
         move_rad = deg_to_rad(self.heading)
-        distance_multiplier = 40
-        dx = math.cos(move_rad) * self.speed * dt * distance_multiplier
-        dy = math.sin(move_rad) * self.speed * dt * distance_multiplier
+        dx = math.cos(move_rad) * self.speed * dt * BOAT_DISTANCE_MULTIPLIER
+        dy = math.sin(move_rad) * self.speed * dt * BOAT_DISTANCE_MULTIPLIER
         self.world_x += dx
         self.world_y += dy
 
         # Visual Updates (will be called from main render loop)
         self.update_wake(dt)
 
-    def draw(self, surface):
-        self.rotate_and_position()
+    def draw(self, surface, heading=None, detailed=True, scale=1.0):
+        """Draws the boat at (screen_x, screen_y), scale pixels per world unit."""
+        if heading is None:
+            heading = self.heading
+        self.rotate_and_position(heading, scale)
+        if not detailed:
+            # Distant boats at reduced quality: hull only, no deck, mast or sail
+            pygame.draw.polygon(surface, self.color, self.rotated_shape)
+            pygame.draw.polygon(surface, BLACK, self.rotated_shape, 1)
+            return
 
         # --- Enhanced Drawing ---
         # 1. Darker color for shading
@@ -186,59 +244,64 @@ class Boat:
         pygame.draw.polygon(surface, BLACK, self.rotated_deck_shape, 1)
 
         # 4. Draw Mast
-        pygame.draw.circle(surface, BLACK, (int(self.mast_pos_abs[0]), int(self.mast_pos_abs[1])), 3)
+        pygame.draw.circle(surface, BLACK, (int(self.mast_pos_abs[0]), int(self.mast_pos_abs[1])), max(1, round(3 * scale)))
         # --- End Enhanced Drawing ---
 
-        self.update_sail_curve(self.visual_sail_angle_rel)
+        self.update_sail_curve(self.visual_sail_angle_rel, heading, scale)
         if self.optimal_sail_trim != 0 or self.wind_effectiveness > 0:
             try:
-                optimal_abs_angle_rad = deg_to_rad(normalize_angle(self.heading + self.optimal_sail_trim))
+                optimal_abs_angle_rad = deg_to_rad(normalize_angle(heading + self.optimal_sail_trim))
                 mast_x, mast_y = self.mast_pos_abs
-                end_x = mast_x + math.cos(optimal_abs_angle_rad) * OPTIMAL_INDICATOR_LENGTH
-                end_y = mast_y + math.sin(optimal_abs_angle_rad) * OPTIMAL_INDICATOR_LENGTH
+                end_x = mast_x + math.cos(optimal_abs_angle_rad) * OPTIMAL_INDICATOR_LENGTH * scale
+                end_y = mast_y + math.sin(optimal_abs_angle_rad) * OPTIMAL_INDICATOR_LENGTH * scale
                 pygame.draw.line(surface, OPTIMAL_SAIL_COLOR[:3], (int(mast_x), int(mast_y)), (int(end_x), int(end_y)), 1)
             except Exception:
                 pass # Ignore drawing errors
-        if len(self.sail_curve_points) >= 3:
-            pygame.draw.polygon(surface, SAIL_COLOR, self.sail_curve_points)
-            pygame.draw.lines(surface, GRAY, False, self.sail_curve_points, 1)
-
-    def rotate_and_position(self):
-        rad = deg_to_rad(self.heading)
-        cos_a = math.cos(rad)
-        sin_a = math.sin(rad)
+        pygame.draw.polygon(surface, SAIL_COLOR, self.sail_curve_points)
+        pygame.draw.lines(surface, GRAY, False, self.sail_curve_points, 1)
+
+    def rotate_and_position(self, heading, scale=1.0):
+        rad = deg_to_rad(heading)
+        cos_a = math.cos(rad) * scale
+        sin_a = math.sin(rad) * scale
+        sx = self.screen_x
+        sy = self.screen_y
         # Rotate hull
-        for i, (x, y) in enumerate(self.base_shape):
-            rx = x * cos_a - y * sin_a
-            ry = x * sin_a + y * cos_a
-            self.rotated_shape[i] = (rx + self.screen_x, ry + self.screen_y)
+        for (x, y), point in zip(self.base_shape, self.rotated_shape):
+            point[0] = x * cos_a - y * sin_a + sx
+            point[1] = x * sin_a + y * cos_a + sy
         # Rotate deck
-        for i, (x, y) in enumerate(self.deck_shape):
-            rx = x * cos_a - y * sin_a
-            ry = x * sin_a + y * cos_a
-            self.rotated_deck_shape[i] = (rx + self.screen_x, ry + self.screen_y)
+        for (x, y), point in zip(self.deck_shape, self.rotated_deck_shape):
+            point[0] = x * cos_a - y * sin_a + sx
+            point[1] = x * sin_a + y * cos_a + sy
 
         mast_rel_x, mast_rel_y = self.mast_pos_rel
-        mast_rot_x = mast_rel_x * cos_a - mast_rel_y * sin_a
-        mast_rot_y = mast_rel_x * sin_a + mast_rel_y * cos_a
-        self.mast_pos_abs = (mast_rot_x + self.screen_x, mast_rot_y + self.screen_y)
+        mast = self.mast_pos_abs
+        mast[0] = mast_rel_x * cos_a - mast_rel_y * sin_a + sx
+        mast[1] = mast_rel_x * sin_a + mast_rel_y * cos_a + sy
 
-    def update_sail_curve(self, visual_relative_angle):
+    def update_sail_curve(self, visual_relative_angle, heading, scale=1.0):
         mast_x, mast_y = self.mast_pos_abs
-        visual_sail_angle_abs = normalize_angle(self.heading + visual_relative_angle)
+        visual_sail_angle_abs = normalize_angle(heading + visual_relative_angle)
         sail_rad_abs = deg_to_rad(visual_sail_angle_abs)
         cos_s = math.cos(sail_rad_abs)
         sin_s = math.sin(sail_rad_abs)
-        boom_end_x = mast_x + cos_s * SAIL_LENGTH
-        boom_end_y = mast_y + sin_s * SAIL_LENGTH
+        boom_end_x = mast_x + cos_s * SAIL_LENGTH * scale
+        boom_end_y = mast_y + sin_s * SAIL_LENGTH * scale
         mid_x = (mast_x + boom_end_x) / 2
         mid_y = (mast_y + boom_end_y) / 2
         perp_dx = -sin_s
         perp_dy = cos_s
-        offset_dist = math.sqrt(max(0, self.wind_effectiveness)) * SAIL_MAX_CURVE
+        offset_dist = math.sqrt(max(0, self.wind_effectiveness)) * SAIL_MAX_CURVE * scale
         control_x = mid_x + perp_dx * offset_dist
         control_y = mid_y + perp_dy * offset_dist
-        self.sail_curve_points = [(mast_x, mast_y), (control_x, control_y), (boom_end_x, boom_end_y)]
+        mast, control, boom_end = self.sail_curve_points
+        mast[0] = mast_x
+        mast[1] = mast_y
+        control[0] = control_x
+        control[1] = control_y
+        boom_end[0] = boom_end_x
+        boom_end[1] = boom_end_y
 
     def update_wake(self, dt):
         self.time_since_last_wake += dt
@@ -248,65 +311,143 @@ class Boat:
                 rad = deg_to_rad(self.heading)
                 spawn_dx = math.cos(rad) * stern_offset
                 spawn_dy = math.sin(rad) * stern_offset
-                rand_x = random.uniform(-3, 3)
-                rand_y = random.uniform(-3, 3)
+                rand_x = rng.wake.uniform(-3, 3)
+                rand_y = rng.wake.uniform(-3, 3)
                 particle_x = self.world_x + spawn_dx + rand_x
                 particle_y = self.world_y + spawn_dy + rand_y
-                self.wake_particles.append(WakeParticle(particle_x, particle_y))
+                if self.spare_wake:
+                    particle = self.spare_wake.pop()
+                    particle.reset(particle_x, particle_y)
+                else:
+                    particle = WakeParticle(particle_x, particle_y)
+                self.wake_particles.append(particle)
                 self.time_since_last_wake = 0.0
 
-        particles_to_keep = deque()
-        while self.wake_particles:
-             particle = self.wake_particles.popleft()
-             if particle.update(dt):
-                 particles_to_keep.append(particle)
-        self.wake_particles = particles_to_keep
-
-    def draw_wake(self, surface, offset_x, offset_y, view_center):
-         for particle in self.wake_particles:
-             particle.draw(surface, offset_x, offset_y, view_center)
+        # Every particle lives equally long and they're appended in spawn order,
+        # so the expired ones are always at the front
+        particles = self.wake_particles
+        for particle in particles:
+            particle.update(dt)
+        while particles and particles[0].lifetime <= 0:
+            self.spare_wake.append(particles.popleft())
+        self.refresh_wake_bounds()
+
+    def refresh_wake_bounds(self):
+        particles = self.wake_particles
+        if not particles:
+            self.wake_bounds = None
+            return
+        min_x = max_x = particles[0].world_x
+        min_y = max_y = particles[0].world_y
+        for particle in particles:
+            x = particle.world_x
+            y = particle.world_y
+            if x < min_x: min_x = x
+            elif x > max_x: max_x = x
+            if y < min_y: min_y = y
+            elif y > max_y: max_y = y
+        r = WAKE_START_SIZE
+        self.wake_bounds = (min_x - r, min_y - r, max_x + r, max_y + r)
+
+    def draw_wake(self, surface, offset_x, offset_y, view_center, stride=1, scale=1.0):
+         particles = self.wake_particles if stride == 1 else islice(self.wake_particles, 0, None, stride)
+         for particle in particles:
+             particle.draw(surface, offset_x, offset_y, view_center, scale)
+
+    def hull_bounds(self):
+        """World-space box around everything drawn for the boat itself (hull, sail, trim indicator)."""
+        r = BOAT_DRAW_RADIUS
+        return (self.world_x - r, self.world_y - r, self.world_x + r, self.world_y + r)
+
+    def render_bounds(self):
+        """World-space box around the boat and its wake."""
+        box = self.hull_bounds()
+        wake = self.wake_bounds
+        if wake is None:
+            return box
+        return (min(box[0], wake[0]), min(box[1], wake[1]), max(box[2], wake[2]), max(box[3], wake[3]))
 
     def get_world_collision_rect(self):
-         return pygame.Rect(self.world_x - self.collision_radius, self.world_y - self.collision_radius, self.collision_radius * 2, self.collision_radius * 2)
+        """The boat's collision box in world space. The same Rect is moved and returned on every call."""
+        rect = self.collision_rect
+        rect.x = self.world_x - self.collision_radius
+        rect.y = self.world_y - self.collision_radius
+        return rect
 
 class Sandbar:
-    """Represents a static sandbar obstacle. Visuals are handled by the terrain map."""
+    """
+    Represents a static sandbar obstacle. Visuals are handled by the terrain map.
+    The outline is kept as one flat array of world coordinates: x0, y0, x1, y1, ...
+    """
+    __slots__ = ('world_x', 'world_y', 'size', 'vertices', 'rect')
+
+    color = SAND_COLOR
+    border_color = DARK_SAND_COLOR
+
     def __init__(self, world_x, world_y, size):
         self.world_x = world_x
         self.world_y = world_y
         self.size = size
-        self.color = SAND_COLOR
-        self.border_color = DARK_SAND_COLOR
-        self.points_rel = self._generate_random_points(size)
-        self.points_world = [(x + world_x, y + world_y) for x, y in self.points_rel]
-        self.rect = self._calculate_bounding_rect(self.points_world)
+        self.vertices = array('d')
+        for x, y in self._generate_random_points(size):
+            self.vertices.append(x + world_x)
+            self.vertices.append(y + world_y)
+        self.rect = self._calculate_bounding_rect(self.vertices)
+
+    @classmethod
+    def from_polygon(cls, points_world):
+        """Rebuilds a sandbar from a known outline, e.g. one received from another process."""
+        sandbar = cls.__new__(cls)
+        n = len(points_world)
+        sandbar.world_x = sum(p[0] for p in points_world) / n
+        sandbar.world_y = sum(p[1] for p in points_world) / n
+        sandbar.size = 2 * sum(math.hypot(p[0] - sandbar.world_x, p[1] - sandbar.world_y) for p in points_world) / n
+        sandbar.vertices = array('d', [c for p in points_world for c in p])
+        sandbar.rect = sandbar._calculate_bounding_rect(sandbar.vertices)
+        return sandbar
+
+    @property
+    def points_world(self):
+        """The outline as a list of (x, y) world points."""
+        v = self.vertices
+        return list(zip(v[0::2], v[1::2]))
+
+    @property
+    def points_rel(self):
+        """The outline as (x, y) points relative to the sandbar's centre."""
+        v = self.vertices
+        return [(x - self.world_x, y - self.world_y) for x, y in zip(v[0::2], v[1::2])]
 
     def _generate_random_points(self, size):
         points = []
-        num_vertices = random.randint(MIN_SANDBAR_VERTICES, MAX_SANDBAR_VERTICES)
+        num_vertices = rng.course.randint(MIN_SANDBAR_VERTICES, MAX_SANDBAR_VERTICES)
         avg_radius = size / 2.0
         for i in range(num_vertices):
             angle = (i / num_vertices) * 2 * math.pi
-            radius_variation = random.uniform(1.0 - SANDBAR_RADIUS_VARIATION, 1.0 + SANDBAR_RADIUS_VARIATION)
+            radius_variation = rng.course.uniform(1.0 - SANDBAR_RADIUS_VARIATION, 1.0 + SANDBAR_RADIUS_VARIATION)
             radius = avg_radius * radius_variation
-            angle += random.uniform(-0.5 / num_vertices, 0.5 / num_vertices) * 2 * math.pi
+            angle += rng.course.uniform(-0.5 / num_vertices, 0.5 / num_vertices) * 2 * math.pi
             x = radius * math.cos(angle)
             y = radius * math.sin(angle)
             points.append((x, y))
         return points
 
-    def _calculate_bounding_rect(self, points_list):
-        if not points_list:
+    def _calculate_bounding_rect(self, vertices):
+        if not vertices:
             return pygame.Rect(self.world_x, self.world_y, 0, 0)
-        min_x = min(p[0] for p in points_list)
-        max_x = max(p[0] for p in points_list)
-        min_y = min(p[1] for p in points_list)
-        max_y = max(p[1] for p in points_list)
+        xs = vertices[0::2]
+        ys = vertices[1::2]
+        min_x = min(xs)
+        max_x = max(xs)
+        min_y = min(ys)
+        max_y = max(ys)
         return pygame.Rect(min_x, min_y, max_x - min_x, max_y - min_y)
 
 
 class Buoy:
     """Represents a course marker buoy."""
+    __slots__ = ('world_x', 'world_y', 'index', 'radius', 'is_gate', 'color')
+
     def __init__(self, world_x, world_y, index, is_gate=False):
         self.world_x = world_x
         self.world_y = world_y
@@ -315,19 +456,25 @@ class Buoy:
         self.is_gate = is_gate
         self.color = START_FINISH_BUOY_COLOR if is_gate else BUOY_COLOR
 
-    def draw(self, surface, offset_x, offset_y, is_next, view_center):
-        screen_x = int(self.world_x - offset_x + view_center[0])
-        screen_y = int(self.world_y - offset_y + view_center[1])
-        if -self.radius < screen_x < surface.get_width() + self.radius and -self.radius < screen_y < surface.get_height() + self.radius:
+    def draw(self, surface, offset_x, offset_y, is_next, view_center, scale=1.0):
+        screen_x = int((self.world_x - offset_x) * scale + view_center[0])
+        screen_y = int((self.world_y - offset_y) * scale + view_center[1])
+        radius = max(1, round(self.radius * scale))
+        if -radius < screen_x < surface.get_width() + radius and -radius < screen_y < surface.get_height() + radius:
             color_to_use = self.color
             if is_next and not self.is_gate:
                 color_to_use = NEXT_BUOY_INDICATOR_COLOR
-            pygame.draw.circle(surface, color_to_use, (screen_x, screen_y), self.radius)
-            pygame.draw.circle(surface, BLACK, (screen_x, screen_y), self.radius, 1)
+            pygame.draw.circle(surface, color_to_use, (screen_x, screen_y), radius)
+            pygame.draw.circle(surface, BLACK, (screen_x, screen_y), radius, 1)
 
 class AIBoat(Boat):
     """An AI-controlled boat that races against the player."""
-    def __init__(self, world_x, world_y, name, sailing_style, color):
+    __slots__ = (
+        'style', 'tack_decision_time', 'time_at_current_buoy', 'last_buoy_index', 'staging_point',
+        'nav_leg', 'nav_waypoint', 'turn_rate_modifier', 'sail_trim_error', 'heading_error', 'tack_anticipation',
+    )
+
+    def __init__(self, world_x, world_y, name, sailing_style, color, profile=None):
         super().__init__(0, 0, name=name, boat_color=color)
         self.world_x = world_x
         self.world_y = world_y
@@ -336,35 +483,43 @@ class AIBoat(Boat):
         self.time_at_current_buoy = 0.0
         self.last_buoy_index = -1
         self.staging_point = None
-
-        if self.style == SailingStyle.PERFECTIONIST:
-            self.turn_rate_modifier = random.uniform(1.0, 1.1)
-            self.sail_trim_error = random.uniform(-2, 2)
-            self.heading_error = random.uniform(-1, 1)
-            self.tack_anticipation = random.uniform(10, 15)
+        self.nav_leg = None     # (from mark, to mark) of the waypoints being followed
+        self.nav_waypoint = 0
+
+        if profile is not None:
+            # A tuned preset (see tuning.py) instead of the hand-picked ranges below
+            self.turn_rate_modifier = profile['turn_rate_modifier']
+            self.sail_trim_error = profile['sail_trim_error']
+            self.heading_error = profile['heading_error']
+            self.tack_anticipation = profile['tack_anticipation']
+        elif self.style == SailingStyle.PERFECTIONIST:
+            self.turn_rate_modifier = rng.fleet.uniform(1.0, 1.1)
+            self.sail_trim_error = rng.fleet.uniform(-2, 2)
+            self.heading_error = rng.fleet.uniform(-1, 1)
+            self.tack_anticipation = rng.fleet.uniform(10, 15)
         elif self.style == SailingStyle.AGGRESSIVE:
-            self.turn_rate_modifier = random.uniform(0.9, 1.15)
-            self.sail_trim_error = random.uniform(-5, 5)
-            self.heading_error = random.uniform(-3, 3)
-            self.tack_anticipation = random.uniform(5, 10)
+            self.turn_rate_modifier = rng.fleet.uniform(0.9, 1.15)
+            self.sail_trim_error = rng.fleet.uniform(-5, 5)
+            self.heading_error = rng.fleet.uniform(-3, 3)
+            self.tack_anticipation = rng.fleet.uniform(5, 10)
         elif self.style == SailingStyle.CAUTIOUS:
-            self.turn_rate_modifier = random.uniform(0.85, 1.0)
-            self.sail_trim_error = random.uniform(-8, 8)
-            self.heading_error = random.uniform(-5, 5)
-            self.tack_anticipation = random.uniform(12, 18)
+            self.turn_rate_modifier = rng.fleet.uniform(0.85, 1.0)
+            self.sail_trim_error = rng.fleet.uniform(-8, 8)
+            self.heading_error = rng.fleet.uniform(-5, 5)
+            self.tack_anticipation = rng.fleet.uniform(12, 18)
         elif self.style == SailingStyle.ERRATIC:
-            self.turn_rate_modifier = random.uniform(0.8, 1.2)
-            self.sail_trim_error = random.uniform(-10, 10)
-            self.heading_error = random.uniform(-7, 7)
-            self.tack_anticipation = random.uniform(5, 15)
+            self.turn_rate_modifier = rng.fleet.uniform(0.8, 1.2)
+            self.sail_trim_error = rng.fleet.uniform(-10, 10)
+            self.heading_error = rng.fleet.uniform(-7, 7)
+            self.tack_anticipation = rng.fleet.uniform(5, 15)
         else:
             self.turn_rate_modifier = 1.0
             self.sail_trim_error = 0
             self.heading_error = 0
             self.tack_anticipation = 0
 
-    def ai_update(self, wind_speed, wind_direction, course_buoys, start_finish_line, dt, pre_race_timer):
-        """The brain of the AI boat. Sets rudder and sail intentions."""
+    def ai_update(self, wind_speed, wind_direction, course_buoys, start_finish_line, dt, pre_race_timer, sandbar_index=None, navigation=None, planner=None):
+        """The brain of the AI boat. Sets rudder and sail intentions. With a RolloutPlanner, it picks the racing headings."""
         if self.is_finished:
             self.speed *= 0.98
             return
@@ -387,7 +542,7 @@ class AIBoat(Boat):
         # Pre-race starting strategy
         if pre_race_timer > 0:
             if self.staging_point is None:
-                self.staging_point = (self.world_x - 100, self.world_y + random.uniform(-50, 50))
+                self.staging_point = (self.world_x - 100, self.world_y + rng.ai.uniform(-50, 50))
 
             if pre_race_timer > 5:
                 target = self.staging_point
@@ -413,14 +568,20 @@ class AIBoat(Boat):
             if dist_from_center_sq > (WORLD_BOUNDS * 1.5)**2:
                 target = (0, 0)
             else:
-                target = self.get_current_target(course_buoys, start_finish_line)
+                target = self.get_current_target(course_buoys, start_finish_line, navigation)
 
         if not target:
             return
 
-        perceived_wind_direction = normalize_angle(wind_direction + random.uniform(-5, 5))
-        desired_heading = self.calculate_desired_heading(target, perceived_wind_direction)
+        perceived_wind_direction = normalize_angle(wind_direction + rng.ai.uniform(-5, 5))
+        desired_heading = None
+        if planner is not None and pre_race_timer <= 0:
+            desired_heading = planner.heading_for(self, target)
+        if desired_heading is None:
+            desired_heading = self.calculate_desired_heading(target, perceived_wind_direction)
         desired_heading = normalize_angle(desired_heading + self.heading_error)
+        if sandbar_index is not None:
+            desired_heading = self.avoid_sandbars(desired_heading, perceived_wind_direction, sandbar_index)
 
         heading_diff = angle_difference(desired_heading, self.heading)
         turn_direction = 0
@@ -431,13 +592,18 @@ class AIBoat(Boat):
         self.ai_trim_sails(perceived_wind_direction, dt)
 
 
-    def get_current_target(self, course_buoys, start_finish_line):
+    def get_current_target(self, course_buoys, start_finish_line, navigation=None):
         """Determines the AI's current navigation target."""
         base_target = None
         if not self.race_started:
             line_center_x = (start_finish_line[0][0] + start_finish_line[1][0]) / 2
             line_center_y = (start_finish_line[0][1] + start_finish_line[1][1]) / 2
-            base_target = (line_center_x + 60, line_center_y + random.uniform(-20, 20))
+            base_target = (line_center_x + 60, line_center_y + rng.ai.uniform(-20, 20))
+        elif navigation is not None:
+            waypoint = self.next_waypoint(navigation, len(course_buoys))
+            if waypoint is not None:
+                return waypoint
+            base_target = navigation.nodes[navigation.marks[self.next_buoy_index]]
         elif self.next_buoy_index < len(course_buoys):
             base_target = course_buoys[self.next_buoy_index]
         else:
@@ -447,10 +613,64 @@ class AIBoat(Boat):
         offset_factor = 1.0
         if self.style == SailingStyle.CAUTIOUS: offset_factor = 1.5
         elif self.style == SailingStyle.ERRATIC: offset_factor = 2.0
-        offset_x = random.uniform(-10 * offset_factor, 10 * offset_factor)
-        offset_y = random.uniform(-10 * offset_factor, 10 * offset_factor)
+        offset_x = rng.ai.uniform(-10 * offset_factor, 10 * offset_factor)
+        offset_y = rng.ai.uniform(-10 * offset_factor, 10 * offset_factor)
         return (base_target[0] + offset_x, base_target[1] + offset_y)
 
+    def next_waypoint(self, navigation, num_buoys):
+        """
+        The waypoint to steer for on the current leg, or None once only the mark itself
+        is left (which then gets the usual style offset). The line counts as mark num_buoys.
+        """
+        to_mark = min(self.next_buoy_index, num_buoys)
+        if to_mark > 0:
+            from_mark = to_mark - 1
+        else:
+            # The first lap starts from the line; later laps carry on from the last buoy
+            from_mark = num_buoys if self.current_lap == 1 else num_buoys - 1
+        waypoints = navigation.path(from_mark, to_mark)
+        if self.nav_leg != (from_mark, to_mark):
+            self.nav_leg = (from_mark, to_mark)
+            self.nav_waypoint = 0
+        while self.nav_waypoint < len(waypoints) - 1:
+            x, y = waypoints[self.nav_waypoint]
+            if (x - self.world_x)**2 + (y - self.world_y)**2 > NAV_WAYPOINT_RADIUS**2:
+                return waypoints[self.nav_waypoint]
+            self.nav_waypoint += 1
+        return None
+
+    def heading_is_clear(self, heading, sandbar_index):
+        """
+        Casts a look-ahead ray along heading and reports whether it misses every sandbar.
+        Bounding boxes are only a first cut: the hull is swept against the outlines they
+        hold, so a waypoint just off a corner doesn't read as blocked.
+        """
+        look_ahead = AI_LOOKAHEAD_DISTANCE + self.speed * AI_LOOKAHEAD_SPEED_FACTOR
+        rad = deg_to_rad(heading)
+        dx = math.cos(rad) * look_ahead
+        dy = math.sin(rad) * look_ahead
+        for sandbar in sandbar_index.query_segment(self.world_x, self.world_y, self.world_x + dx, self.world_y + dy):
+            if sweep_circle_polygon(self.world_x, self.world_y, dx, dy, self.collision_radius, sandbar.vertices) is not None:
+                return False
+        return True
+
+    def avoid_sandbars(self, desired_heading, wind_direction, sandbar_index):
+        """Nudges the desired heading to the nearest sailable heading with a clear look-ahead."""
+        if self.on_sandbar or self.heading_is_clear(desired_heading, sandbar_index):
+            return desired_heading
+        for step in range(1, AI_AVOID_MAX_STEPS + 1):
+            for sign in (1, -1):
+                candidate = normalize_angle(desired_heading + sign * step * AI_AVOID_ANGLE_STEP)
+                if abs(angle_difference(candidate, wind_direction)) < MIN_SAILING_ANGLE:
+                    continue
+                if self.heading_is_clear(candidate, sandbar_index):
+                    return candidate
+        # Boxed in on this tack: try the other one
+        other_tack = normalize_angle(2 * wind_direction - desired_heading)
+        if abs(angle_difference(other_tack, wind_direction)) >= MIN_SAILING_ANGLE and self.heading_is_clear(other_tack, sandbar_index):
+            return other_tack
+        return desired_heading
+
     def calculate_desired_heading(self, target_pos, wind_direction):
         target_dx = target_pos[0] - self.world_x
         target_dy = target_pos[1] - self.world_y
@@ -458,16 +678,16 @@ class AIBoat(Boat):
         wind_angle_diff = abs(angle_difference(direct_heading_to_target, wind_direction))
 
         if wind_angle_diff < MIN_SAILING_ANGLE + self.tack_anticipation:
-            tack_angle = MIN_SAILING_ANGLE + random.uniform(5, 20)
+            tack_angle = MIN_SAILING_ANGLE + rng.ai.uniform(5, 20)
             port_tack_heading = normalize_angle(wind_direction + tack_angle)
             starboard_tack_heading = normalize_angle(wind_direction - tack_angle)
             port_diff = abs(angle_difference(port_tack_heading, direct_heading_to_target))
             starboard_diff = abs(angle_difference(starboard_tack_heading, direct_heading_to_target))
-            return normalize_angle((port_tack_heading if port_diff < starboard_diff else starboard_tack_heading) + random.uniform(-3, 3))
+            return normalize_angle((port_tack_heading if port_diff < starboard_diff else starboard_tack_heading) + rng.ai.uniform(-3, 3))
         else:
             overshoot = 0
-            if self.style == SailingStyle.AGGRESSIVE: overshoot = random.uniform(-2, 5)
-            elif self.style == SailingStyle.ERRATIC: overshoot = random.uniform(-10, 10)
+            if self.style == SailingStyle.AGGRESSIVE: overshoot = rng.ai.uniform(-2, 5)
+            elif self.style == SailingStyle.ERRATIC: overshoot = rng.ai.uniform(-10, 10)
             return normalize_angle(direct_heading_to_target + overshoot)
 
     def ai_trim_sails(self, wind_direction, dt):
@@ -0,0 +1,350 @@
+# env.py
+
+import numpy as np
+
+from constants import *
+import rng
+from entities import Boat
+from course import generate_random_buoys, generate_random_sandbars
+from race import circle_entry_fraction, segment_crossing_fraction
+
+try:
+    import gymnasium
+    from gymnasium import spaces
+except ImportError:  # The environments work without it; only the space descriptions need it
+    gymnasium = None
+
+# Observation layout (per boat)
+OBS_WIND_SIN = 0          # sin/cos of the wind's angle relative to the bow
+OBS_WIND_COS = 1
+OBS_WIND_SPEED = 2        # / MAX_WIND_SPEED
+OBS_SPEED = 3             # / MAX_BOAT_SPEED
+OBS_EFFECTIVENESS = 4     # wind_effectiveness, 0..1
+OBS_SAIL = 5              # sail_angle_rel / MAX_SAIL_ANGLE_REL
+OBS_TARGET_SIN = 6        # sin/cos of the bearing to the next mark (or the line) relative to the bow
+OBS_TARGET_COS = 7
+OBS_TARGET_DIST = 8       # / (2 * WORLD_BOUNDS)
+OBS_ON_SANDBAR = 9
+OBS_RAYS = 10             # ENV_SANDBAR_RAYS clearances, 0 (sandbar at the bow) .. 1 (clear for ENV_RAY_LENGTH)
+OBS_SIZE = OBS_RAYS + ENV_SANDBAR_RAYS
+
+ACTION_RUDDER = 0         # -1 (port) .. 1 (starboard), as Boat.turn
+ACTION_TRIM = 1           # -1 .. 1, scaled like the AI's trimming rate
+ACTION_SIZE = 2
+
+def _angle_difference(a, b):
+    return (a - b + 180.0) % 360.0 - 180.0
+
+def step_boat_arrays(heading, speed, sail, on_sandbar, rudder, wind_speed, wind_direction, dt):
+    """
+    Boat.update for arrays of boats. heading/speed/sail are updated in place;
+    returns (dx, dy, wind_effectiveness).
+    """
+    speed_turn_component = (1.0 - MIN_TURN_EFFECTIVENESS) * np.minimum(1.0, speed / (MAX_BOAT_SPEED * 0.7))
+    turn_effectiveness = MIN_TURN_EFFECTIVENESS + speed_turn_component
+    heading += rudder * BOAT_TURN_SPEED * turn_effectiveness * dt * 60
+    heading %= 360.0
+
+    wind_angle_rel_boat = _angle_difference(wind_direction, heading)
+    abs_wind_angle = np.abs(wind_angle_rel_boat)
+    optimal_trim = np.clip(_angle_difference(wind_angle_rel_boat + 180.0, 90.0), -MAX_SAIL_ANGLE_REL, MAX_SAIL_ANGLE_REL)
+    trim_diff = _angle_difference(sail, optimal_trim)
+    trim_effectiveness = ((np.cos(np.radians(trim_diff)) + 1) / 2.0) ** 2
+    point_of_sail_effectiveness = np.maximum(0.1, np.cos(np.radians(np.abs(abs_wind_angle - 90))))
+    sailing = abs_wind_angle > MIN_SAILING_ANGLE
+    effectiveness = np.where(sailing, np.maximum(0.0, trim_effectiveness * point_of_sail_effectiveness), 0.0)
+    force = np.maximum(0.0, wind_speed * BOAT_ACCEL_FACTOR * effectiveness)
+
+    speed += force * dt
+    drag_factor = (1.0 - BOAT_DRAG) * np.where(on_sandbar, SANDBAR_DRAG_MULTIPLIER, 1.0)
+    speed -= speed ** 1.8 * drag_factor * dt
+    speed -= np.where((force < 0.01) & (speed > 0), NO_POWER_DECEL * dt, 0.0)
+    np.clip(speed, 0.0, MAX_BOAT_SPEED, out=speed)
+
+    move_rad = np.radians(heading)
+    distance = speed * dt * BOAT_DISTANCE_MULTIPLIER
+    return np.cos(move_rad) * distance, np.sin(move_rad) * distance, effectiveness
+
+class VectorSailingEnv:
+    """
+    num_envs independent single-boat races stepped in lockstep as arrays, for training helms.
+    Gym-style: reset() -> (obs, info), step(actions) -> (obs, rewards, terminated, truncated, info).
+    Finished races reset automatically; their last observation is in info['final_observation'].
+    """
+    def __init__(self, num_envs, laps=1, action_repeat=ENV_ACTION_REPEAT, max_episode_time=ENV_MAX_EPISODE_TIME,
+                 course_pool_size=ENV_COURSE_POOL_SIZE, seed=None):
+        self.num_envs = num_envs
+        self.laps = laps
+        self.action_repeat = action_repeat
+        self.max_episode_time = max_episode_time
+        self.course_pool_size = max(1, min(num_envs, course_pool_size))
+        self.np_random = np.random.default_rng(seed)
+        self._seed = seed
+        self.courses = None
+
+        n = num_envs
+        self.x = np.zeros(n)
+        self.y = np.zeros(n)
+        self.heading = np.zeros(n)
+        self.speed = np.zeros(n)
+        self.sail = np.zeros(n)
+        self.effectiveness = np.zeros(n)
+        self.on_sandbar = np.zeros(n, dtype=bool)
+        self.wind_speed = np.zeros(n)
+        self.wind_direction = np.zeros(n)
+        self.wind_timer = np.zeros(n)
+        self.time = np.zeros(n)
+        self.started = np.zeros(n, dtype=bool)
+        self.finished = np.zeros(n, dtype=bool)
+        self.next_buoy = np.zeros(n, dtype=np.int64)
+        self.lap = np.ones(n, dtype=np.int64)
+        self.last_crossing = np.zeros(n)
+        self.course_id = np.zeros(n, dtype=np.int64)
+
+        self.line_p1 = np.array(START_FINISH_LINE[0], dtype=np.float64)
+        self.line_vec = np.array(START_FINISH_LINE[1], dtype=np.float64) - self.line_p1
+        self.line_center = self.line_p1 + self.line_vec / 2
+        self.ray_angles = np.arange(ENV_SANDBAR_RAYS) * (360.0 / ENV_SANDBAR_RAYS)
+        self.rows = np.arange(n)
+
+        if gymnasium is not None:
+            self.single_observation_space = spaces.Box(-1.0, 1.0, (OBS_SIZE,), np.float32)
+            self.single_action_space = spaces.Box(-1.0, 1.0, (ACTION_SIZE,), np.float32)
+            self.observation_space = spaces.Box(-1.0, 1.0, (n, OBS_SIZE), np.float32)
+            self.action_space = spaces.Box(-1.0, 1.0, (n, ACTION_SIZE), np.float32)
+
+    # --- Courses ---
+
+    def _build_courses(self):
+        """Generates the pool of courses episodes are drawn from, as padded arrays."""
+        if self._seed is not None:
+            rng.seed_all(self._seed)
+        pool = self.course_pool_size
+        self.buoys = np.zeros((pool, NUM_COURSE_BUOYS, 2))
+        self.sandbar_rects = np.empty((pool, NUM_SANDBARS, 4))
+        # Padding boxes are inside-out, so nothing ever overlaps them
+        self.sandbar_rects[:] = (np.inf, np.inf, -np.inf, -np.inf)
+        for c in range(pool):
+            coords = generate_random_buoys(NUM_COURSE_BUOYS)
+            sandbars = generate_random_sandbars(NUM_SANDBARS, coords)
+            self.buoys[c, :len(coords)] = coords
+            for s, sandbar in enumerate(sandbars):
+                self.sandbar_rects[c, s] = (sandbar.rect.left, sandbar.rect.top, sandbar.rect.right, sandbar.rect.bottom)
+        self.courses = pool
+
+    def _reset_envs(self, idx):
+        """Starts a fresh race in each env in idx: new course from the pool, new wind, boat on the start grid."""
+        k = len(idx)
+        if k == 0:
+            return
+        gen = self.np_random
+        self.course_id[idx] = gen.integers(0, self.courses, k)
+        self.x[idx] = -350.0
+        self.y[idx] = gen.uniform(-100, 100, k)
+        self.heading[idx] = 90.0
+        self.speed[idx] = 0.0
+        self.sail[idx] = 0.0
+        self.effectiveness[idx] = 0.0
+        self.on_sandbar[idx] = False
+        self.wind_speed[idx] = gen.uniform(MIN_WIND_SPEED, MAX_WIND_SPEED, k)
+        self.wind_direction[idx] = gen.uniform(0, 360, k)
+        self.wind_timer[idx] = 0.0
+        self.time[idx] = 0.0
+        self.started[idx] = False
+        self.finished[idx] = False
+        self.next_buoy[idx] = 0
+        self.lap[idx] = 1
+        self.last_crossing[idx] = -LINE_CROSSING_DEBOUNCE
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self._seed = seed
+            self.np_random = np.random.default_rng(seed)
+            self.courses = None
+        if self.courses is None:
+            self._build_courses()
+        self._reset_envs(self.rows)
+        return self._observe(), self._info()
+
+    # --- Stepping ---
+
+    def _targets(self):
+        """Where each boat is heading next: its next mark, or the line before the start and after the last mark."""
+        on_course = self.started & (self.next_buoy < NUM_COURSE_BUOYS)
+        marks = self.buoys[self.course_id, np.minimum(self.next_buoy, NUM_COURSE_BUOYS - 1)]
+        return np.where(on_course[:, None], marks, self.line_center)
+
+    def _update_wind(self, dt):
+        self.wind_timer += dt
+        due = np.flatnonzero(self.wind_timer * 1000 > WIND_UPDATE_INTERVAL)
+        if len(due):
+            elapsed = self.wind_timer[due]
+            speed_change = self.np_random.uniform(-WIND_SPEED_CHANGE_RATE, WIND_SPEED_CHANGE_RATE, len(due)) * elapsed
+            self.wind_speed[due] = np.clip(self.wind_speed[due] + speed_change, MIN_WIND_SPEED, MAX_WIND_SPEED)
+            dir_change = self.np_random.uniform(-WIND_DIR_CHANGE_RATE, WIND_DIR_CHANGE_RATE, len(due)) * elapsed
+            self.wind_direction[due] = (self.wind_direction[due] + dir_change) % 360.0
+            self.wind_timer[due] = 0.0
+
+    def _update_sandbars(self):
+        rects = self.sandbar_rects[self.course_id]
+        r = Boat.collision_radius
+        x = self.x[:, None]
+        y = self.y[:, None]
+        overlap = (rects[:, :, 0] < x + r) & (rects[:, :, 2] > x - r) & (rects[:, :, 1] < y + r) & (rects[:, :, 3] > y - r)
+        self.on_sandbar = overlap.any(axis=1)
+
+    def _advance_progress(self, p0, d, prev_time, dt, rewards):
+        """Buoy rounding and start/finish crossings for one sim step; adds event rewards."""
+        active = self.started & ~self.finished & (self.next_buoy < NUM_COURSE_BUOYS)
+        if active.any():
+            idx = np.flatnonzero(active)
+            centers = self.buoys[self.course_id[idx], self.next_buoy[idx]]
+            hit = idx[~np.isnan(circle_entry_fraction(p0[idx], d[idx], centers, BUOY_ROUNDING_RADIUS))]
+            self.next_buoy[hit] += 1
+            rewards[hit] += ENV_REWARD_BUOY
+            lapped = hit[(self.next_buoy[hit] >= NUM_COURSE_BUOYS) & (self.lap[hit] < self.laps)]
+            self.lap[lapped] += 1
+            self.next_buoy[lapped] = 0
+
+        crossing = segment_crossing_fraction(p0, d, self.line_p1, self.line_vec)
+        t_cross = prev_time + crossing * dt
+        crossed = ~self.finished & ~np.isnan(crossing) & (t_cross - self.last_crossing > LINE_CROSSING_DEBOUNCE)
+        if crossed.any():
+            self.last_crossing[crossed] = t_cross[crossed]
+            starting = crossed & ~self.started
+            finishing = crossed & self.started & (self.lap >= self.laps) & (self.next_buoy >= NUM_COURSE_BUOYS)
+            self.started |= starting
+            self.finished |= finishing
+            rewards[starting] += ENV_REWARD_START
+            rewards[finishing] += ENV_REWARD_FINISH
+
+    def step(self, actions):
+        """Applies actions (num_envs, 2) of rudder and trim for action_repeat fixed steps."""
+        actions = np.clip(np.asarray(actions, dtype=np.float64).reshape(self.num_envs, ACTION_SIZE), -1.0, 1.0)
+        rudder = actions[:, ACTION_RUDDER]
+        trim_rate = actions[:, ACTION_TRIM] * SAIL_TRIM_SPEED * 60
+        dt = SIM_TIMESTEP
+        rewards = np.zeros(self.num_envs)
+
+        target = self._targets()
+        dist_before = np.hypot(target[:, 0] - self.x, target[:, 1] - self.y)
+        racing = ~self.finished
+        p0 = np.empty((self.num_envs, 2))
+        d = np.empty((self.num_envs, 2))
+        for _ in range(self.action_repeat):
+            self._update_wind(dt)
+            self.sail += trim_rate * dt
+            np.clip(self.sail, -MAX_SAIL_ANGLE_REL, MAX_SAIL_ANGLE_REL, out=self.sail)
+            dx, dy, self.effectiveness = step_boat_arrays(self.heading, self.speed, self.sail, self.on_sandbar, rudder,
+                                                          self.wind_speed, self.wind_direction, dt)
+            p0[:, 0] = self.x
+            p0[:, 1] = self.y
+            d[:, 0] = dx
+            d[:, 1] = dy
+            self.x += dx
+            self.y += dy
+            self._update_sandbars()
+            self._advance_progress(p0, d, self.time, dt, rewards)
+            self.time += dt
+
+        # Progress toward the mark that was current when the step began
+        dist_after = np.hypot(target[:, 0] - self.x, target[:, 1] - self.y)
+        rewards += (dist_before - dist_after) * racing / ENV_PROGRESS_SCALE
+        rewards -= ENV_REWARD_TIME_PENALTY * self.action_repeat * dt
+
+        out_of_bounds = np.maximum(np.abs(self.x), np.abs(self.y)) > WORLD_BOUNDS * 1.5
+        rewards[out_of_bounds] -= ENV_REWARD_OUT_OF_BOUNDS
+        terminated = self.finished.copy()
+        truncated = ~terminated & (out_of_bounds | (self.time + dt / 2 >= self.max_episode_time))
+
+        obs = self._observe()
+        info = self._info()
+        done = np.flatnonzero(terminated | truncated)
+        if len(done):
+            info['final_observation'] = obs[done].copy()
+            info['final_index'] = done
+            self._reset_envs(done)
+            obs[done] = self._observe()[done]
+        return obs, rewards.astype(np.float32), terminated, truncated, info
+
+    # --- Observations ---
+
+    def _sandbar_rays(self):
+        """Clearance along ENV_SANDBAR_RAYS directions around the bow, as a fraction of ENV_RAY_LENGTH."""
+        rects = self.sandbar_rects[self.course_id][:, None, :, :]               # (n, 1, s, 4)
+        angles = np.radians(self.heading[:, None] + self.ray_angles[None, :])  # (n, r)
+        dir_x = (np.cos(angles) * ENV_RAY_LENGTH)[:, :, None]
+        dir_y = (np.sin(angles) * ENV_RAY_LENGTH)[:, :, None]
+        ox = self.x[:, None, None]
+        oy = self.y[:, None, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            tx1 = (rects[..., 0] - ox) / dir_x
+            tx2 = (rects[..., 2] - ox) / dir_x
+            ty1 = (rects[..., 1] - oy) / dir_y
+            ty2 = (rects[..., 3] - oy) / dir_y
+        # A ray parallel to an axis is inside that slab everywhere or nowhere
+        inside_x = (rects[..., 0] <= ox) & (ox <= rects[..., 2])
+        inside_y = (rects[..., 1] <= oy) & (oy <= rects[..., 3])
+        t_enter_x = np.where(dir_x == 0, np.where(inside_x, -np.inf, np.inf), np.minimum(tx1, tx2))
+        t_exit_x = np.where(dir_x == 0, np.where(inside_x, np.inf, -np.inf), np.maximum(tx1, tx2))
+        t_enter_y = np.where(dir_y == 0, np.where(inside_y, -np.inf, np.inf), np.minimum(ty1, ty2))
+        t_exit_y = np.where(dir_y == 0, np.where(inside_y, np.inf, -np.inf), np.maximum(ty1, ty2))
+        t_enter = np.maximum(t_enter_x, t_enter_y)
+        t_exit = np.minimum(t_exit_x, t_exit_y)
+        hit = (t_exit >= np.maximum(t_enter, 0.0)) & (t_enter <= 1.0)
+        clearance = np.where(hit, np.clip(t_enter, 0.0, 1.0), 1.0)
+        return clearance.min(axis=2)
+
+    def _observe(self):
+        obs = np.empty((self.num_envs, OBS_SIZE), dtype=np.float32)
+        wind_rel = np.radians(_angle_difference(self.wind_direction, self.heading))
+        obs[:, OBS_WIND_SIN] = np.sin(wind_rel)
+        obs[:, OBS_WIND_COS] = np.cos(wind_rel)
+        obs[:, OBS_WIND_SPEED] = self.wind_speed / MAX_WIND_SPEED
+        obs[:, OBS_SPEED] = self.speed / MAX_BOAT_SPEED
+        obs[:, OBS_EFFECTIVENESS] = self.effectiveness
+        obs[:, OBS_SAIL] = self.sail / MAX_SAIL_ANGLE_REL
+        target = self._targets()
+        tx = target[:, 0] - self.x
+        ty = target[:, 1] - self.y
+        bearing = np.radians(_angle_difference(np.degrees(np.arctan2(ty, tx)), self.heading))
+        obs[:, OBS_TARGET_SIN] = np.sin(bearing)
+        obs[:, OBS_TARGET_COS] = np.cos(bearing)
+        obs[:, OBS_TARGET_DIST] = np.minimum(np.hypot(tx, ty) / (2 * WORLD_BOUNDS), 1.0)
+        obs[:, OBS_ON_SANDBAR] = self.on_sandbar
+        obs[:, OBS_RAYS:] = self._sandbar_rays()
+        return obs
+
+    def _info(self):
+        return {
+            'time': self.time.copy(),
+            'lap': self.lap.copy(),
+            'next_buoy': self.next_buoy.copy(),
+            'started': self.started.copy(),
+            'finished': self.finished.copy(),
+        }
+
+class SailingEnv:
+    """A single race with the same observations, actions and rewards as VectorSailingEnv."""
+    def __init__(self, laps=1, seed=None, **kwargs):
+        self.vec = VectorSailingEnv(1, laps=laps, seed=seed, course_pool_size=1, **kwargs)
+        if gymnasium is not None:
+            self.observation_space = self.vec.single_observation_space
+            self.action_space = self.vec.single_action_space
+
+    def reset(self, seed=None):
+        # Each single-env episode gets a freshly generated course
+        if seed is not None:
+            rng.seed_all(seed)
+            self.vec.np_random = np.random.default_rng(seed)
+        self.vec.courses = None
+        self.vec._seed = None
+        obs, info = self.vec.reset()
+        return obs[0], {k: v[0] for k, v in info.items()}
+
+    def step(self, action):
+        obs, rewards, terminated, truncated, info = self.vec.step(np.asarray(action).reshape(1, ACTION_SIZE))
+        if 'final_observation' in info:
+            obs = info['final_observation'] # Gym-style: the caller resets a single env itself
+        info = {k: v[0] for k, v in info.items() if k not in ('final_observation', 'final_index')}
+        return obs[0], float(rewards[0]), bool(terminated[0]), bool(truncated[0]), info
@@ -0,0 +1,189 @@
+# export.py
+#
+# Renders an AI race headless, faster than real time, for highlights.
+#   python export.py --frames out/                      PNG sequence, compressed in a worker pool
+#   python export.py --raw - | ffmpeg -f rawvideo -pix_fmt rgb24 -s 1280x720 -r 30 -i - race.mp4
+
+import os
+import sys
+import time
+import math
+import zlib
+import struct
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1") # Keep stdout clean for --raw -
+
+from constants import *  # before pygame.init(): constants briefly inits and quits pygame itself
+import pygame
+
+from utils import *
+import rng
+from course import CoursePreparer
+from graphics import Minimap, draw_wind_gauge
+from simulation import RaceSimulation, FixedTimestep, create_ai_fleet, place_boats_on_start_grid
+from quality import QUALITY_LEVELS
+from main import render_view
+from spatial import build_fleet_index
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+def _save_png(path, size, pixels, level=EXPORT_PNG_COMPRESSION):
+    """
+    Worker side of the PNG sequence: compresses one RGB24 frame to disk.
+    Written by hand rather than via pygame.image.save so the zlib level can be turned down.
+    """
+    width, height = size
+    stride = width * 3
+    view = memoryview(pixels)
+    # Filter type 0 (none) in front of every row
+    rows = b"".join(b"\x00" + view[y * stride:(y + 1) * stride] for y in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    with open(path, 'wb') as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(_png_chunk(b"IHDR", header))
+        f.write(_png_chunk(b"IDAT", zlib.compress(rows, level)))
+        f.write(_png_chunk(b"IEND", b""))
+
+def export_race(frames_dir=None, raw_out=None, size=(EXPORT_WIDTH, EXPORT_HEIGHT), fps=EXPORT_FPS, laps=1,
+                num_boats=NUM_AI_BOATS, follow=0, seed=None, workers=None, skip_countdown=False,
+                max_race_time=EXPORT_MAX_RACE_TIME, progress=None):
+    """
+    Simulates one AI race and renders every frame through render_view.
+    Frames go either to frames_dir as numbered PNGs (compressed by a pool of worker
+    processes) or to raw_out as a stream of raw RGB24 frames. Returns a stats dict.
+    """
+    if seed is not None:
+        rng.seed_all(seed)
+    pygame.init()
+    font = pygame.font.Font(None, 30)
+    lap_font = pygame.font.Font(None, 24)
+
+    course = CoursePreparer().finish()
+    fleet = create_ai_fleet(num_boats)
+    place_boats_on_start_grid(fleet)
+    sim = RaceSimulation(fleet, course.course_buoys_coords, course.sandbar_index, laps,
+                         rng.wind.uniform(MIN_WIND_SPEED, MAX_WIND_SPEED), course.wind_direction, navigation=course.navigation,
+                         heightfield=course.heightfield)
+    if skip_countdown:
+        while not sim.racing:
+            sim.step(SIM_TIMESTEP)
+    camera = fleet[follow % len(fleet)]
+
+    width, height = size
+    frame = pygame.Surface(size)
+    wave_layers = [create_wave_layer(width + 100, height // 2 + 100, WAVE_DENSITY, WAVE_LAYER_ALPHA, WAVE_LINE_THICKNESS) for _ in range(NUM_WAVE_LAYERS)]
+    wave_offsets = [[0.0, 0.0] for _ in range(NUM_WAVE_LAYERS)]
+    minimap = Minimap(pygame.Rect(width - MAP_WIDTH - MAP_MARGIN, MAP_MARGIN, MAP_WIDTH, MAP_HEIGHT))
+    frame_dt = 1.0 / fps
+    stepper = FixedTimestep(max_steps=math.ceil(frame_dt / SIM_TIMESTEP) + 1)
+
+    pool = None
+    pending = deque()
+    if frames_dir is not None:
+        os.makedirs(frames_dir, exist_ok=True)
+        workers = workers or os.cpu_count() or 1
+        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+        max_pending = workers * EXPORT_QUEUE_PER_WORKER
+
+    count = 0
+    finished_at = None
+    race_info = {'wind_speed': 0.0, 'wind_dir': 0.0, 'current_race': 1, 'total_races': 1, 'total_laps': laps, 'time': 0.0}
+    fleet_index = None
+    start = time.perf_counter()
+    try:
+        while sim.time < max_race_time:
+            for _ in range(stepper.advance(frame_dt)):
+                sim.step(SIM_TIMESTEP)
+
+            alpha = stepper.alpha
+            race_info['wind_speed'] = sim.wind_speed
+            race_info['wind_dir'] = sim.wind_direction
+            race_info['time'] = sim.time + alpha * SIM_TIMESTEP
+            fleet_index = build_fleet_index(fleet, fleet_index)
+            frame.fill(DARK_BLUE)
+            render_view(frame, camera, [], fleet, course.sandbars, course.buoys, START_FINISH_LINE, course.depth_map,
+                        wave_layers, wave_offsets, sim.wind_direction, frame_dt, font, lap_font, race_info, alpha, QUALITY_LEVELS[0], fleet_index)
+            minimap.draw(frame, 1, camera, fleet, course.sandbar_index, course.buoys, camera.next_buoy_index, START_FINISH_LINE, [])
+            draw_wind_gauge(frame, sim.wind_direction, WIND_GAUGE_POS, WIND_GAUGE_RADIUS, lap_font)
+
+            pixels = pygame.image.tobytes(frame, 'RGB')
+            if pool is not None:
+                path = os.path.join(frames_dir, f"frame_{count:06d}.png")
+                pending.append(pool.submit(_save_png, path, size, pixels))
+                # Bound memory: wait for the oldest frame once the pool is saturated
+                while len(pending) > max_pending:
+                    pending.popleft().result()
+            else:
+                raw_out.write(pixels)
+            count += 1
+            if progress is not None and count % (fps * 10) == 0:
+                progress(count, sim.time, time.perf_counter() - start)
+
+            if finished_at is None and all(boat.is_finished for boat in fleet):
+                finished_at = sim.time
+            if finished_at is not None and sim.time - finished_at >= EXPORT_FINISH_HOLD:
+                break
+        while pending:
+            pending.popleft().result()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    wall = time.perf_counter() - start
+    video_seconds = count / fps
+    return {
+        'frames': count,
+        'video_seconds': video_seconds,
+        'wall_seconds': wall,
+        'speedup': video_seconds / wall if wall > 0 else float('inf'),
+        'all_finished': finished_at is not None,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render an AI race headless to a PNG sequence or a raw RGB24 stream")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--frames', metavar='DIR', help="write frame_000000.png, ... into DIR")
+    target.add_argument('--raw', metavar='FILE', help="write raw RGB24 frames to FILE ('-' for stdout)")
+    parser.add_argument('--size', default=f"{EXPORT_WIDTH}x{EXPORT_HEIGHT}", help="WIDTHxHEIGHT")
+    parser.add_argument('--fps', type=int, default=EXPORT_FPS)
+    parser.add_argument('--laps', type=int, default=1)
+    parser.add_argument('--boats', type=int, default=NUM_AI_BOATS)
+    parser.add_argument('--follow', type=int, default=0, help="index of the boat the camera follows")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None, help="PNG encoder processes (default: CPU count)")
+    parser.add_argument('--skip-countdown', action='store_true')
+    parser.add_argument('--max-race-time', type=float, default=EXPORT_MAX_RACE_TIME)
+    args = parser.parse_args(argv)
+    size = tuple(int(v) for v in args.size.lower().split('x'))
+
+    def report(frames, sim_time, wall):
+        print(f"{frames} frames, race time {format_time(sim_time)}, {frames / args.fps / wall:.1f}x real time", file=sys.stderr)
+
+    raw_out = None
+    stdout = sys.stdout
+    if args.raw == '-':
+        raw_out = stdout.buffer
+        sys.stdout = sys.stderr # Anything printed along the way must not land in the video stream
+    elif args.raw is not None:
+        raw_out = open(args.raw, 'wb')
+    try:
+        stats = export_race(args.frames, raw_out, size, args.fps, args.laps, args.boats, args.follow, args.seed,
+                            args.workers, args.skip_countdown, args.max_race_time, report)
+    finally:
+        sys.stdout = stdout
+        if raw_out is not None and args.raw != '-':
+            raw_out.close()
+        pygame.quit()
+    print(f"Exported {stats['frames']} frames ({format_time(stats['video_seconds'])} of video) "
+          f"in {stats['wall_seconds']:.1f}s, {stats['speedup']:.1f}x real time", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -1,20 +1,20 @@
 # graphics.py
 
 import pygame
-import random
 import math
 
 from constants import *
 from utils import *
+import rng
 
 def create_wave_layer(width, height, density):
     layer = pygame.Surface((width, height), pygame.SRCALPHA)
     layer.fill((0,0,0,0))
     for _ in range(density):
-        x = random.randint(0, width)
-        y = random.randint(0, height)
-        length = random.randint(5, 15)
-        angle = random.uniform(0, 360)
+        x = rng.visual.randint(0, width)
+        y = rng.visual.randint(0, height)
+        length = rng.visual.randint(5, 15)
+        angle = rng.visual.uniform(0, 360)
         end_x = x + math.cos(deg_to_rad(angle)) * length
         end_y = y + math.sin(deg_to_rad(angle)) * length
         pygame.draw.line(layer, (*LIGHT_BLUE, WAVE_LAYER_ALPHA), (x, y), (end_x, end_y), WAVE_LINE_THICKNESS)
@@ -76,6 +76,71 @@ def draw_map(surface, boat, ai_boats, sandbars, buoys, next_buoy_index, start_fi
     map_surface = pygame.Surface(map_rect.size, pygame.SRCALPHA)
     map_surface.fill(MAP_BG_COLOR)
     surface.blit(map_surface, map_rect.topleft)
+    draw_map_contents(surface, boat, ai_boats, sandbars, buoys, next_buoy_index, start_finish_line, map_rect, players)
+
+class Minimap:
+    """
+    A minimap drawn onto its own surface and blitted every frame, so the
+    quality governor can redraw it only every few frames.
+    """
+    def __init__(self, map_rect):
+        self.map_rect = map_rect
+        self.layer = pygame.Surface(map_rect.size, pygame.SRCALPHA)
+        self.local_rect = self.layer.get_rect()
+        self.frames_until_refresh = 0
+
+    def invalidate(self):
+        self.frames_until_refresh = 0
+
+    def draw(self, surface, refresh_interval, boat, ai_boats, sandbars, buoys, next_buoy_index, start_finish_line, players):
+        if self.frames_until_refresh <= 0:
+            self.layer.fill(MAP_BG_COLOR)
+            draw_map_contents(self.layer, boat, ai_boats, sandbars, buoys, next_buoy_index, start_finish_line, self.local_rect, players)
+            self.frames_until_refresh = refresh_interval
+        self.frames_until_refresh -= 1
+        surface.blit(self.layer, self.map_rect.topleft)
+
+class WorldCanvas:
+    """
+    An off-screen surface the world pass is drawn to at scale times the resolution of
+    the view it ends up in, then upscaled into that view (smoothly, or by repeating
+    pixels), so the water, wakes and boats cost fewer pixels while the HUD drawn
+    afterwards stays at native resolution. One canvas serves any number of
+    same-sized views drawn one after another.
+    """
+    def __init__(self, scale=RENDER_SCALE, smooth=RENDER_SMOOTH_UPSCALE):
+        self.scale = scale
+        self.smooth = smooth
+        self.surface = None
+        self.wave_sources = []  # The wave layers the scaled copies were made from
+        self.wave_layers = []
+
+    def begin(self, target):
+        """The surface to draw target's world pass on, cleared to the open-water colour."""
+        size = (max(1, round(target.get_width() * self.scale)), max(1, round(target.get_height() * self.scale)))
+        if self.surface is None or self.surface.get_size() != size:
+            self.surface = pygame.Surface(size, 0, target) # Same pixel format, as smoothscale needs
+        self.surface.fill(DARK_BLUE)
+        return self.surface
+
+    def scaled_wave_layers(self, layers):
+        """layers shrunk to the canvas's scale, made once and kept while the same layers are passed in."""
+        if len(layers) != len(self.wave_sources) or any(a is not b for a, b in zip(layers, self.wave_sources)):
+            self.wave_sources = list(layers)
+            self.wave_layers = [pygame.transform.smoothscale(layer, (max(1, round(layer.get_width() * self.scale)),
+                                                                     max(1, round(layer.get_height() * self.scale))))
+                                for layer in layers]
+        return self.wave_layers
+
+    def present(self, target):
+        """Upscales the finished world pass to fill target."""
+        if self.smooth:
+            pygame.transform.smoothscale(self.surface, target.get_size(), target)
+        else:
+            pygame.transform.scale(self.surface, target.get_size(), target)
+
+def draw_map_contents(surface, boat, ai_boats, sandbars, buoys, next_buoy_index, start_finish_line, map_rect, players):
+    """Draws the minimap's border, course and boats over an already-drawn background."""
     pygame.draw.rect(surface, MAP_BORDER_COLOR, map_rect, 1)
 
     # Start/Finish Line
@@ -127,6 +192,28 @@ def draw_map(surface, boat, ai_boats, sandbars, buoys, next_buoy_index, start_fi
             except ValueError:
                 pygame.draw.circle(surface, p_boat.color, (int(boat_map_x), int(boat_map_y)), 2)
 
+def draw_telemetry_chart(surface, telemetry, boat_index, rect, font):
+    """Draws the last stretch of one boat's speed and sail effectiveness as a scrolling line chart."""
+    chart = pygame.Surface(rect.size, pygame.SRCALPHA)
+    chart.fill(MAP_BG_COLOR)
+    pygame.draw.rect(chart, MAP_BORDER_COLOR, chart.get_rect(), 1)
+    series = (
+        ('speed', MAX_BOAT_SPEED, TELEMETRY_SPEED_COLOR),
+        ('wind_effectiveness', 1.0, TELEMETRY_EFFECTIVENESS_COLOR),
+    )
+    x_step = (rect.width - 2) / max(1, TELEMETRY_CHART_SAMPLES - 1)
+    plot_height = rect.height - 4
+    for field, full_scale, color in series:
+        values = telemetry.recent(field, boat_index, TELEMETRY_CHART_SAMPLES)
+        if len(values) < 2:
+            continue
+        points = [(1 + i * x_step, rect.height - 2 - min(1.0, max(0.0, v / full_scale)) * plot_height)
+                  for i, v in enumerate(values.tolist())]
+        pygame.draw.lines(chart, color, False, points, 1)
+    surface.blit(chart, rect.topleft)
+    label = font.render("speed / sail", True, WHITE)
+    surface.blit(label, (rect.x + 4, rect.y + 2))
+
 def draw_button(surface, rect, text, font, button_color, text_color, hover_color):
     """Draws a simple button and returns True if hovered."""
     mouse_pos = pygame.mouse.get_pos()
@@ -1,16 +1,24 @@
 # main.py
 
+import os
 import pygame
-import random
 import math
+import multiprocessing
 from enum import Enum, auto
 
 from constants import *
 from utils import *
+import rng
 from entities import Boat, Buoy, AIBoat, SailingStyle
-from course import generate_random_buoys, generate_random_sandbars
-from graphics import draw_map, draw_button, draw_wind_gauge
-from terrain import generate_depth_map
+from course import CoursePreparer, start_candidate_pool
+from bundle import CourseCache
+from graphics import Minimap, WorldCanvas, draw_button, draw_wind_gauge, draw_telemetry_chart
+from simulation import RaceSimulation, RaceCompleter, FixedTimestep, place_boats_on_start_grid, load_ai_presets
+from shared_state import SharedRaceState
+from quality import QualityGovernor, QUALITY_LEVELS
+from spatial import build_fleet_index
+from telemetry import TelemetryRecorder
+from snapshot import capture_race, restore_race, restore_course, same_course, save_snapshot, load_snapshot
 
 class GameState(Enum):
     SETUP = auto()
@@ -20,68 +28,72 @@ class GameState(Enum):
     RACE_RESULTS = auto()
     SERIES_END = auto()
 
-def handle_boat_collision(boat1, boat2):
-    dist_sq = distance_sq((boat1.world_x, boat1.world_y), (boat2.world_x, boat2.world_y))
-    min_dist = boat1.collision_radius + boat2.collision_radius
-    if dist_sq < min_dist**2 and dist_sq > 0:
-        dist = math.sqrt(dist_sq)
-        overlap = min_dist - dist
-        
-        dx = boat2.world_x - boat1.world_x
-        dy = boat2.world_y - boat1.world_y
-        
-        if dist == 0:
-            dx, dy, dist = 1, 0, 1
-            
-        nx = dx / dist
-        ny = dy / dist
-
-        # Push boats apart based on overlap
-        boat1.world_x -= nx * overlap * 0.5
-        boat1.world_y -= ny * overlap * 0.5
-        boat2.world_x += nx * overlap * 0.5
-        boat2.world_y += ny * overlap * 0.5
-
-        # Reduce speed of both boats
-        boat1.speed *= BOAT_COLLISION_SPEED_REDUCTION
-        boat2.speed *= BOAT_COLLISION_SPEED_REDUCTION
-
-def render_view(surface, camera_boat, players, ai_boats, sandbars, buoys, start_finish_line, depth_map, wave_layers, wave_offsets, wind_direction, dt, font, lap_font, race_info):
-    """Renders a single player's viewport."""
-    world_offset_x = camera_boat.world_x
-    world_offset_y = camera_boat.world_y
+def render_view(surface, camera_boat, players, ai_boats, sandbars, buoys, start_finish_line, depth_map, wave_layers, wave_offsets, wind_direction, dt, font, lap_font, race_info, alpha=1.0, quality=QUALITY_LEVELS[0], fleet_index=None, canvas=None):
+    """
+    Renders a single player's viewport, with boats blended alpha of the way from the last step to the current one.
+    quality is the QualityLevel deciding how many optional effects get drawn. fleet_index is this
+    frame's build_fleet_index(players + ai_boats); pass it in to share one index between split-screen views.
+    With a WorldCanvas, the world is drawn at the canvas's scale and upscaled; the HUD is always drawn at full size.
+    """
+    view = surface
+    scale = 1.0
+    if canvas is not None:
+        surface = canvas.begin(view)
+        scale = canvas.scale
+        wave_layers = canvas.scaled_wave_layers(wave_layers)
+    world_offset_x, world_offset_y, _ = camera_boat.interpolated_pose(alpha)
     view_center = (surface.get_width() // 2, surface.get_height() // 2)
 
-    area_x = (world_offset_x - view_center[0]) + WORLD_BOUNDS
-    area_y = (world_offset_y - view_center[1]) + WORLD_BOUNDS
-    view_rect_on_depth_map = pygame.Rect(area_x, area_y, surface.get_width(), surface.get_height())
-    surface.blit(depth_map, (0,0), area=view_rect_on_depth_map)
-
-    draw_scrolling_water(surface, wave_layers, wave_offsets, deg_to_rad(wind_direction), dt)
-
-    for boat in players + ai_boats:
-        boat.draw_wake(surface, world_offset_x, world_offset_y, view_center)
+    # Only boats whose hull or wake reaches into the viewport get drawn
+    view_min_x = world_offset_x - view_center[0] / scale - RENDER_CULL_MARGIN
+    view_min_y = world_offset_y - view_center[1] / scale - RENDER_CULL_MARGIN
+    view_max_x = world_offset_x + (surface.get_width() - view_center[0]) / scale + RENDER_CULL_MARGIN
+    view_max_y = world_offset_y + (surface.get_height() - view_center[1]) / scale + RENDER_CULL_MARGIN
+    if fleet_index is None:
+        fleet_index = build_fleet_index(players + ai_boats)
+    visible_boats = fleet_index.query_rect(view_min_x, view_min_y, view_max_x, view_max_y)
+    visible_boats.sort() # (fleet_order, boat) items; the orders are unique, so boats are never compared
+
+    area_x = (world_offset_x - view_center[0] / scale) + WORLD_BOUNDS
+    area_y = (world_offset_y - view_center[1] / scale) + WORLD_BOUNDS
+    depth_map.blit_view(surface, area_x, area_y, scale)
+
+    num_wave_layers = min(quality.wave_layers, len(wave_layers))
+    draw_scrolling_water(surface, wave_layers[:num_wave_layers], wave_offsets[:num_wave_layers], deg_to_rad(wind_direction), dt, scale)
+
+    for _, boat in visible_boats:
+        wake = boat.wake_bounds
+        if wake is not None and wake[0] < view_max_x and wake[2] > view_min_x and wake[1] < view_max_y and wake[3] > view_min_y:
+            boat.draw_wake(surface, world_offset_x, world_offset_y, view_center, quality.wake_stride, scale)
     
-    sf_p1_screen = (int(start_finish_line[0][0] - world_offset_x + view_center[0]), int(start_finish_line[0][1] - world_offset_y + view_center[1]))
-    sf_p2_screen = (int(start_finish_line[1][0] - world_offset_x + view_center[0]), int(start_finish_line[1][1] - world_offset_y + view_center[1]))
-    pygame.draw.line(surface, START_FINISH_LINE_COLOR, sf_p1_screen, sf_p2_screen, START_FINISH_WIDTH)
+    sf_p1_screen = (int((start_finish_line[0][0] - world_offset_x) * scale + view_center[0]), int((start_finish_line[0][1] - world_offset_y) * scale + view_center[1]))
+    sf_p2_screen = (int((start_finish_line[1][0] - world_offset_x) * scale + view_center[0]), int((start_finish_line[1][1] - world_offset_y) * scale + view_center[1]))
+    pygame.draw.line(surface, START_FINISH_LINE_COLOR, sf_p1_screen, sf_p2_screen, max(1, round(START_FINISH_WIDTH * scale)))
 
     num_course_buoys = (len(buoys) - 2)
     course_buoy_list_start_index = 2
     for i, buoy in enumerate(buoys):
         is_next = (camera_boat.race_started and not camera_boat.is_finished and i >= course_buoy_list_start_index and (i - course_buoy_list_start_index) == camera_boat.next_buoy_index)
-        buoy.draw(surface, world_offset_x, world_offset_y, is_next, view_center)
-
-    for boat in players + ai_boats:
-        boat.screen_x = int(boat.world_x - world_offset_x + view_center[0])
-        boat.screen_y = int(boat.world_y - world_offset_y + view_center[1])
-        boat.draw(surface)
-
-    draw_hud(surface, font, lap_font, camera_boat, race_info, num_course_buoys)
+        buoy.draw(surface, world_offset_x, world_offset_y, is_next, view_center, scale)
+
+    detail_dist_sq = quality.detail_distance ** 2 if quality.detail_distance is not None else None
+    for _, boat in visible_boats:
+        hull = boat.hull_bounds()
+        if not (hull[0] < view_max_x and hull[2] > view_min_x and hull[1] < view_max_y and hull[3] > view_min_y):
+            continue # Only its wake is in view
+        boat_x, boat_y, boat_heading = boat.interpolated_pose(alpha)
+        boat.screen_x = int((boat_x - world_offset_x) * scale + view_center[0])
+        boat.screen_y = int((boat_y - world_offset_y) * scale + view_center[1])
+        detailed = detail_dist_sq is None or distance_sq((boat_x, boat_y), (world_offset_x, world_offset_y)) <= detail_dist_sq
+        boat.draw(surface, boat_heading, detailed, scale)
+
+    if canvas is not None:
+        canvas.present(view)
+    draw_hud(view, font, lap_font, camera_boat, race_info, num_course_buoys)
 
 def draw_hud(surface, font, lap_font, boat, race_info, num_course_buoys):
     """Draws the HUD for a single boat on the given surface."""
-    current_time_s = pygame.time.get_ticks() / 1000.0
+    current_time_s = race_info['time']
     
     wind_text = font.render(f"Wind Speed: {race_info['wind_speed']:.1f}", True, WHITE)
     surface.blit(wind_text, (10, surface.get_height() - 85))
@@ -143,7 +155,13 @@ def draw_pause_menu(surface, font):
     draw_button(surface, EXIT_GAME_BUTTON_RECT, "Exit to Desktop", font, BUTTON_COLOR, BUTTON_TEXT_COLOR, BUTTON_HOVER_COLOR)
 
 
-def main():
+def main(driver=None):
+    """
+    Runs the game. A driver (see soak.py) stands in for the player: it's called at the
+    start of every frame with the game state, the race and whether background work is
+    still pending, and posts the events it wants handled. Driven frames aren't capped
+    and always advance one nominal frame of simulation time.
+    """
     pygame.init()
     screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
     pygame.display.set_caption("Dinghy Sailing Race")
@@ -158,20 +176,18 @@ def main():
     player2_boat = Boat(0, 0, name="Player 2", boat_color=PLAYER2_COLOR)
     players = []
     ai_boats = []
-    sandbars = []
-    buoys = []
-    course_buoys_coords = []
-    depth_map_surface = None
+    course = None
+    course_cache = CourseCache() if COURSE_SEEDS and COURSE_CACHE_DIR is not None else None
+    candidate_pool = start_candidate_pool() if COURSE_CANDIDATES > 1 else None # One pool for every course of the session
+
+    def course_preparer_for(race_number, depth_map=None):
+        """Starts preparing the course for a race of the series: the next of COURSE_SEEDS when set, else a random one."""
+        seed = COURSE_SEEDS[(race_number - 1) % len(COURSE_SEEDS)] if COURSE_SEEDS else None
+        return CoursePreparer(depth_map, seed, course_cache, candidate_pool)
+
+    course_preparer = course_preparer_for(1) # Prefetch the first course while the setup screen is up
     course_buoy_list_start_index = 2
     
-    start_button_rect = pygame.Rect(CENTER_X - SETUP_BUTTON_WIDTH // 2, SCREEN_HEIGHT * 0.4, SETUP_BUTTON_WIDTH, SETUP_BUTTON_HEIGHT)
-    p1_button_rect = pygame.Rect(CENTER_X - 120, SCREEN_HEIGHT * 0.2, 100, 40)
-    p2_button_rect = pygame.Rect(CENTER_X + 20, SCREEN_HEIGHT * 0.2, 100, 40)
-    laps_minus_rect = pygame.Rect(CENTER_X - 100, SCREEN_HEIGHT * 0.3, LAP_BUTTON_SIZE, LAP_BUTTON_SIZE)
-    laps_plus_rect = pygame.Rect(CENTER_X - 40, SCREEN_HEIGHT * 0.3, LAP_BUTTON_SIZE, LAP_BUTTON_SIZE)
-    races_minus_rect = pygame.Rect(CENTER_X + 40, SCREEN_HEIGHT * 0.3, LAP_BUTTON_SIZE, LAP_BUTTON_SIZE)
-    races_plus_rect = pygame.Rect(CENTER_X + 100, SCREEN_HEIGHT * 0.3, LAP_BUTTON_SIZE, LAP_BUTTON_SIZE)
-    
     game_state = GameState.SETUP
     num_players = 1
     selected_laps = DEFAULT_RACE_LAPS
@@ -180,14 +196,32 @@ def main():
     total_races = selected_races
     current_race = 0
     race_results = []
-    pre_race_timer = 0.0
     
-    wind_speed = random.uniform(MIN_WIND_SPEED, MAX_WIND_SPEED)
-    wind_direction = random.uniform(0, 360)
-    last_wind_update = pygame.time.get_ticks()
+    wind_speed = rng.wind.uniform(MIN_WIND_SPEED, MAX_WIND_SPEED)
     main_wave_layers = [create_wave_layer(SCREEN_WIDTH + 100, SCREEN_HEIGHT // 2 + 100, WAVE_DENSITY, WAVE_LAYER_ALPHA, WAVE_LINE_THICKNESS) for i in range(NUM_WAVE_LAYERS)]
     wave_offsets = [[0.0, 0.0] for _ in range(NUM_WAVE_LAYERS)]
     all_boats = []
+    sim = None
+    completer = None # Races the AI boats home after the players are done
+    stepper = FixedTimestep()
+    governor = QualityGovernor()
+    minimaps = [Minimap(MAP_RECT_P1), Minimap(MAP_RECT_P2)]
+    world_canvas = WorldCanvas() if RENDER_SCALE != 1 else None # Shared by both split-screen views
+    show_telemetry = TELEMETRY_OVERLAY
+    # Reused from frame to frame so drawing a race doesn't churn out garbage
+    fleet_index = None
+    race_info_pack = {'wind_speed': 0.0, 'wind_dir': 0.0, 'current_race': 0, 'total_races': 0, 'total_laps': 0, 'time': 0.0}
+
+    shared_state = None
+    spectators = []
+    if SHARED_STATE_ENABLED or SPECTATOR_RENDERERS > 0:
+        from spectator import run_spectator
+        shared_state = SharedRaceState.create()
+        spawn = multiprocessing.get_context('spawn')
+        for _ in range(SPECTATOR_RENDERERS):
+            proc = spawn.Process(target=run_spectator, args=(shared_state.name,), daemon=True)
+            proc.start()
+            spectators.append(proc)
     
     def start_new_series():
         nonlocal total_races, total_laps, current_race, all_boats, players
@@ -202,10 +236,12 @@ def main():
 
         ai_boats.clear()
         available_colors = AI_BOAT_COLORS[:]
+        presets = load_ai_presets()
         for i in range(NUM_AI_BOATS):
-            color = random.choice(available_colors) if available_colors else GRAY
+            color = rng.fleet.choice(available_colors) if available_colors else GRAY
             if color in available_colors: available_colors.remove(color)
-            ai_boats.append(AIBoat(0, 0, f"AI {i+1}", random.choice(list(SailingStyle)), color))
+            style = rng.fleet.choice(list(SailingStyle))
+            ai_boats.append(AIBoat(0, 0, f"AI {i+1}", style, color, presets.get(style.name)))
         
         all_boats = players + ai_boats
         for boat in all_boats:
@@ -213,40 +249,106 @@ def main():
         start_new_race()
 
     def start_new_race():
-        nonlocal course_buoys_coords, sandbars, buoys, wind_direction, depth_map_surface, pre_race_timer, game_state
+        nonlocal course, course_preparer, wind_speed, game_state, sim, completer
         print(f"--- Starting Race {current_race}/{total_races} ---")
-        pre_race_timer = 10.0
         game_state = GameState.PRE_RACE
         
-        wind_direction = random.uniform(0, 360)
-        course_buoys_coords = generate_random_buoys(NUM_COURSE_BUOYS)
-        sandbars = generate_random_sandbars(NUM_SANDBARS, course_buoys_coords)
-        depth_map_surface = generate_depth_map(WORLD_BOUNDS * 2, WORLD_BOUNDS * 2, sandbars)
-
-        buoys = []
-        buoys.append(Buoy(START_FINISH_LINE[0][0], START_FINISH_LINE[0][1], -1, is_gate=True))
-        buoys.append(Buoy(START_FINISH_LINE[1][0], START_FINISH_LINE[1][1], -1, is_gate=True))
-        for i, (bx, by) in enumerate(course_buoys_coords):
-            buoys.append(Buoy(bx, by, i))
-
-        for i, boat in enumerate(all_boats):
-            boat.reset_position()
-            start_x = -350 - (i * 35)
-            start_y = random.uniform(-100, 100)
-            boat.world_x, boat.world_y = start_x, start_y
-            boat.last_line_crossing_time = -LINE_CROSSING_DEBOUNCE
-            boat.is_finished = False
-            boat.race_started = False
-            boat.lap_times = []
-            boat.finish_time = 0
-            boat.current_lap = 1
-            boat.next_buoy_index = 0
+        if sim is not None:
+            wind_speed = sim.wind_speed
+        if course_preparer is None:
+            course_preparer = course_preparer_for(current_race)
+        course = course_preparer.finish() # Normally already done in the background
+        course_preparer = None
+        if course.seed is not None:
+            print(f"Course seed {course.seed}")
+        completer = None
+
+        place_boats_on_start_grid(all_boats)
+        telemetry = TelemetryRecorder(all_boats) if TELEMETRY_ENABLED else None
+        sim = RaceSimulation(all_boats, course.course_buoys_coords, course.sandbar_index, total_laps, wind_speed, course.wind_direction,
+                             telemetry=telemetry, navigation=course.navigation, heightfield=course.heightfield)
+        stepper.reset()
+        governor.reset() # Don't judge quality on the frame that finished building the course
+        for minimap in minimaps:
+            minimap.invalidate()
+        if shared_state is not None:
+            shared_state.publish_course(course.course_buoys_coords, course.sandbars,
+                                        course.heightfield.seed if course.heightfield is not None else None)
+
+    def save_race():
+        series = {'current_race': current_race, 'total_races': total_races}
+        print(f"Race saved to {save_snapshot(SNAPSHOT_FILE, capture_race(sim, course, series))}")
+
+    def load_race():
+        nonlocal course, course_preparer, sim, game_state, current_race, total_races, total_laps, num_players, all_boats, player1_boat, player2_boat, completer
+        snapshot = load_snapshot(SNAPSHOT_FILE)
+        depth_map = course.depth_map if course is not None else None
+        # A preparer running on the setup or results screen is drawing the next course into the
+        # current one's depth map, so that chart can't be trusted or reused
+        chart_taken = course_preparer is not None and depth_map is not None
+        if course_preparer is not None:
+            course_preparer.close()
+            course_preparer = None # Restarted for the right race once the loaded one is over
+        if chart_taken or not same_course(snapshot['course'], course):
+            course = restore_course(snapshot['course'], None if chart_taken else depth_map)
+        sim = restore_race(snapshot, course)
+        completer = None
+        if TELEMETRY_ENABLED:
+            sim.telemetry = TelemetryRecorder(sim.boats)
+            sim.telemetry.next_sample_time = sim.time
+        all_boats = sim.boats
+        players[:] = [boat for boat in all_boats if not isinstance(boat, AIBoat)]
+        ai_boats[:] = [boat for boat in all_boats if isinstance(boat, AIBoat)]
+        player1_boat = players[0]
+        if len(players) > 1:
+            player2_boat = players[1]
+        num_players = len(players)
+        current_race = snapshot['extra']['current_race']
+        total_races = snapshot['extra']['total_races']
+        total_laps = sim.total_laps
+        game_state = GameState.RACING if sim.racing else GameState.PRE_RACE
+        stepper.reset()
+        governor.reset()
+        for minimap in minimaps:
+            minimap.invalidate()
+        if shared_state is not None:
+            shared_state.publish_course(course.course_buoys_coords, course.sandbars,
+                                        course.heightfield.seed if course.heightfield is not None else None)
+        print(f"Race loaded from {SNAPSHOT_FILE} at {format_time(sim.time)}")
+
+    def export_telemetry():
+        if sim.telemetry is not None and TELEMETRY_EXPORT_DIR is not None:
+            path = sim.telemetry.export(os.path.join(TELEMETRY_EXPORT_DIR, f"race_{current_race}"))
+            print(f"Telemetry written to {path}")
+
+    def end_race():
+        """Shows the results while the AI boats still out race on to the finish behind them."""
+        nonlocal game_state, completer
+        game_state = GameState.RACE_RESULTS
+        completer = RaceCompleter(sim)
+        update_results()
+
+    def update_results():
+        """Ranks the fleet as it stands; once the race is complete, awards the points."""
+        nonlocal race_results, completer
+        race_results = [{'boat': b, 'time': b.finish_time if b.is_finished else float('inf'), 'laps': b.lap_times} for b in all_boats]
+        race_results.sort(key=lambda x: (x['boat'].is_finished and x['time'] == float('inf'), x['time'])) # Retired boats last
+        if completer.done:
+            for i, result in enumerate(race_results):
+                points = POINTS_AWARDED[i] if i < len(POINTS_AWARDED) else 0
+                result['boat'].score += points
+            export_telemetry()
+            completer = None
     
     running = True
     while running:
-        current_time_s = pygame.time.get_ticks() / 1000.0
-        dt = clock.tick(60) / 1000.0
-        dt = min(dt, 0.1) if game_state != GameState.PAUSED else 0
+        dt = clock.tick(FRAME_RATE_CAP if driver is None else 0) / 1000.0
+        if DETERMINISTIC_SEED is not None or driver is not None:
+            # Every frame is one nominal frame of simulation time, however long it really took
+            dt = 1.0 / FRAME_RATE_CAP if FRAME_RATE_CAP else SIM_TIMESTEP
+        dt = dt if game_state != GameState.PAUSED else 0
+        if driver is not None:
+            driver.frame(game_state, sim, completer is not None or (course_preparer is not None and not course_preparer.done))
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
@@ -256,45 +358,43 @@ def main():
                     if game_state == GameState.RACING or game_state == GameState.PRE_RACE:
                         game_state = GameState.PAUSED
                     elif game_state == GameState.PAUSED:
-                        game_state = GameState.RACING
+                        game_state = GameState.RACING if sim.racing else GameState.PRE_RACE
+                elif event.key == pygame.K_t:
+                    show_telemetry = not show_telemetry
+                elif event.key == pygame.K_F5 and game_state in [GameState.PRE_RACE, GameState.RACING, GameState.PAUSED]:
+                    save_race()
+                elif event.key == pygame.K_F9 and os.path.exists(SNAPSHOT_FILE):
+                    load_race()
 
             if game_state == GameState.SETUP:
-                if not buoys: 
-                    course_buoys_coords = generate_random_buoys(NUM_COURSE_BUOYS)
-                    sandbars = generate_random_sandbars(NUM_SANDBARS, course_buoys_coords)
-                    depth_map_surface = generate_depth_map(WORLD_BOUNDS * 2, WORLD_BOUNDS * 2, sandbars)
-                    buoys = [Buoy(START_FINISH_LINE[0][0], START_FINISH_LINE[0][1], -1, is_gate=True), Buoy(START_FINISH_LINE[1][0], START_FINISH_LINE[1][1], -1, is_gate=True)]
-                    for i, (bx, by) in enumerate(course_buoys_coords): buoys.append(Buoy(bx, by, i))
-
                 if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                    if p1_button_rect.collidepoint(event.pos): num_players = 1
-                    elif p2_button_rect.collidepoint(event.pos): num_players = 2
-                    elif laps_minus_rect.collidepoint(event.pos): selected_laps = max(1, selected_laps - 1)
-                    elif laps_plus_rect.collidepoint(event.pos): selected_laps = min(10, selected_laps + 1)
-                    elif races_minus_rect.collidepoint(event.pos): selected_races = max(1, selected_races - 1)
-                    elif races_plus_rect.collidepoint(event.pos): selected_races = min(10, selected_races + 1)
-                    elif start_button_rect.collidepoint(event.pos):
+                    if ONE_PLAYER_BUTTON_RECT.collidepoint(event.pos): num_players = 1
+                    elif TWO_PLAYER_BUTTON_RECT.collidepoint(event.pos): num_players = 2
+                    elif LAPS_MINUS_BUTTON_RECT.collidepoint(event.pos): selected_laps = max(1, selected_laps - 1)
+                    elif LAPS_PLUS_BUTTON_RECT.collidepoint(event.pos): selected_laps = min(10, selected_laps + 1)
+                    elif RACES_MINUS_BUTTON_RECT.collidepoint(event.pos): selected_races = max(1, selected_races - 1)
+                    elif RACES_PLUS_BUTTON_RECT.collidepoint(event.pos): selected_races = min(10, selected_races + 1)
+                    elif START_SERIES_BUTTON_RECT.collidepoint(event.pos):
                         start_new_series()
             elif game_state == GameState.PAUSED:
                 if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
                     if RESUME_BUTTON_RECT.collidepoint(event.pos):
-                        game_state = GameState.RACING
+                        game_state = GameState.RACING if sim.racing else GameState.PRE_RACE
                     elif RESTART_BUTTON_RECT.collidepoint(event.pos):
                         game_state = GameState.SETUP
-                        buoys.clear()
                     elif FORFEIT_RACE_BUTTON_RECT.collidepoint(event.pos):
                         for p in players:
                             if not p.is_finished:
-                                p.is_finished = True
-                                p.finish_time = float('inf')
-                        game_state = GameState.RACE_RESULTS
+                                sim.progress.retire(p)
+                        end_race()
                     elif EXIT_GAME_BUTTON_RECT.collidepoint(event.pos):
                         running = False
 
             elif game_state in [GameState.RACE_RESULTS, GameState.SERIES_END]:
                  if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
                      if game_state == GameState.RACE_RESULTS:
-                         if MAIN_MENU_BUTTON_RECT.collidepoint(event.pos): 
+                         # Disabled until the fleet is home; the completer races it in a budget per frame
+                         if MAIN_MENU_BUTTON_RECT.collidepoint(event.pos) and completer is None:
                              if current_race < total_races:
                                  current_race += 1
                                  start_new_race()
@@ -303,93 +403,50 @@ def main():
                      elif game_state == GameState.SERIES_END:
                          if MAIN_MENU_BUTTON_RECT.collidepoint(event.pos):
                             game_state = GameState.SETUP
-                            buoys.clear()
                          elif EXIT_END_SCREEN_BUTTON_RECT.collidepoint(event.pos):
                             running = False
 
         if game_state == GameState.RACING or game_state == GameState.PRE_RACE:
-            if game_state == GameState.PRE_RACE:
-                pre_race_timer -= dt
-                if pre_race_timer <= 0:
-                    game_state = GameState.RACING
-                    for boat in all_boats:
-                        boat.race_start_time = current_time_s
-                        boat.lap_start_time = current_time_s
+            keys = pygame.key.get_pressed()
+            for _ in range(stepper.advance(dt)):
+                # Input is sampled once per frame but applied every fixed step
+                trim_per_step = SIM_TIMESTEP * 60
+                if keys[pygame.K_LEFT]: player1_boat.turn(-1)
+                elif keys[pygame.K_RIGHT]: player1_boat.turn(1)
+                if keys[pygame.K_UP]: player1_boat.trim_sail(-trim_per_step)
+                elif keys[pygame.K_DOWN]: player1_boat.trim_sail(trim_per_step)
 
+                if num_players == 2:
+                    if keys[pygame.K_a]: player2_boat.turn(-1)
+                    elif keys[pygame.K_d]: player2_boat.turn(1)
+                    if keys[pygame.K_w]: player2_boat.trim_sail(-trim_per_step)
+                    elif keys[pygame.K_s]: player2_boat.trim_sail(trim_per_step)
 
-            keys = pygame.key.get_pressed()
-            if keys[pygame.K_LEFT]: player1_boat.turn(-1)
-            elif keys[pygame.K_RIGHT]: player1_boat.turn(1)
-            if keys[pygame.K_UP]: player1_boat.trim_sail(-1)
-            elif keys[pygame.K_DOWN]: player1_boat.trim_sail(1)
-            
-            if num_players == 2:
-                if keys[pygame.K_a]: player2_boat.turn(-1)
-                elif keys[pygame.K_d]: player2_boat.turn(1)
-                if keys[pygame.K_w]: player2_boat.trim_sail(-1)
-                elif keys[pygame.K_s]: player2_boat.trim_sail(1)
-
-            current_ticks = pygame.time.get_ticks()
-            if current_ticks - last_wind_update > WIND_UPDATE_INTERVAL:
-                interval_secs = (current_ticks - last_wind_update) / 1000.0
-                speed_change = random.uniform(-WIND_SPEED_CHANGE_RATE, WIND_SPEED_CHANGE_RATE) * interval_secs
-                wind_speed = max(MIN_WIND_SPEED, min(MAX_WIND_SPEED, wind_speed + speed_change))
-                dir_change = random.uniform(-WIND_DIR_CHANGE_RATE, WIND_DIR_CHANGE_RATE) * interval_secs
-                wind_direction = normalize_angle(wind_direction + dir_change)
-                last_wind_update = current_ticks
-
-            for boat in all_boats:
-                if isinstance(boat, AIBoat):
-                    boat.ai_update(wind_speed, wind_direction, course_buoys_coords, START_FINISH_LINE, dt, pre_race_timer)
-                
-                boat.update(wind_speed, wind_direction, dt)
-                
-                boat.on_sandbar = False
-                for sandbar in sandbars:
-                    if boat.get_world_collision_rect().colliderect(sandbar.rect):
-                        boat.on_sandbar = True
-                        break
+                sim.step(SIM_TIMESTEP)
 
-            for i in range(len(all_boats)):
-                for j in range(i + 1, len(all_boats)):
-                    handle_boat_collision(all_boats[i], all_boats[j])
+            if shared_state is not None:
+                shared_state.publish(sim, current_race, total_races)
 
-            if game_state == GameState.RACING:
-                num_course_buoys = len(course_buoys_coords)
-                for boat in all_boats:
-                    if boat.is_finished: continue
-                    boat_pos = (boat.world_x, boat.world_y)
-                    
-                    if boat.race_started and boat.next_buoy_index < num_course_buoys:
-                        current_course_buoy = buoys[course_buoy_list_start_index + boat.next_buoy_index]
-                        if distance_sq(boat_pos, (current_course_buoy.world_x, current_course_buoy.world_y)) < BUOY_ROUNDING_RADIUS**2:
-                            boat.next_buoy_index += 1
-                            if boat.next_buoy_index >= num_course_buoys and boat.current_lap < total_laps:
-                                lap_time = current_time_s - boat.lap_start_time
-                                boat.lap_times.append(lap_time)
-                                boat.current_lap += 1
-                                boat.next_buoy_index = 0
-                                boat.lap_start_time = current_time_s
-                    
-                    if current_time_s - boat.last_line_crossing_time > LINE_CROSSING_DEBOUNCE:
-                        boat_prev_pos = (boat.prev_world_x, boat.prev_world_y)
-                        if check_line_crossing(boat_prev_pos, boat_pos, START_FINISH_LINE[0], START_FINISH_LINE[1]):
-                            boat.last_line_crossing_time = current_time_s
-                            if not boat.race_started:
-                                boat.race_started = True
-                            elif boat.current_lap >= total_laps and boat.next_buoy_index >= num_course_buoys:
-                                if not boat.is_finished:
-                                    boat.is_finished = True
-                                    boat.finish_time = current_time_s - boat.race_start_time
+            if game_state == GameState.PRE_RACE and sim.racing:
+                game_state = GameState.RACING
 
+            if game_state == GameState.RACING:
                 all_players_finished = all(p.is_finished for p in players)
                 if all_players_finished:
-                    game_state = GameState.RACE_RESULTS
-                    race_results = [{'boat': b, 'time': b.finish_time if b.is_finished else float('inf'), 'laps': b.lap_times} for b in all_boats]
-                    race_results.sort(key=lambda x: x['time'])
-                    for i, result in enumerate(race_results):
-                        points = POINTS_AWARDED[i] if i < len(POINTS_AWARDED) else 0
-                        result['boat'].score += points
+                    end_race()
+
+        if completer is not None:
+            completer.advance(RACE_COMPLETION_FRAME_BUDGET)
+            update_results()
+
+        # Prepare the next course in the background while nobody is racing on it
+        if game_state in [GameState.SETUP, GameState.RACE_RESULTS] and course_preparer is None:
+            if game_state == GameState.SETUP or current_race < total_races:
+                # The old course's depth map is no longer shown, so its surface can be reused
+                next_race = 1 if game_state == GameState.SETUP else current_race + 1
+                course_preparer = course_preparer_for(next_race, course.depth_map if course is not None else None)
+        if course_preparer is not None:
+            course_preparer.advance(COURSE_PREP_FRAME_BUDGET)
 
         # =====================================================================================
         # --- DRAWING ---
@@ -401,50 +458,64 @@ def main():
             
             p_title_surf = font.render("Players:", True, WHITE)
             screen.blit(p_title_surf, (CENTER_X - p_title_surf.get_width()//2, SCREEN_HEIGHT * 0.18))
-            draw_button(screen, p1_button_rect, "1 Player", button_font, BUTTON_COLOR if num_players != 1 else BUTTON_HOVER_COLOR, BUTTON_TEXT_COLOR, BUTTON_HOVER_COLOR)
-            draw_button(screen, p2_button_rect, "2 Players", button_font, BUTTON_COLOR if num_players != 2 else BUTTON_HOVER_COLOR, BUTTON_TEXT_COLOR, BUTTON_HOVER_COLOR)
+            draw_button(screen, ONE_PLAYER_BUTTON_RECT, "1 Player", button_font, BUTTON_COLOR if num_players != 1 else BUTTON_HOVER_COLOR, BUTTON_TEXT_COLOR, BUTTON_HOVER_COLOR)
+            draw_button(screen, TWO_PLAYER_BUTTON_RECT, "2 Players", button_font, BUTTON_COLOR if num_players != 2 else BUTTON_HOVER_COLOR, BUTTON_TEXT_COLOR, BUTTON_HOVER_COLOR)
             
             laps_text = f"Laps: {selected_laps}"
             laps_surf = font.render(laps_text, True, WHITE)
             screen.blit(laps_surf, (CENTER_X - 70 - laps_surf.get_width()//2, SCREEN_HEIGHT * 0.28))
-            draw_button(screen, laps_minus_rect, "-", button_font, BUTTON_COLOR, BUTTON_TEXT_COLOR, BUTTON_HOVER_COLOR)
-            draw_button(screen, laps_plus_rect, "+", button_font, BUTTON_COLOR, BUTTON_TEXT_COLOR, BUTTON_HOVER_COLOR)
+            draw_button(screen, LAPS_MINUS_BUTTON_RECT, "-", button_font, BUTTON_COLOR, BUTTON_TEXT_COLOR, BUTTON_HOVER_COLOR)
+            draw_button(screen, LAPS_PLUS_BUTTON_RECT, "+", button_font, BUTTON_COLOR, BUTTON_TEXT_COLOR, BUTTON_HOVER_COLOR)
 
             races_text = f"Races: {selected_races}"
             races_surf = font.render(races_text, True, WHITE)
             screen.blit(races_surf, (CENTER_X + 70 - races_surf.get_width()//2, SCREEN_HEIGHT * 0.28))
-            draw_button(screen, races_minus_rect, "-", button_font, BUTTON_COLOR, BUTTON_TEXT_COLOR, BUTTON_HOVER_COLOR)
-            draw_button(screen, races_plus_rect, "+", button_font, BUTTON_COLOR, BUTTON_TEXT_COLOR, BUTTON_HOVER_COLOR)
+            draw_button(screen, RACES_MINUS_BUTTON_RECT, "-", button_font, BUTTON_COLOR, BUTTON_TEXT_COLOR, BUTTON_HOVER_COLOR)
+            draw_button(screen, RACES_PLUS_BUTTON_RECT, "+", button_font, BUTTON_COLOR, BUTTON_TEXT_COLOR, BUTTON_HOVER_COLOR)
             
-            draw_button(screen, start_button_rect, "Start Series", button_font, BUTTON_COLOR, BUTTON_TEXT_COLOR, BUTTON_HOVER_COLOR)
+            draw_button(screen, START_SERIES_BUTTON_RECT, "Start Series", button_font, BUTTON_COLOR, BUTTON_TEXT_COLOR, BUTTON_HOVER_COLOR)
 
         elif game_state in [GameState.PRE_RACE, GameState.RACING, GameState.PAUSED]:
-            race_info_pack = {
-                'wind_speed': wind_speed, 'wind_dir': wind_direction,
-                'current_race': current_race, 'total_races': total_races,
-                'total_laps': total_laps
-            }
+            if game_state != GameState.PAUSED:
+                governor.record(clock.get_rawtime()) # Work time of the previous frame, without the frame-cap sleep
+            quality = governor.settings
+            fleet_index = build_fleet_index(all_boats, fleet_index)
+            wind_speed, wind_direction = sim.wind_speed, sim.wind_direction
+            alpha = stepper.alpha
+            race_info_pack['wind_speed'] = wind_speed
+            race_info_pack['wind_dir'] = wind_direction
+            race_info_pack['current_race'] = current_race
+            race_info_pack['total_races'] = total_races
+            race_info_pack['total_laps'] = total_laps
+            race_info_pack['time'] = sim.time + alpha * SIM_TIMESTEP
 
             if num_players == 1:
-                render_view(screen, player1_boat, players, ai_boats, sandbars, buoys, START_FINISH_LINE, depth_map_surface, main_wave_layers, wave_offsets, wind_direction, dt, font, lap_font, race_info_pack)
-                draw_map(screen, player1_boat, ai_boats, sandbars, buoys, player1_boat.next_buoy_index, START_FINISH_LINE, MAP_RECT_P1, WORLD_BOUNDS, players)
+                render_view(screen, player1_boat, players, ai_boats, course.sandbars, course.buoys, START_FINISH_LINE, course.depth_map, main_wave_layers, wave_offsets, wind_direction, dt, font, lap_font, race_info_pack, alpha, quality, fleet_index, world_canvas)
+                minimaps[0].draw(screen, quality.map_interval, player1_boat, ai_boats, course.sandbars, course.buoys, player1_boat.next_buoy_index, START_FINISH_LINE, players)
             else:
                 viewport_height = SCREEN_HEIGHT // 2
                 top_viewport = screen.subsurface(pygame.Rect(0, 0, SCREEN_WIDTH, viewport_height))
                 bottom_viewport = screen.subsurface(pygame.Rect(0, viewport_height, SCREEN_WIDTH, viewport_height))
 
-                render_view(top_viewport, player1_boat, players, ai_boats, sandbars, buoys, START_FINISH_LINE, depth_map_surface, main_wave_layers, wave_offsets, wind_direction, dt, font, lap_font, race_info_pack)
-                render_view(bottom_viewport, player2_boat, players, ai_boats, sandbars, buoys, START_FINISH_LINE, depth_map_surface, main_wave_layers, wave_offsets, wind_direction, dt, font, lap_font, race_info_pack)
+                render_view(top_viewport, player1_boat, players, ai_boats, course.sandbars, course.buoys, START_FINISH_LINE, course.depth_map, main_wave_layers, wave_offsets, wind_direction, dt, font, lap_font, race_info_pack, alpha, quality, fleet_index, world_canvas)
+                render_view(bottom_viewport, player2_boat, players, ai_boats, course.sandbars, course.buoys, START_FINISH_LINE, course.depth_map, main_wave_layers, wave_offsets, wind_direction, dt, font, lap_font, race_info_pack, alpha, quality, fleet_index, world_canvas)
 
                 pygame.draw.line(screen, BLACK, (0, viewport_height), (SCREEN_WIDTH, viewport_height), 3)
                 
-                draw_map(screen, player1_boat, ai_boats, sandbars, buoys, player1_boat.next_buoy_index, START_FINISH_LINE, MAP_RECT_P1, WORLD_BOUNDS, players)
-                draw_map(screen, player2_boat, ai_boats, sandbars, buoys, player2_boat.next_buoy_index, START_FINISH_LINE, MAP_RECT_P2, WORLD_BOUNDS, players)
+                minimaps[0].draw(screen, quality.map_interval, player1_boat, ai_boats, course.sandbars, course.buoys, player1_boat.next_buoy_index, START_FINISH_LINE, players)
+                minimaps[1].draw(screen, quality.map_interval, player2_boat, ai_boats, course.sandbars, course.buoys, player2_boat.next_buoy_index, START_FINISH_LINE, players)
 
             draw_wind_gauge(screen, wind_direction, WIND_GAUGE_POS, WIND_GAUGE_RADIUS, lap_font)
 
-            if game_state == GameState.PRE_RACE and pre_race_timer > 0:
-                timer_text = str(math.ceil(pre_race_timer))
+            if show_telemetry and sim.telemetry is not None:
+                view_height = SCREEN_HEIGHT // len(players)
+                for i, player in enumerate(players):
+                    chart_rect = pygame.Rect(MAP_MARGIN, (i + 1) * view_height - TELEMETRY_CHART_HEIGHT - HUD_LINES_HEIGHT,
+                                             TELEMETRY_CHART_WIDTH, TELEMETRY_CHART_HEIGHT)
+                    draw_telemetry_chart(screen, sim.telemetry, all_boats.index(player), chart_rect, lap_font)
+
+            if game_state == GameState.PRE_RACE and sim.pre_race_timer > 0:
+                timer_text = str(math.ceil(sim.pre_race_timer))
                 # Draw black border
                 for dx, dy in [(-2, -2), (2, -2), (-2, 2), (2, 2)]:
                     border_surf = countdown_font.render(timer_text, True, BLACK)
@@ -470,7 +541,11 @@ def main():
                 for i, result in enumerate(race_results):
                     boat, time, laps = result['boat'], result['time'], result['laps']
                     points = POINTS_AWARDED[i] if i < len(POINTS_AWARDED) else 0
-                    rank_surf = lap_font.render(f"{i+1}. {boat.name} - {format_time(time)} (+{points} pts)", True, boat.color)
+                    if boat.is_finished:
+                        rank_text = f"{i+1}. {boat.name} - {format_time(time)} (+{points} pts)"
+                    else: # Still being raced home; finished boats above it can't be overtaken any more
+                        rank_text = f"{i+1}. {boat.name} - racing, lap {boat.current_lap}/{total_laps}"
+                    rank_surf = lap_font.render(rank_text, True, boat.color)
                     screen.blit(rank_surf, (col1_x + 20, y_offset)); y_offset += 25
                     for j, l_time in enumerate(laps):
                         lap_time_surf = lap_font.render(f"    Lap {j+1}: {format_time(l_time)}", True, GRAY)
@@ -484,8 +559,12 @@ def main():
                     rank_surf = lap_font.render(f"{i+1}. {boat.name} - {boat.score} points", True, boat.color)
                     screen.blit(rank_surf, (col2_x + 20, y_offset2)); y_offset2 += 25
                 
-                button_text = "Next Race" if current_race < total_races else "Final Results"
-                draw_button(screen, MAIN_MENU_BUTTON_RECT, button_text, button_font, BUTTON_COLOR, BUTTON_TEXT_COLOR, BUTTON_HOVER_COLOR)
+                if completer is not None:
+                    button_text = f"Finishing... {completer.progress:.0%}" # The list above shows who's still racing
+                    draw_button(screen, MAIN_MENU_BUTTON_RECT, button_text, button_font, BUTTON_DISABLED_COLOR, GRAY, BUTTON_DISABLED_COLOR)
+                else:
+                    button_text = "Next Race" if current_race < total_races else "Final Results"
+                    draw_button(screen, MAIN_MENU_BUTTON_RECT, button_text, button_font, BUTTON_COLOR, BUTTON_TEXT_COLOR, BUTTON_HOVER_COLOR)
             else: # SERIES_END
                 title_surf = title_font.render("Final Series Standings", True, WHITE)
                 screen.blit(title_surf, (CENTER_X - title_surf.get_width()//2, 50))
@@ -500,7 +579,14 @@ def main():
 
         pygame.display.flip()
 
+    if shared_state is not None:
+        shared_state.close()
+        for proc in spectators:
+            proc.join(timeout=2.0)
+    if candidate_pool is not None:
+        candidate_pool.shutdown(cancel_futures=True)
     pygame.quit()
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
     main()
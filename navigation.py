@@ -0,0 +1,171 @@
+# navigation.py
+
+import math
+import heapq
+
+from constants import *
+from utils import *
+from collision import point_in_polygon
+import numpy as np
+
+def _point_segment_distance_sq(px, py, ax, ay, bx, by):
+    """Squared distance from points (px, py) to segments a-b; all arguments broadcast."""
+    ex = bx - ax
+    ey = by - ay
+    length_sq = ex * ex + ey * ey
+    u = ((px - ax) * ex + (py - ay) * ey) / np.where(length_sq > 0, length_sq, 1.0)
+    u = np.clip(u, 0.0, 1.0)
+    dx = px - ax - u * ex
+    dy = py - ay - u * ey
+    return dx * dx + dy * dy
+
+def _cross(ax, ay, bx, by, cx, cy):
+    return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+def segments_clear(ax, ay, bx, by, edges, radius):
+    """
+    For segments from the point (ax, ay) to each of the points (bx, by), whether
+    they stay at least radius away from every edge (an (E, 4) array of x0, y0, x1, y1).
+    Both ends are assumed to be outside the polygons already.
+    """
+    bx = np.asarray(bx, dtype=float)[:, None]
+    by = np.asarray(by, dtype=float)[:, None]
+    x0, y0, x1, y1 = edges[:, 0], edges[:, 1], edges[:, 2], edges[:, 3]
+    # Proper crossings
+    d1 = _cross(x0, y0, x1, y1, ax, ay)
+    d2 = _cross(x0, y0, x1, y1, bx, by)
+    d3 = _cross(ax, ay, bx, by, x0, y0)
+    d4 = _cross(ax, ay, bx, by, x1, y1)
+    crossing = (d1 * d2 < 0) & (d3 * d4 < 0)
+    # Otherwise the closest approach of two segments involves one of the four endpoints
+    dist_sq = np.minimum(
+        np.minimum(_point_segment_distance_sq(ax, ay, x0, y0, x1, y1), _point_segment_distance_sq(bx, by, x0, y0, x1, y1)),
+        np.minimum(_point_segment_distance_sq(x0, y0, ax, ay, bx, by), _point_segment_distance_sq(x1, y1, ax, ay, bx, by)))
+    return ~np.any(crossing | (dist_sq < radius * radius), axis=1)
+
+class NavigationGraph:
+    """
+    Visibility graph around the sandbars of one course. Nodes sit just outside each
+    sandbar's corners; two nodes are linked when a boat could sail straight between
+    them without touching a sandbar. Shortest paths between every pair of marks
+    (the course buoys, then the start/finish line) are worked out once, so an AI
+    boat only has to follow waypoints while racing.
+    """
+    def __init__(self, nodes, neighbours, marks):
+        self.nodes = nodes              # [(x, y)], the marks first
+        self.neighbours = neighbours    # Node index -> [(node index, distance)]
+        self.marks = marks              # Mark index -> node index
+        self.paths = {}                 # (from mark, to mark) -> [(x, y)] waypoints, ending at the to mark
+
+    @property
+    def edge_count(self):
+        return sum(len(links) for links in self.neighbours) // 2
+
+    def path(self, from_mark, to_mark):
+        """Waypoints from one mark to another; a straight line when there is no way round."""
+        waypoints = self.paths.get((from_mark, to_mark))
+        if waypoints is None:
+            waypoints = [self.nodes[self.marks[to_mark]]]
+        return waypoints
+
+    def shortest_from(self, source):
+        """Dijkstra from node source. Returns the predecessor of every reached node."""
+        best = {source: 0.0}
+        previous = {source: None}
+        queue = [(0.0, source)]
+        while queue:
+            dist, node = heapq.heappop(queue)
+            if dist > best[node]:
+                continue
+            for other, length in self.neighbours[node]:
+                candidate = dist + length
+                if candidate < best.get(other, float('inf')):
+                    best[other] = candidate
+                    previous[other] = node
+                    heapq.heappush(queue, (candidate, other))
+        return previous
+
+    def cache_mark_paths(self):
+        for from_mark, source in enumerate(self.marks):
+            previous = self.shortest_from(source)
+            for to_mark, target in enumerate(self.marks):
+                if to_mark == from_mark or target not in previous:
+                    continue
+                waypoints = []
+                node = target
+                while node != source:
+                    waypoints.append(self.nodes[node])
+                    node = previous[node]
+                waypoints.reverse()
+                self.paths[(from_mark, to_mark)] = waypoints
+
+def convex_corners(sandbar, clearance):
+    """
+    The sandbar's convex corners pushed clearance further out from its centre.
+    Shortest paths only ever bend round convex corners, so the others aren't needed.
+    """
+    v = sandbar.vertices
+    points = list(zip(v[0::2], v[1::2]))
+    n = len(points)
+    area = sum(points[i - 1][0] * points[i][1] - points[i][0] * points[i - 1][1] for i in range(n))
+    corners = []
+    for i, (x, y) in enumerate(points):
+        px, py = points[i - 1]
+        nx, ny = points[(i + 1) % n]
+        turn = (x - px) * (ny - y) - (y - py) * (nx - x)
+        if turn * area < 0:
+            continue
+        dx = x - sandbar.world_x
+        dy = y - sandbar.world_y
+        dist = math.hypot(dx, dy) or 1.0
+        scale = (dist + clearance) / dist
+        corners.append((sandbar.world_x + dx * scale, sandbar.world_y + dy * scale))
+    return corners
+
+def build_navigation(sandbars, course_buoys_coords, start_finish_line=START_FINISH_LINE):
+    """Builds the NavigationGraph for a course in one go."""
+    return run_to_completion(build_navigation_steps(sandbars, course_buoys_coords, start_finish_line))
+
+def build_navigation_steps(sandbars, course_buoys_coords, start_finish_line=START_FINISH_LINE):
+    """Generator form of build_navigation: yields between batches of visibility tests, returns the graph."""
+    line_center = ((start_finish_line[0][0] + start_finish_line[1][0]) / 2,
+                   (start_finish_line[0][1] + start_finish_line[1][1]) / 2)
+    marks = [tuple(coords) for coords in course_buoys_coords] + [line_center]
+    edges = []
+    for sandbar in sandbars:
+        v = sandbar.vertices
+        n = len(v)
+        for i in range(0, n, 2):
+            edges.append((v[i - 2], v[i - 1], v[i], v[i + 1]))
+    edges = np.array(edges, dtype=float).reshape(-1, 4)
+    radius = NAV_PATH_CLEARANCE
+    bound = WORLD_BOUNDS - NAV_CORNER_CLEARANCE
+
+    # Corners that are themselves clear of every sandbar and inside the world
+    corners = [p for sandbar in sandbars for p in convex_corners(sandbar, NAV_CORNER_CLEARANCE)
+               if abs(p[0]) < bound and abs(p[1]) < bound
+               and not any(point_in_polygon(p[0], p[1], other.vertices) for other in sandbars)]
+    if corners and len(edges):
+        cx = np.array([p[0] for p in corners])
+        cy = np.array([p[1] for p in corners])
+        near = _point_segment_distance_sq(cx[:, None], cy[:, None], edges[:, 0], edges[:, 1], edges[:, 2], edges[:, 3])
+        corners = [p for p, clear in zip(corners, np.all(near >= radius * radius, axis=1)) if clear]
+    yield
+
+    nodes = marks + corners
+    xs = np.array([p[0] for p in nodes])
+    ys = np.array([p[1] for p in nodes])
+    neighbours = [[] for _ in nodes]
+    for i in range(len(nodes) - 1):
+        others = np.arange(i + 1, len(nodes))
+        clear = segments_clear(xs[i], ys[i], xs[others], ys[others], edges, radius) if len(edges) else np.ones(len(others), bool)
+        for j in others[clear].tolist():
+            length = math.hypot(xs[j] - xs[i], ys[j] - ys[i])
+            neighbours[i].append((j, length))
+            neighbours[j].append((i, length))
+        if i % NAV_NODES_PER_SLICE == 0:
+            yield
+
+    graph = NavigationGraph(nodes, neighbours, list(range(len(marks))))
+    graph.cache_mark_paths()
+    return graph
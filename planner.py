@@ -0,0 +1,208 @@
+# planner.py
+#
+# Rollout planner for AI tactics. Rather than choosing a tack from the angle to the
+# target alone, a planned boat tries a handful of courses (a few headings either side
+# of the direct one, each tack at a couple of angles, tacking partway or not at all)
+# by sailing scratch copies of itself forward with the real Boat physics in the
+# current wind, and steers the course that gained the most ground on average.
+#
+# Rollouts are paid for in boat updates, a fixed number per simulation step shared
+# by the whole fleet: a boat's planning is spread over as many steps as it takes, and
+# boats wait their turn in a queue. Counting updates rather than wall time keeps
+# seeded races reproducible.
+
+import math
+
+from constants import *
+from utils import *
+import rng
+from entities import Boat, AIBoat
+from collision import sweep_boat_sandbars
+
+# What a rollout copies from the boat it plans for
+ROLLOUT_FIELDS = ('world_x', 'world_y', 'heading', 'speed', 'sail_angle_rel', 'on_sandbar', 'shallow_drag',
+                  'style', 'turn_rate_modifier', 'sail_trim_error')
+
+class Plan:
+    """Sail first_heading until switch_time (simulation time), then second_heading."""
+    __slots__ = ('first_heading', 'second_heading', 'switch_time', 'target', 'expires')
+
+    def __init__(self, first_heading, second_heading, switch_time, target, expires):
+        self.first_heading = first_heading
+        self.second_heading = second_heading
+        self.switch_time = switch_time
+        self.target = target
+        self.expires = expires
+
+    def heading_at(self, time):
+        return self.first_heading if time < self.switch_time else self.second_heading
+
+class RolloutJob:
+    """
+    One boat's rollouts in progress, as plain values, so the job can be carried on from
+    where it stopped (by RolloutPlanner.rollouts) after being snapshotted and restored.
+    """
+    __slots__ = ('boat', 'target', 'start_time', 'start_state', 'wind_speed', 'wind_direction', 'courses',
+                 'start_dist', 'scores', 'sample', 'step', 'sample_wind', 'arrived')
+
+    def __init__(self, boat, target, sim):
+        self.boat = boat
+        self.target = target
+        self.start_time = sim.time
+        self.start_state = [getattr(boat, name) for name in ROLLOUT_FIELDS] # The boat sails on while this job runs; every sample starts from here
+        self.wind_speed = sim.wind_speed
+        self.wind_direction = sim.wind_direction
+        self.courses = candidate_courses(boat.world_x, boat.world_y, target, sim.wind_direction)
+        self.start_dist = math.hypot(target[0] - boat.world_x, target[1] - boat.world_y)
+        self.scores = [0.0] * len(self.courses)
+        self.sample = 0          # Samples finished
+        self.step = 0            # Rollout steps into the current sample; 0 until it starts
+        self.sample_wind = None  # The current sample's wind shift, drawn when it starts
+        self.arrived = None      # Per course, when the current sample's rollout got to the target
+
+def candidate_courses(x, y, target, wind_direction):
+    """(first heading, second heading, seconds before switching) for every course worth trying."""
+    direct = normalize_angle(rad_to_deg(math.atan2(target[1] - y, target[0] - x)))
+    wind_angle = abs(angle_difference(direct, wind_direction))
+    courses = []
+    for offset in PLANNER_HEADING_OFFSETS:
+        heading = normalize_angle(direct + offset)
+        if abs(angle_difference(heading, wind_direction)) >= MIN_SAILING_ANGLE:
+            courses.append((heading, heading, math.inf))
+    if wind_angle < MIN_SAILING_ANGLE + PLANNER_TACK_MARGIN:
+        for extra in PLANNER_TACK_ANGLES:
+            port = normalize_angle(wind_direction + MIN_SAILING_ANGLE + extra)
+            starboard = normalize_angle(wind_direction - MIN_SAILING_ANGLE - extra)
+            for first, second in ((port, starboard), (starboard, port)):
+                courses.append((first, first, math.inf))
+                for switch in PLANNER_TACK_TIMES:
+                    courses.append((first, second, switch))
+    return courses
+
+def sail_rollout(boat, heading, wind_speed, wind_direction, dt, sandbar_index, heightfield=None):
+    """One rollout step: steer for heading without overshooting it, trim, move, check the sandbars and depth."""
+    diff = angle_difference(heading, boat.heading)
+    if abs(diff) > 1.0:
+        effectiveness = MIN_TURN_EFFECTIVENESS + (1.0 - MIN_TURN_EFFECTIVENESS) * min(1.0, boat.speed / (MAX_BOAT_SPEED * 0.7))
+        full_turn = BOAT_TURN_SPEED * effectiveness * dt * 60 * boat.turn_rate_modifier
+        boat.turn(math.copysign(boat.turn_rate_modifier * min(1.0, abs(diff) / full_turn), diff))
+    boat.ai_trim_sails(wind_direction, dt)
+    x0, y0 = boat.world_x, boat.world_y
+    boat.update(wind_speed, wind_direction, dt)
+    if sandbar_index is not None:
+        boat.on_sandbar = sweep_boat_sandbars(x0, y0, boat.world_x, boat.world_y, boat.collision_radius, sandbar_index) is not None
+    if heightfield is not None:
+        boat.shallow_drag = heightfield.drag_at(boat.world_x, boat.world_y)
+
+class RolloutPlanner:
+    """
+    Plans headings for AI boats by rollouts. Call advance(sim) once per simulation
+    step to do that step's share of the work; AIBoat.ai_update asks heading_for(),
+    which answers from the boat's current plan and queues it for a new one when due.
+    """
+    def __init__(self, budget=PLANNER_STEP_BUDGET, horizon=PLANNER_HORIZON, rollout_dt=PLANNER_ROLLOUT_DT,
+                 samples=PLANNER_SAMPLES, replan_interval=PLANNER_REPLAN_INTERVAL):
+        self.budget = budget
+        self.rollout_steps = max(1, round(horizon / rollout_dt))
+        self.rollout_dt = rollout_dt
+        self.samples = samples
+        self.replan_interval = replan_interval
+        self.time = 0.0
+        self.plans = {}         # Boat -> the Plan it's steering by
+        self.waiting = {}       # Boat -> its latest target, in the order the boats asked
+        self.job = None         # Generator doing the current boat's rollouts
+        self.job_state = None   # Its RolloutJob
+        self.debt = 0           # Updates the last step overspent, taken off this one's budget
+        self.scratch = []       # Rollout boats, reused
+        self.rollout_updates = 0
+        self.plans_made = 0
+
+    def heading_for(self, boat, target):
+        """The planned heading towards target, or None while the boat has no plan for it yet."""
+        plan = self.plans.get(boat)
+        tolerance_sq = PLANNER_TARGET_TOLERANCE**2
+        current = plan is not None and distance_sq(plan.target, target) <= tolerance_sq
+        if not current or self.time >= plan.expires:
+            self.waiting[boat] = target
+        return plan.heading_at(self.time) if current else None
+
+    def advance(self, sim):
+        """Spends this step's budget of rollout updates on the boats waiting for plans."""
+        self.time = sim.time
+        budget = self.budget - self.debt
+        while budget > 0:
+            if self.job is None:
+                if not self.waiting:
+                    break
+                boat = next(iter(self.waiting))
+                target = self.waiting.pop(boat)
+                if boat.is_finished:
+                    self.plans.pop(boat, None)
+                    continue
+                self.job_state = RolloutJob(boat, target, sim)
+                self.job = self.rollouts(self.job_state, sim)
+            try:
+                budget -= next(self.job)
+            except StopIteration as done:
+                self.plans[self.job_state.boat] = done.value
+                self.plans_made += 1
+                self.job = None
+                self.job_state = None
+        self.rollout_updates += self.budget - self.debt - budget
+        self.debt = max(0, -budget) # Rounds aren't split, so a step can overrun by part of one
+
+    def scratch_boats(self, count):
+        while len(self.scratch) < count:
+            scratch = AIBoat.__new__(AIBoat)
+            Boat.__init__(scratch, 0, 0, name="Rollout") # Only the physics state; AIBoat's own init draws from rng
+            scratch.time_since_last_wake = -math.inf # Never lays a wake, so rollouts leave rng.wake alone
+            self.scratch.append(scratch)
+        return self.scratch[:count]
+
+    def rollouts(self, job, sim):
+        """
+        Generator: sails every candidate course for each sampled wind shift, all candidates
+        in lockstep, yielding the updates spent after each round. Returns the best Plan.
+        Progress is the ground gained on the target; a rollout that gets there counts as
+        having kept up its average rate for the whole horizon. All its progress is kept in
+        job, so a new generator over the same job (and scratch boats) carries on exactly.
+        """
+        target = job.target
+        courses = job.courses
+        arrive_sq = NAV_WAYPOINT_RADIUS**2
+        dt = self.rollout_dt
+        horizon = self.rollout_steps * dt
+        boats = self.scratch_boats(len(courses))
+        while job.sample < self.samples:
+            if job.step == 0:
+                job.sample_wind = normalize_angle(job.wind_direction + rng.planner.uniform(-PLANNER_WIND_NOISE, PLANNER_WIND_NOISE))
+                job.arrived = [None] * len(courses)
+                for scratch in boats:
+                    for name, value in zip(ROLLOUT_FIELDS, job.start_state):
+                        setattr(scratch, name, value)
+            arrived = job.arrived
+            while job.step < self.rollout_steps:
+                t = job.step * dt
+                job.step += 1
+                sailing = 0
+                for c, (first, second, switch) in enumerate(courses):
+                    if arrived[c] is not None:
+                        continue
+                    scratch = boats[c]
+                    sail_rollout(scratch, first if t < switch else second, job.wind_speed, job.sample_wind, dt, sim.sandbar_index, sim.heightfield)
+                    if (target[0] - scratch.world_x)**2 + (target[1] - scratch.world_y)**2 <= arrive_sq:
+                        arrived[c] = t + dt
+                    sailing += 1
+                if not sailing:
+                    break
+                yield sailing
+            for c, scratch in enumerate(boats):
+                if arrived[c] is not None:
+                    job.scores[c] += job.start_dist * horizon / arrived[c]
+                else:
+                    job.scores[c] += job.start_dist - math.hypot(target[0] - scratch.world_x, target[1] - scratch.world_y)
+            job.sample += 1
+            job.step = 0
+        best = max(range(len(courses)), key=job.scores.__getitem__)
+        first, second, switch = courses[best]
+        return Plan(first, second, job.start_time + switch, target, job.start_time + self.replan_interval)
@@ -0,0 +1,87 @@
+# quality.py
+
+from constants import *
+
+class QualityLevel:
+    """One step on the quality ladder: how much of each optional effect to draw."""
+    def __init__(self, name, wave_layers, wake_stride, detail_distance, map_interval):
+        self.name = name
+        self.wave_layers = wave_layers          # Scrolling wave layers drawn over the water
+        self.wake_stride = wake_stride          # Draw every Nth wake particle
+        self.detail_distance = detail_distance  # Boats further than this from the camera get the simple hull (None = never)
+        self.map_interval = map_interval        # Frames between minimap redraws
+
+    def __repr__(self):
+        return f"QualityLevel({self.name!r})"
+
+# Ordered best first; the governor walks down this list when frames run long
+QUALITY_LEVELS = (
+    QualityLevel("high", NUM_WAVE_LAYERS, 1, None, 1),
+    QualityLevel("medium", 2, 1, 900, 2),
+    QualityLevel("low", 1, 2, 500, 4),
+    QualityLevel("minimal", 0, 3, 250, 8),
+)
+
+class QualityGovernor:
+    """
+    Watches how long each frame's work takes and steps the quality level up or
+    down to stay inside the frame budget. Decisions are made once per window of
+    frames on the window's median, so a single hitch doesn't cost quality.
+    """
+    def __init__(self, budget_ms=QUALITY_FRAME_BUDGET_MS, levels=QUALITY_LEVELS, window=QUALITY_WINDOW_FRAMES, enabled=QUALITY_GOVERNOR_ENABLED):
+        self.budget_ms = budget_ms
+        self.levels = levels
+        self.window = window
+        self.enabled = enabled
+        self.level = 0
+        self.samples = []
+        self.frame_ms = 0.0
+        self.headroom_windows = 0
+        self.changes = 0
+
+    @property
+    def settings(self):
+        return self.levels[self.level]
+
+    def record(self, work_ms):
+        """Adds one frame's work time (excluding any frame-cap sleep). Returns True if the level changed."""
+        if not self.enabled:
+            return False
+        self.samples.append(work_ms)
+        if len(self.samples) < self.window:
+            return False
+        self.samples.sort()
+        self.frame_ms = self.samples[len(self.samples) // 2]
+        self.samples.clear()
+
+        if self.frame_ms > self.budget_ms * QUALITY_DOWNGRADE_RATIO and self.level < len(self.levels) - 1:
+            self.level += 1
+            self.headroom_windows = 0
+            self.changes += 1
+            return True
+        if self.frame_ms < self.budget_ms * QUALITY_UPGRADE_RATIO and self.level > 0:
+            # Climb back only after sustained headroom, so we don't flap between two levels
+            self.headroom_windows += 1
+            if self.headroom_windows >= QUALITY_UPGRADE_WINDOWS:
+                self.level -= 1
+                self.headroom_windows = 0
+                self.changes += 1
+                return True
+        else:
+            self.headroom_windows = 0
+        return False
+
+    def reset(self):
+        """Forgets partial measurements, e.g. after a loading hitch or a pause."""
+        self.samples.clear()
+        self.headroom_windows = 0
+
+    def stats(self):
+        """Current state for telemetry and debug overlays."""
+        return {
+            'quality_level': self.level,
+            'quality_name': self.settings.name,
+            'frame_ms': self.frame_ms,
+            'budget_ms': self.budget_ms,
+            'quality_changes': self.changes,
+        }
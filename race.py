@@ -0,0 +1,157 @@
+# race.py
+
+import numpy as np
+
+from constants import *
+
+RACE_EVENT_START = "start"
+RACE_EVENT_BUOY = "buoy"
+RACE_EVENT_LAP = "lap"
+RACE_EVENT_FINISH = "finish"
+
+class RaceEvent:
+    """A single progress event for one boat, timed to the moment of crossing."""
+    def __init__(self, kind, boat, time, value=None):
+        self.kind = kind
+        self.boat = boat
+        self.time = time
+        self.value = value
+
+    def __repr__(self):
+        return f"RaceEvent({self.kind!r}, {self.boat.name!r}, {self.time:.3f}, {self.value!r})"
+
+def circle_entry_fraction(p0, d, centers, radius):
+    """
+    For moves p0 -> p0 + d (arrays of shape (n, 2)), the fraction along each move where it
+    first enters the circle of radius around its center: 0 if it starts inside, nan if it never does.
+    """
+    rel = p0 - centers
+    a = np.einsum('ij,ij->i', d, d)
+    b = 2.0 * np.einsum('ij,ij->i', d, rel)
+    c = np.einsum('ij,ij->i', rel, rel) - radius**2
+    disc = b * b - 4.0 * a * c
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = (-b - np.sqrt(np.maximum(disc, 0.0))) / (2.0 * a)
+    s = np.where(c < 0, 0.0, s)
+    hit = (c < 0) | ((a > 0) & (disc >= 0) & (s >= 0) & (s <= 1))
+    return np.where(hit, s, np.nan)
+
+def segment_crossing_fraction(p0, d, line_p1, line_vec):
+    """For moves p0 -> p0 + d, the fraction along each move where it crosses the segment line_p1 -> line_p1 + line_vec (nan if it doesn't)."""
+    denom = d[:, 0] * line_vec[1] - d[:, 1] * line_vec[0]
+    w = line_p1 - p0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (w[:, 0] * line_vec[1] - w[:, 1] * line_vec[0]) / denom
+        u = (w[:, 0] * d[:, 1] - w[:, 1] * d[:, 0]) / denom
+    hit = (np.abs(denom) > 1e-9) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+    return np.where(hit, t, np.nan)
+
+class RaceProgress:
+    """
+    Batched buoy-rounding and start/finish detection for the whole fleet.
+    Progress lives in arrays; Boat attributes are written back only when an event fires.
+    """
+    def __init__(self, boats, course_buoys_coords, total_laps, start_finish_line=START_FINISH_LINE):
+        self.boats = list(boats)
+        self.total_laps = total_laps
+        self.num_buoys = len(course_buoys_coords)
+        self.buoys = np.array(course_buoys_coords, dtype=np.float64).reshape(-1, 2)
+        self.line_p1 = np.array(start_finish_line[0], dtype=np.float64)
+        self.line_vec = np.array(start_finish_line[1], dtype=np.float64) - self.line_p1
+
+        n = len(self.boats)
+        self.positions = np.zeros((n, 4))
+        self.next_buoy = np.array([b.next_buoy_index for b in self.boats], dtype=np.int64)
+        self.lap = np.array([b.current_lap for b in self.boats], dtype=np.int64)
+        self.started = np.array([b.race_started for b in self.boats], dtype=bool)
+        self.finished = np.array([b.is_finished for b in self.boats], dtype=bool)
+        self.last_crossing = np.array([b.last_line_crossing_time for b in self.boats], dtype=np.float64)
+        self.lap_start = np.array([b.lap_start_time for b in self.boats], dtype=np.float64)
+        self.race_start = np.array([b.race_start_time for b in self.boats], dtype=np.float64)
+
+    def start(self, time):
+        """Fires the starting gun: every boat's race and first lap clocks start at time."""
+        self.race_start[:] = time
+        self.lap_start[:] = time
+        for boat in self.boats:
+            boat.race_start_time = time
+            boat.lap_start_time = time
+
+    def _gather_positions(self):
+        for i, boat in enumerate(self.boats):
+            row = self.positions[i]
+            row[0] = boat.prev_world_x
+            row[1] = boat.prev_world_y
+            row[2] = boat.world_x
+            row[3] = boat.world_y
+
+    def _buoy_entry_fraction(self, p0, d, active):
+        """Fraction along each boat's step where it first enters its next buoy's rounding circle (nan if it doesn't)."""
+        entry = np.full(len(self.boats), np.nan)
+        if self.num_buoys == 0 or not active.any():
+            return entry
+        idx = np.flatnonzero(active)
+        entry[idx] = circle_entry_fraction(p0[idx], d[idx], self.buoys[self.next_buoy[idx]], BUOY_ROUNDING_RADIUS)
+        return entry
+
+    def _line_crossing_fraction(self, p0, d):
+        """Fraction along each boat's step where it crosses the start/finish segment (nan if it doesn't)."""
+        return segment_crossing_fraction(p0, d, self.line_p1, self.line_vec)
+
+    def retire(self, boat):
+        """Takes boat out of the race unfinished: done, with an infinite time, and never timed across the line."""
+        self.finished[self.boats.index(boat)] = True
+        boat.is_finished = True
+        boat.finish_time = float('inf')
+
+    def update(self, prev_time, time):
+        """
+        Advances progress for a step from prev_time to time using each boat's
+        prev/current position. Returns the RaceEvents fired, in time order.
+        """
+        self._gather_positions()
+        p0 = self.positions[:, 0:2]
+        d = self.positions[:, 2:4] - p0
+        span = time - prev_time
+        events = []
+
+        # Buoy rounding
+        rounding = self.started & ~self.finished & (self.next_buoy < self.num_buoys)
+        entry = self._buoy_entry_fraction(p0, d, rounding)
+        for i in np.flatnonzero(~np.isnan(entry)):
+            boat = self.boats[i]
+            t_hit = float(prev_time + entry[i] * span)
+            self.next_buoy[i] += 1
+            events.append(RaceEvent(RACE_EVENT_BUOY, boat, t_hit, int(self.next_buoy[i]) - 1))
+            if self.next_buoy[i] >= self.num_buoys and self.lap[i] < self.total_laps:
+                lap_time = t_hit - float(self.lap_start[i])
+                boat.lap_times.append(lap_time)
+                events.append(RaceEvent(RACE_EVENT_LAP, boat, t_hit, lap_time))
+                self.lap[i] += 1
+                self.next_buoy[i] = 0
+                self.lap_start[i] = t_hit
+                boat.current_lap = int(self.lap[i])
+                boat.lap_start_time = t_hit
+            boat.next_buoy_index = int(self.next_buoy[i])
+
+        # Start/finish line
+        crossing = self._line_crossing_fraction(p0, d)
+        t_cross = prev_time + crossing * span
+        crossed = ~self.finished & ~np.isnan(crossing) & (t_cross - self.last_crossing > LINE_CROSSING_DEBOUNCE)
+        for i in np.flatnonzero(crossed):
+            boat = self.boats[i]
+            t_hit = float(t_cross[i])
+            self.last_crossing[i] = t_hit
+            boat.last_line_crossing_time = t_hit
+            if not self.started[i]:
+                self.started[i] = True
+                boat.race_started = True
+                events.append(RaceEvent(RACE_EVENT_START, boat, t_hit))
+            elif self.lap[i] >= self.total_laps and self.next_buoy[i] >= self.num_buoys:
+                self.finished[i] = True
+                boat.is_finished = True
+                boat.finish_time = t_hit - float(self.race_start[i])
+                events.append(RaceEvent(RACE_EVENT_FINISH, boat, t_hit, boat.finish_time))
+
+        events.sort(key=lambda e: e.time)
+        return events
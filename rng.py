@@ -0,0 +1,42 @@
+# rng.py
+#
+# Named random streams, one per subsystem. Drawing extra numbers in one of them
+# (another wake particle, a re-rolled sandbar) never shifts what the others see,
+# so two runs from the same seed stay comparable while the code changes around them.
+
+import random
+
+from constants import *
+
+course = random.Random()    # Buoy placement, sandbar positions and outlines, race wind direction
+terrain = random.Random()   # Heightfield noise seeds (bottom and shoals)
+wind = random.Random()      # Starting wind speed and its gusts and shifts during a race
+fleet = random.Random()     # AI styles and colours, start-grid positions
+ai = random.Random()        # AI decisions while racing
+wake = random.Random()      # Wake particle jitter
+visual = random.Random()    # Wave texture and other purely cosmetic noise
+planner = random.Random()   # Wind shifts sampled by the AI rollout planner
+
+STREAMS = {'course': course, 'terrain': terrain, 'wind': wind, 'fleet': fleet, 'ai': ai, 'wake': wake, 'visual': visual,
+           'planner': planner}
+
+def seed_all(seed=None):
+    """
+    Seeds every stream from one seed. Each stream gets its own string seed
+    ("<seed>/<name>"), which Python hashes the same way in every process.
+    The global random module is seeded with seed too, for tools that draw from it
+    directly. None reseeds everything from system entropy.
+    """
+    random.seed(seed)
+    for name, stream in STREAMS.items():
+        stream.seed(None if seed is None else f"{seed}/{name}")
+
+def get_state():
+    """Every stream's internal state, e.g. for a race snapshot. Put it back with set_state."""
+    return {name: stream.getstate() for name, stream in STREAMS.items()}
+
+def set_state(state):
+    for name, stream_state in state.items():
+        STREAMS[name].setstate(stream_state)
+
+seed_all(DETERMINISTIC_SEED)
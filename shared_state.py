@@ -0,0 +1,245 @@
+# shared_state.py
+
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from constants import *
+
+# Header slots (int64)
+_HDR_MAGIC = 0
+_HDR_SEQ = 1          # Bumped after every fleet publish
+_HDR_ACTIVE = 2       # Which fleet buffer (0 or 1) holds the latest complete snapshot
+_HDR_NUM_BOATS = 3    # Also in each buffer's race row, which is what readers use
+_HDR_COURSE_SEQ = 4   # Odd while the course is being rewritten, even when stable
+_HDR_NUM_BUOYS = 5
+_HDR_NUM_SANDBARS = 6
+_HDR_CLOSED = 7
+_HDR_TERRAIN_SEED = 8 # The heightfield's seed, so readers rebuild the same bottom; -1 if there isn't one
+_HDR_FLEET_SEQ = 9    # Two slots, one per fleet buffer: odd while that buffer is being written, even when stable
+_HDR_SIZE = 11
+_MAGIC = 0x5341494C  # "SAIL"
+
+# Per-boat columns in a fleet buffer
+BOAT_FIELDS = (
+    'world_x', 'world_y', 'heading', 'speed', 'sail_angle_rel', 'visual_sail_angle_rel',
+    'wind_effectiveness', 'optimal_sail_trim', 'color_r', 'color_g', 'color_b',
+    'current_lap', 'next_buoy_index', 'race_started', 'is_finished', 'finish_time',
+    'race_start_time', 'lap_start_time',
+)
+_COL = {name: i for i, name in enumerate(BOAT_FIELDS)}
+# Race-wide scalars stored after the boat rows
+RACE_FIELDS = ('time', 'wind_speed', 'wind_direction', 'pre_race_timer', 'total_laps', 'current_race', 'total_races', 'num_boats')
+
+class SharedRaceState:
+    """
+    Double-buffered race state in multiprocessing shared memory.
+    The simulation owns it and publishes; any number of renderer processes attach and read.
+    """
+    def __init__(self, shm, owner, max_boats=MAX_SHARED_BOATS, max_buoys=MAX_SHARED_BUOYS,
+                 max_sandbars=MAX_SHARED_SANDBARS, max_vertices=MAX_SHARED_SANDBAR_VERTICES):
+        self.shm = shm
+        self.owner = owner
+        self.max_boats = max_boats
+        self.max_buoys = max_buoys
+        self.max_sandbars = max_sandbars
+        self.max_vertices = max_vertices
+
+        buf = shm.buf
+        offset = 0
+        self.header = np.ndarray((_HDR_SIZE,), dtype=np.int64, buffer=buf, offset=offset)
+        offset += self.header.nbytes
+        fleet_rows = max_boats + 1  # last row carries RACE_FIELDS
+        self.fleet = np.ndarray((2, fleet_rows, len(BOAT_FIELDS)), dtype=np.float64, buffer=buf, offset=offset)
+        offset += self.fleet.nbytes
+        self.buoys = np.ndarray((max_buoys, 2), dtype=np.float64, buffer=buf, offset=offset)
+        offset += self.buoys.nbytes
+        self.sandbar_offsets = np.ndarray((max_sandbars + 1,), dtype=np.int64, buffer=buf, offset=offset)
+        offset += self.sandbar_offsets.nbytes
+        self.sandbar_vertices = np.ndarray((max_vertices, 2), dtype=np.float64, buffer=buf, offset=offset)
+
+    @staticmethod
+    def required_size(max_boats=MAX_SHARED_BOATS, max_buoys=MAX_SHARED_BUOYS,
+                      max_sandbars=MAX_SHARED_SANDBARS, max_vertices=MAX_SHARED_SANDBAR_VERTICES):
+        return (8 * _HDR_SIZE + 8 * 2 * (max_boats + 1) * len(BOAT_FIELDS) + 8 * max_buoys * 2
+                + 8 * (max_sandbars + 1) + 8 * max_vertices * 2)
+
+    @classmethod
+    def create(cls, name=SHARED_STATE_NAME):
+        """Creates (or takes over a stale) shared block for the simulation to publish into."""
+        size = cls.required_size()
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        state = cls(shm, owner=True)
+        state.header[:] = 0
+        state.header[_HDR_MAGIC] = _MAGIC
+        return state
+
+    @classmethod
+    def attach(cls, name=SHARED_STATE_NAME):
+        """Attaches a reader to a block created by a running race."""
+        shm = shared_memory.SharedMemory(name=name)
+        # Readers must not let their resource tracker unlink the race's block when they exit
+        try:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+        state = cls(shm, owner=False)
+        if state.header[_HDR_MAGIC] != _MAGIC:
+            state.close()
+            raise ValueError(f"Shared memory block '{name}' is not a race state")
+        return state
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def closed(self):
+        return bool(self.header[_HDR_CLOSED])
+
+    def close(self):
+        if self.owner:
+            self.header[_HDR_CLOSED] = 1
+        # Views into the buffer must be released before the mapping can close
+        del self.header, self.fleet, self.buoys, self.sandbar_offsets, self.sandbar_vertices
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    # --- Writer side ---
+
+    def publish_course(self, course_buoys_coords, sandbars, terrain_seed=None):
+        """Writes buoy positions, sandbar outlines and the heightfield's seed. Called once per course."""
+        self.header[_HDR_COURSE_SEQ] += 1  # odd: readers back off
+        num_buoys = min(len(course_buoys_coords), self.max_buoys)
+        self.buoys[:num_buoys] = course_buoys_coords[:num_buoys]
+        vertex_count = 0
+        num_sandbars = 0
+        for sandbar in sandbars[:self.max_sandbars]:
+            count = len(sandbar.vertices) // 2
+            if vertex_count + count > self.max_vertices:
+                break
+            self.sandbar_offsets[num_sandbars] = vertex_count
+            self.sandbar_vertices[vertex_count:vertex_count + count] = np.frombuffer(sandbar.vertices, dtype=np.float64).reshape(count, 2)
+            vertex_count += count
+            num_sandbars += 1
+        self.sandbar_offsets[num_sandbars] = vertex_count
+        self.header[_HDR_NUM_BUOYS] = num_buoys
+        self.header[_HDR_NUM_SANDBARS] = num_sandbars
+        self.header[_HDR_TERRAIN_SEED] = -1 if terrain_seed is None else terrain_seed
+        self.header[_HDR_COURSE_SEQ] += 1
+
+    def publish(self, sim, current_race=0, total_races=0):
+        """Writes the fleet and race scalars into the back buffer, then flips it to the front."""
+        back = 1 - int(self.header[_HDR_ACTIVE])
+        self.header[_HDR_FLEET_SEQ + back] += 1  # odd: a reader still copying this buffer will retry
+        rows = self.fleet[back]
+        boats = sim.boats[:self.max_boats]
+        for i, boat in enumerate(boats):
+            row = rows[i]
+            row[0] = boat.world_x
+            row[1] = boat.world_y
+            row[2] = boat.heading
+            row[3] = boat.speed
+            row[4] = boat.sail_angle_rel
+            row[5] = boat.visual_sail_angle_rel
+            row[6] = boat.wind_effectiveness
+            row[7] = boat.optimal_sail_trim
+            row[8] = boat.color[0]
+            row[9] = boat.color[1]
+            row[10] = boat.color[2]
+            row[11] = boat.current_lap
+            row[12] = boat.next_buoy_index
+            row[13] = boat.race_started
+            row[14] = boat.is_finished
+            row[15] = boat.finish_time
+            row[16] = boat.race_start_time
+            row[17] = boat.lap_start_time
+        race_row = rows[self.max_boats]
+        race_row[0] = sim.time
+        race_row[1] = sim.wind_speed
+        race_row[2] = sim.wind_direction
+        race_row[3] = sim.pre_race_timer
+        race_row[4] = sim.total_laps
+        race_row[5] = current_race
+        race_row[6] = total_races
+        race_row[7] = len(boats)
+        self.header[_HDR_FLEET_SEQ + back] += 1
+        self.header[_HDR_NUM_BOATS] = len(boats)
+        self.header[_HDR_ACTIVE] = back
+        self.header[_HDR_SEQ] += 1
+
+    # --- Reader side ---
+
+    def new_fleet_buffer(self):
+        """Allocates a private buffer that read_fleet can copy snapshots into."""
+        return np.empty_like(self.fleet[0])
+
+    def read_fleet(self, out=None):
+        """
+        Copies the latest complete fleet snapshot into out (allocated if None).
+        Returns (seq, boat_rows, race_row), or None if nothing consistent could be read.
+        """
+        if out is None:
+            out = self.new_fleet_buffer()
+        for _ in range(SHARED_STATE_READ_RETRIES):
+            seq = int(self.header[_HDR_SEQ])
+            if seq == 0:
+                return None
+            active = int(self.header[_HDR_ACTIVE])
+            buffer_seq = int(self.header[_HDR_FLEET_SEQ + active])
+            if buffer_seq % 2:
+                continue
+            np.copyto(out, self.fleet[active])
+            # The writer may have flipped and started rewriting this buffer while we copied it
+            if int(self.header[_HDR_FLEET_SEQ + active]) == buffer_seq:
+                race_row = out[self.max_boats]
+                return seq, out[:int(race_row[7])], race_row
+        return None
+
+    def course_version(self):
+        return int(self.header[_HDR_COURSE_SEQ])
+
+    def read_course(self):
+        """
+        Returns (version, buoy_coords, sandbar_polygons, terrain_seed) or None while the
+        course is being rewritten. terrain_seed is None if the writer didn't publish one.
+        """
+        version = self.course_version()
+        if version == 0 or version % 2:
+            return None
+        num_buoys = int(self.header[_HDR_NUM_BUOYS])
+        num_sandbars = int(self.header[_HDR_NUM_SANDBARS])
+        buoys = [tuple(p) for p in self.buoys[:num_buoys].tolist()]
+        offsets = self.sandbar_offsets[:num_sandbars + 1].tolist()
+        vertices = self.sandbar_vertices[:offsets[-1]].tolist()
+        polygons = [[tuple(p) for p in vertices[offsets[i]:offsets[i + 1]]] for i in range(num_sandbars)]
+        terrain_seed = int(self.header[_HDR_TERRAIN_SEED])
+        if self.course_version() != version:
+            return None
+        return version, buoys, polygons, (None if terrain_seed < 0 else terrain_seed)
+
+def apply_boat_row(boat, row):
+    """Copies one published fleet row onto a Boat used only for drawing."""
+    boat.world_x = row[_COL['world_x']]
+    boat.world_y = row[_COL['world_y']]
+    boat.heading = row[_COL['heading']]
+    boat.speed = row[_COL['speed']]
+    boat.sail_angle_rel = row[_COL['sail_angle_rel']]
+    boat.visual_sail_angle_rel = row[_COL['visual_sail_angle_rel']]
+    boat.wind_effectiveness = row[_COL['wind_effectiveness']]
+    boat.optimal_sail_trim = row[_COL['optimal_sail_trim']]
+    boat.color = (int(row[_COL['color_r']]), int(row[_COL['color_g']]), int(row[_COL['color_b']]))
+    boat.current_lap = int(row[_COL['current_lap']])
+    boat.next_buoy_index = int(row[_COL['next_buoy_index']])
+    boat.race_started = bool(row[_COL['race_started']])
+    boat.is_finished = bool(row[_COL['is_finished']])
+    boat.finish_time = row[_COL['finish_time']]
+    boat.race_start_time = row[_COL['race_start_time']]
+    boat.lap_start_time = row[_COL['lap_start_time']]
@@ -0,0 +1,295 @@
+# simulation.py
+
+import os
+import math
+import json
+import time
+
+from constants import *
+from utils import *
+import rng
+from entities import AIBoat, SailingStyle
+from race import RaceProgress
+from collision import sweep_circles, sweep_circle_circle, sweep_boat_sandbars, slide_off_circle
+from planner import RolloutPlanner
+
+def handle_boat_collision(boat1, boat2):
+    dist_sq = distance_sq((boat1.world_x, boat1.world_y), (boat2.world_x, boat2.world_y))
+    min_dist = boat1.collision_radius + boat2.collision_radius
+    if dist_sq < min_dist**2 and dist_sq > 0:
+        dist = math.sqrt(dist_sq)
+        overlap = min_dist - dist
+
+        dx = boat2.world_x - boat1.world_x
+        dy = boat2.world_y - boat1.world_y
+
+        if dist == 0:
+            dx, dy, dist = 1, 0, 1
+
+        nx = dx / dist
+        ny = dy / dist
+
+        # Push boats apart based on overlap
+        boat1.world_x -= nx * overlap * 0.5
+        boat1.world_y -= ny * overlap * 0.5
+        boat2.world_x += nx * overlap * 0.5
+        boat2.world_y += ny * overlap * 0.5
+
+        # Reduce speed of both boats
+        boat1.speed *= BOAT_COLLISION_SPEED_REDUCTION
+        boat2.speed *= BOAT_COLLISION_SPEED_REDUCTION
+
+def sweep_boat_collision(boat1, boat2, start1, start2):
+    """
+    Catches a pair of boats that passed through each other during a substep: if
+    they touched at some point but no longer overlap, both go back to where they
+    met and lose speed. Overlaps that remain are left to handle_boat_collision.
+    """
+    min_dist = boat1.collision_radius + boat2.collision_radius
+    if distance_sq((boat1.world_x, boat1.world_y), (boat2.world_x, boat2.world_y)) < min_dist**2:
+        return
+    x1, y1 = start1
+    x2, y2 = start2
+    dx1, dy1 = boat1.world_x - x1, boat1.world_y - y1
+    dx2, dy2 = boat2.world_x - x2, boat2.world_y - y2
+    t = sweep_circles(x1, y1, dx1, dy1, x2, y2, dx2, dy2, min_dist)
+    if t is None or t == 0.0:
+        return
+    boat1.world_x, boat1.world_y = x1 + dx1 * t, y1 + dy1 * t
+    boat2.world_x, boat2.world_y = x2 + dx2 * t, y2 + dy2 * t
+    boat1.speed *= BOAT_COLLISION_SPEED_REDUCTION
+    boat2.speed *= BOAT_COLLISION_SPEED_REDUCTION
+
+def collide_boat_with_buoys(boat, x0, y0, buoy_coords):
+    """Stops a boat at the first buoy its substep move runs into and slides it round the buoy."""
+    dx = boat.world_x - x0
+    dy = boat.world_y - y0
+    radius = boat.collision_radius + BUOY_RADIUS
+    reach = radius + abs(dx) + abs(dy)
+    hit = None
+    for bx, by in buoy_coords:
+        if abs(bx - x0) > reach or abs(by - y0) > reach:
+            continue
+        t = sweep_circle_circle(x0, y0, dx, dy, bx, by, radius)
+        if t == 0.0 and (x0 - bx) * dx + (y0 - by) * dy >= 0:
+            continue # Resting against the buoy and already pulling away
+        if t is not None and (hit is None or t < hit[0]):
+            hit = (t, bx, by)
+    if hit is None:
+        return
+    t, bx, by = hit
+    boat.world_x, boat.world_y = slide_off_circle(x0, y0, dx, dy, bx, by, radius, t)
+    if distance_sq((x0, y0), (bx, by)) > (radius + 1)**2:
+        # Only a fresh knock costs speed; sliding along the buoy doesn't
+        boat.speed *= BOAT_COLLISION_SPEED_REDUCTION
+
+def load_ai_presets(path=AI_PRESETS_FILE, tier=AI_DIFFICULTY):
+    """
+    The tuned AI profiles for one difficulty tier, keyed by SailingStyle name.
+    Empty when tuning.py hasn't written presets yet or tier is None.
+    """
+    if tier is None or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        presets = json.load(f)
+    return presets.get('tiers', {}).get(tier, {})
+
+def create_ai_fleet(count, presets=None):
+    """A fleet of AI boats cycling through the sailing styles and AI colours."""
+    styles = list(SailingStyle)
+    presets = presets or {}
+    return [AIBoat(0, 0, f"AI {i + 1}", styles[i % len(styles)], AI_BOAT_COLORS[i % len(AI_BOAT_COLORS)],
+                   presets.get(styles[i % len(styles)].name))
+            for i in range(count)]
+
+def place_boats_on_start_grid(boats):
+    """Resets every boat's race state and lines the fleet up behind the start line."""
+    for i, boat in enumerate(boats):
+        boat.reset_position()
+        start_x = -350 - (i * 35)
+        start_y = rng.fleet.uniform(-100, 100)
+        boat.world_x, boat.world_y = start_x, start_y
+        boat.prev_world_x, boat.prev_world_y = start_x, start_y
+        boat.snapshot_render_state()
+        boat.last_line_crossing_time = -LINE_CROSSING_DEBOUNCE
+        boat.is_finished = False
+        boat.race_started = False
+        boat.lap_times = []
+        boat.finish_time = 0
+        boat.current_lap = 1
+        boat.next_buoy_index = 0
+
+class FixedTimestep:
+    """
+    Accumulates real frame time and hands out whole simulation steps.
+    What's left over becomes alpha, the blend factor for rendering between the last two steps.
+    """
+    def __init__(self, step=SIM_TIMESTEP, max_steps=SIM_MAX_STEPS_PER_FRAME):
+        self.step = step
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+
+    def advance(self, frame_dt):
+        """Adds frame_dt and returns how many fixed steps to run this frame."""
+        self.accumulator += frame_dt
+        steps = int(self.accumulator / self.step)
+        if steps > self.max_steps:
+            # Too far behind (debugger, window drag): drop the backlog rather than spiral
+            steps = self.max_steps
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= steps * self.step
+        return steps
+
+    @property
+    def alpha(self):
+        return min(1.0, self.accumulator / self.step)
+
+    def reset(self):
+        self.accumulator = 0.0
+
+class RaceSimulation:
+    """Advances one race in simulation time: countdown, wind, AI, boat physics, collisions and progress."""
+    def __init__(self, boats, course_buoys_coords, sandbar_index, total_laps, wind_speed, wind_direction, pre_race_timer=PRE_RACE_COUNTDOWN, telemetry=None, swept=SIM_SWEPT_COLLISION, navigation=None, plan=AI_PLANNER_ENABLED, heightfield=None):
+        self.boats = list(boats)
+        self.swept = swept # Swept collision tests (see collision.py) instead of end-of-step overlap checks
+        self.telemetry = telemetry # Optional TelemetryRecorder sampled after every step
+        self.course_buoys_coords = course_buoys_coords
+        self.sandbar_index = sandbar_index
+        self.navigation = navigation # The course's NavigationGraph, if AI boats should follow waypoints
+        self.heightfield = heightfield # The course's Heightfield, for drag in shallow water
+        self.planner = RolloutPlanner() if plan else None # Picks AI headings by rollouts (see planner.py)
+        self.total_laps = total_laps
+        self.wind_speed = wind_speed
+        self.wind_direction = wind_direction
+        self.pre_race_timer = pre_race_timer
+        self.time = 0.0
+        self.last_wind_update = 0.0
+        self.racing = pre_race_timer <= 0
+        self.progress = RaceProgress(self.boats, course_buoys_coords, total_laps)
+        self.buoy_coords = list(course_buoys_coords) + list(START_FINISH_LINE) # Course marks plus the gate buoys
+        if self.racing:
+            self.progress.start(self.time)
+
+    def update_wind(self):
+        elapsed = self.time - self.last_wind_update
+        if elapsed * 1000 > WIND_UPDATE_INTERVAL:
+            speed_change = rng.wind.uniform(-WIND_SPEED_CHANGE_RATE, WIND_SPEED_CHANGE_RATE) * elapsed
+            self.wind_speed = max(MIN_WIND_SPEED, min(MAX_WIND_SPEED, self.wind_speed + speed_change))
+            dir_change = rng.wind.uniform(-WIND_DIR_CHANGE_RATE, WIND_DIR_CHANGE_RATE) * elapsed
+            self.wind_direction = normalize_angle(self.wind_direction + dir_change)
+            self.last_wind_update = self.time
+
+    def substeps_for(self, dt):
+        """Number of physics substeps needed so no boat moves further than the allowed step distance."""
+        if not SIM_ADAPTIVE_SUBSTEPS:
+            return 1
+        fastest = max((boat.speed for boat in self.boats), default=0.0)
+        travel = fastest * dt * BOAT_DISTANCE_MULTIPLIER
+        # Swept tests can't tunnel, so substeps are only needed to keep turns smooth
+        max_distance = SIM_SWEPT_MAX_STEP_DISTANCE if self.swept else SIM_MAX_STEP_DISTANCE
+        return max(1, math.ceil(travel / max_distance))
+
+    def step(self, dt):
+        """Runs one fixed step of dt seconds. Returns the RaceEvents fired during it."""
+        prev_time = self.time
+        for boat in self.boats:
+            boat.snapshot_render_state()
+            boat.prev_world_x = boat.world_x
+            boat.prev_world_y = boat.world_y
+        step_start = [(boat.world_x, boat.world_y) for boat in self.boats]
+
+        if self.pre_race_timer > 0:
+            self.pre_race_timer -= dt
+
+        self.update_wind()
+        if self.planner is not None and self.racing:
+            self.planner.advance(self)
+
+        for boat in self.boats:
+            if isinstance(boat, AIBoat):
+                boat.ai_update(self.wind_speed, self.wind_direction, self.course_buoys_coords, START_FINISH_LINE, dt, self.pre_race_timer, self.sandbar_index, self.navigation, self.planner)
+
+        substeps = self.substeps_for(dt)
+        sub_dt = dt / substeps
+        for _ in range(substeps):
+            sub_start = [(boat.world_x, boat.world_y) for boat in self.boats]
+            for boat, (x0, y0) in zip(self.boats, sub_start):
+                rudder = boat.rudder_angle
+                boat.update(self.wind_speed, self.wind_direction, sub_dt)
+                boat.rudder_angle = rudder
+                r = boat.collision_radius
+                if self.swept:
+                    # Anything the hull touched along the way counts, not just where it ended up
+                    collide_boat_with_buoys(boat, x0, y0, self.buoy_coords)
+                    boat.on_sandbar = sweep_boat_sandbars(x0, y0, boat.world_x, boat.world_y, r, self.sandbar_index) is not None
+                else:
+                    boat.on_sandbar = bool(self.sandbar_index.query_rect(boat.world_x - r, boat.world_y - r, boat.world_x + r, boat.world_y + r))
+                if self.heightfield is not None:
+                    boat.shallow_drag = self.heightfield.drag_at(boat.world_x, boat.world_y)
+
+            for i in range(len(self.boats)):
+                for j in range(i + 1, len(self.boats)):
+                    if self.swept:
+                        sweep_boat_collision(self.boats[i], self.boats[j], sub_start[i], sub_start[j])
+                    handle_boat_collision(self.boats[i], self.boats[j])
+
+        for boat, (x, y) in zip(self.boats, step_start):
+            boat.rudder_angle = 0
+            boat.prev_world_x = x
+            boat.prev_world_y = y
+
+        self.time += dt
+        events = []
+        if not self.racing and self.pre_race_timer <= 0:
+            self.racing = True
+            self.progress.start(self.time)
+        elif self.racing:
+            events = self.progress.update(prev_time, self.time)
+        if self.telemetry is not None:
+            self.telemetry.record(self)
+        return events
+
+class RaceCompleter:
+    """
+    Races the boats still out on the course home once every player is done, a slice
+    of fixed steps at a time inside a per-frame time budget, so their real finish
+    times and lap splits fill in while the results are on screen. Boats that haven't
+    finished time_limit simulated seconds later are retired.
+    """
+    def __init__(self, sim, time_limit=RACE_COMPLETION_TIME_LIMIT):
+        self.sim = sim
+        self.start = sim.time
+        self.deadline = sim.time + time_limit
+        self.done = False
+        self.check()
+
+    @property
+    def progress(self):
+        """How much of the time limit has been raced, 0 to 1: how long the wait can be at most."""
+        return 1.0 if self.done else min(1.0, (self.sim.time - self.start) / max(self.deadline - self.start, 1e-9))
+
+    def check(self):
+        """True once every boat is home or retired, retiring the stragglers when time is up."""
+        if not self.done:
+            out = [boat for boat in self.sim.boats if not boat.is_finished]
+            if out and self.sim.time >= self.deadline:
+                for boat in out:
+                    self.sim.progress.retire(boat)
+                out = []
+            self.done = not out
+        return self.done
+
+    def advance(self, budget_s=RACE_COMPLETION_FRAME_BUDGET):
+        """Runs steps until the budget is spent or the race is complete. Returns True when complete."""
+        deadline = time.perf_counter() + budget_s
+        while not self.check():
+            self.sim.step(SIM_TIMESTEP)
+            if time.perf_counter() >= deadline:
+                return self.check()
+        return True
+
+    def finish(self):
+        """Completes the race immediately: up to the whole time limit in one go, so never from a frame that must stay responsive."""
+        while not self.check():
+            self.sim.step(SIM_TIMESTEP)
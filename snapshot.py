@@ -0,0 +1,248 @@
+# snapshot.py
+#
+# Race snapshots: a plain-data copy of everything a race in progress depends on
+# (fleet, course, wind, timers, the random streams), small enough to write to disk
+# and quick enough to take every frame. Restoring one gives a RaceSimulation that
+# carries on exactly as the original would have; forking one gives an independent
+# copy to play "what if" with, without disturbing the race it came from.
+
+import zlib
+import pickle
+
+from constants import *
+import rng
+from entities import Boat, AIBoat, Sandbar, SailingStyle, WakeParticle
+from course import Course
+from navigation import NavigationGraph
+from terrain import generate_heightfield, generate_depth_map
+from simulation import RaceSimulation
+from planner import Plan, RolloutJob, RolloutPlanner
+from race import RaceProgress
+
+SNAPSHOT_VERSION = 3
+
+SIM_FIELDS = ('total_laps', 'wind_speed', 'wind_direction', 'pre_race_timer', 'time', 'last_wind_update', 'racing', 'swept')
+
+# Per-frame drawing buffers and the wake, which is stored separately; everything else in a boat's slots is race state
+_NOT_STATE = {'screen_x', 'screen_y', 'rotated_shape', 'rotated_deck_shape', 'mast_pos_abs', 'sail_curve_points',
+              'collision_rect', 'wake_particles', 'spare_wake', 'wake_bounds'}
+
+def _state_slots(cls):
+    return [name for klass in reversed(cls.__mro__) for name in getattr(klass, '__slots__', ()) if name not in _NOT_STATE]
+
+BOAT_STATE = {cls.__name__: _state_slots(cls) for cls in (Boat, AIBoat)}
+
+def capture_boat(boat):
+    kind = type(boat).__name__
+    state = {'kind': kind}
+    for name in BOAT_STATE[kind]:
+        if not hasattr(boat, name):
+            continue # A planner's scratch boat only ever has its physics set
+        value = getattr(boat, name)
+        if isinstance(value, SailingStyle):
+            value = value.name
+        elif isinstance(value, list):
+            value = list(value)
+        state[name] = value
+    state['wake'] = [(p.world_x, p.world_y, p.lifetime) for p in boat.wake_particles]
+    return state
+
+def restore_boat(state):
+    cls = AIBoat if state['kind'] == 'AIBoat' else Boat
+    boat = cls.__new__(cls)
+    Boat.__init__(boat, 0, 0, name=state['name'], boat_color=state['color']) # Drawing buffers; AIBoat's own init would draw from rng
+    for name in BOAT_STATE[state['kind']]:
+        if name not in state:
+            continue
+        value = state[name]
+        if name == 'style':
+            value = SailingStyle[value]
+        elif isinstance(value, list):
+            value = list(value)
+        setattr(boat, name, value)
+    for x, y, lifetime in state['wake']:
+        particle = WakeParticle(x, y)
+        particle.lifetime = lifetime
+        boat.wake_particles.append(particle)
+    boat.refresh_wake_bounds()
+    return boat
+
+# What a RolloutPlanner's job keeps besides its boat, stored as-is
+_JOB_FIELDS = [name for name in RolloutJob.__slots__ if name != 'boat']
+_PLANNER_FIELDS = ('budget', 'rollout_steps', 'rollout_dt', 'samples', 'replan_interval', 'time', 'debt',
+                   'rollout_updates', 'plans_made')
+
+def _copied(value):
+    return list(value) if isinstance(value, list) else value
+
+def capture_planner(planner, boats):
+    """
+    A RolloutPlanner's state: its settings, every boat's plan and place in the queue (by
+    index into boats), the job in progress, and its scratch boats, whose leftover physics
+    the next rollouts start from.
+    """
+    index = {boat: i for i, boat in enumerate(boats)}
+    job = planner.job_state
+    return {
+        **{name: getattr(planner, name) for name in _PLANNER_FIELDS},
+        'plans': [(index[boat], [getattr(plan, name) for name in Plan.__slots__]) for boat, plan in planner.plans.items()],
+        'waiting': [(index[boat], target) for boat, target in planner.waiting.items()],
+        'job': None if job is None else {'boat': index[job.boat], **{name: _copied(getattr(job, name)) for name in _JOB_FIELDS}},
+        'scratch': [capture_boat(scratch) for scratch in planner.scratch],
+    }
+
+def restore_planner(state, sim):
+    """A RolloutPlanner for sim from capture_planner's state, ready to carry on its job where it stopped."""
+    planner = RolloutPlanner()
+    for name in _PLANNER_FIELDS:
+        setattr(planner, name, state[name])
+    boats = sim.boats
+    planner.plans = {boats[i]: Plan(*values) for i, values in state['plans']}
+    planner.waiting = {boats[i]: target for i, target in state['waiting']}
+    planner.scratch = [restore_boat(scratch) for scratch in state['scratch']]
+    if state['job'] is not None:
+        job = RolloutJob.__new__(RolloutJob)
+        job.boat = boats[state['job']['boat']]
+        for name in _JOB_FIELDS:
+            setattr(job, name, _copied(state['job'][name]))
+        planner.job_state = job
+        planner.job = planner.rollouts(job, sim)
+    return planner
+
+def capture_course(course):
+    """
+    Course geometry. Neither the heightfield nor the depth map is stored: the seed
+    the heightfield's noise came from is enough for restore_course to rebuild both.
+    """
+    state = {
+        'course_buoys_coords': [tuple(c) for c in course.course_buoys_coords],
+        'wind_direction': course.wind_direction,
+        'sandbars': [list(sandbar.vertices) for sandbar in course.sandbars],
+        'navigation': None,
+        'terrain_seed': course.heightfield.seed if course.heightfield is not None else None,
+    }
+    nav = course.navigation
+    if nav is not None:
+        # Only the cached routes: that's all the AI reads while racing
+        state['navigation'] = {'nodes': list(nav.nodes), 'marks': list(nav.marks), 'paths': dict(nav.paths)}
+    return state
+
+def restore_course(state, depth_map=None):
+    """Rebuilds a Course from capture_course's state, regenerating its heightfield and depth map (the slow part)."""
+    sandbars = [Sandbar.from_polygon(list(zip(v[0::2], v[1::2]))) for v in state['sandbars']]
+    navigation = None
+    if state['navigation'] is not None:
+        nav = state['navigation']
+        navigation = NavigationGraph(nav['nodes'], [[] for _ in nav['nodes']], nav['marks'])
+        navigation.paths = dict(nav['paths'])
+    heightfield = generate_heightfield(sandbars, state['terrain_seed'])
+    depth_map = generate_depth_map(WORLD_BOUNDS * 2, WORLD_BOUNDS * 2, sandbars, depth_map, heightfield)
+    return Course(state['wind_direction'], state['course_buoys_coords'], sandbars, depth_map, navigation, heightfield)
+
+def same_course(state, course):
+    return course is not None and [tuple(c) for c in course.course_buoys_coords] == state['course_buoys_coords'] \
+        and [list(s.vertices) for s in course.sandbars] == state['sandbars']
+
+def capture_race(sim, course=None, extra=None):
+    """
+    Takes a snapshot of sim as a dict of plain values (and the random streams' state).
+    Pass the race's Course to store it too; without one, the snapshot can only be
+    restored onto the same course. extra is stored as-is, for the caller's own
+    bookkeeping (series scores, game state).
+    """
+    return {
+        'version': SNAPSHOT_VERSION,
+        'sim': {name: getattr(sim, name) for name in SIM_FIELDS},
+        'boats': [capture_boat(boat) for boat in sim.boats],
+        'course': capture_course(course) if course is not None else None,
+        'planner': capture_planner(sim.planner, sim.boats) if sim.planner is not None else None,
+        'rng': rng.get_state(),
+        'extra': extra,
+    }
+
+def restore_race(snapshot, course, restore_rng=True):
+    """
+    Builds a RaceSimulation from a snapshot on course (the same Course object, or one
+    from restore_course). Race progress is rebuilt from the boats, and the rollout
+    planner, if the race had one, from its captured state. With restore_rng,
+    the global random streams are put back as they were, so the race continues exactly.
+    Telemetry isn't part of a snapshot; attach a new recorder if one is wanted.
+    """
+    s = snapshot['sim']
+    boats = [restore_boat(state) for state in snapshot['boats']]
+    sim = RaceSimulation(boats, course.course_buoys_coords, course.sandbar_index, s['total_laps'], s['wind_speed'],
+                         s['wind_direction'], s['pre_race_timer'], swept=s['swept'], navigation=course.navigation,
+                         plan=False, heightfield=course.heightfield)
+    # The constructor may have fired the start; put every boat back the way it was
+    for boat, state in zip(boats, snapshot['boats']):
+        boat.race_start_time = state['race_start_time']
+        boat.lap_start_time = state['lap_start_time']
+    sim.time = s['time']
+    sim.last_wind_update = s['last_wind_update']
+    sim.racing = s['racing']
+    sim.progress = RaceProgress(boats, course.course_buoys_coords, s['total_laps'])
+    if snapshot['planner'] is not None:
+        sim.planner = restore_planner(snapshot['planner'], sim)
+    if restore_rng:
+        rng.set_state(snapshot['rng'])
+    return sim
+
+def snapshot_to_bytes(snapshot, level=SNAPSHOT_COMPRESSION):
+    return zlib.compress(pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL), level)
+
+def snapshot_from_bytes(data):
+    snapshot = pickle.loads(zlib.decompress(data))
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {snapshot.get('version')!r}")
+    return snapshot
+
+def save_snapshot(path, snapshot):
+    with open(path, 'wb') as f:
+        f.write(snapshot_to_bytes(snapshot))
+    return path
+
+def load_snapshot(path):
+    """Reads a snapshot written by save_snapshot. Only load files you trust: they're pickles."""
+    with open(path, 'rb') as f:
+        return snapshot_from_bytes(f.read())
+
+class RaceFork:
+    """
+    An independent copy of a race, sharing the (read-only) course with the original.
+    It keeps its own random stream state and swaps it in only while it steps, so
+    running a fork never changes what happens next in the race it came from.
+    """
+    def __init__(self, sim):
+        snapshot = capture_race(sim)
+        self.rng_state = snapshot['rng']
+        self.sim = restore_race(snapshot, _SharedCourse(sim), restore_rng=False)
+
+    def fork(self):
+        """A fork of this fork, from where it is now."""
+        outer = rng.get_state()
+        rng.set_state(self.rng_state)
+        try:
+            return RaceFork(self.sim)
+        finally:
+            rng.set_state(outer)
+
+    def run(self, steps, dt=SIM_TIMESTEP):
+        """Advances the fork steps fixed steps. Returns the RaceEvents fired along the way."""
+        outer = rng.get_state()
+        rng.set_state(self.rng_state)
+        events = []
+        try:
+            for _ in range(steps):
+                events.extend(self.sim.step(dt))
+        finally:
+            self.rng_state = rng.get_state()
+            rng.set_state(outer)
+        return events
+
+class _SharedCourse:
+    """What restore_race needs from a Course, taken straight from a running race."""
+    def __init__(self, sim):
+        self.course_buoys_coords = sim.course_buoys_coords
+        self.sandbar_index = sim.sandbar_index
+        self.navigation = sim.navigation
+        self.heightfield = sim.heightfield
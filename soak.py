@@ -0,0 +1,217 @@
+# soak.py
+#
+# Soak test: plays full series of the real game loop back to back, headless, the
+# way a kiosk runs for days. A SoakDriver stands in for the visitor, clicking through
+# setup, racing each race for a while, forfeiting it from the pause menu, waiting on
+# the results and moving on. After every race it records resident memory, live
+# pygame Surfaces, gc-tracked objects and collections, and frame-time percentiles
+# of the racing frames (plus the slowest menu frame), and fails once any of them has grown past its threshold over the baseline:
+#
+#   python soak.py                       # SOAK_SERIES series of SOAK_RACES races
+#   python soak.py --series 0 --out soak.json   # until something fails
+
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+from constants import *  # before pygame.init(): constants briefly inits and quits pygame itself
+import pygame
+import numpy as np
+
+import rng
+from main import main as run_game, GameState
+from benchmarks import current_rss_mb, peak_rss_mb
+
+def rss_mb():
+    """Current resident set size in MB where it can be read; otherwise the peak so far."""
+    rss = current_rss_mb()
+    return rss if rss is not None else peak_rss_mb()
+
+def count_surfaces():
+    """Live pygame Surfaces referenced from gc-tracked objects (Surfaces aren't tracked themselves)."""
+    seen = set()
+    for obj in gc.get_objects():
+        for ref in gc.get_referents(obj):
+            if isinstance(ref, pygame.Surface):
+                seen.add(id(ref))
+    return len(seen)
+
+class SoakDriver:
+    """
+    Plays the game through main(driver=...) by posting the clicks and key presses a
+    visitor would. It waits while a course is being prepared or the fleet is still
+    racing home behind the results, so it never forces that work into a single frame.
+    """
+    def __init__(self, series=SOAK_SERIES, races=SOAK_RACES, laps=SOAK_LAPS, players=1, race_time=SOAK_RACE_TIME,
+                 warmup=SOAK_WARMUP_RACES, max_rss_growth_mb=SOAK_MAX_RSS_GROWTH_MB, max_surface_growth=SOAK_MAX_SURFACE_GROWTH,
+                 max_object_growth=SOAK_MAX_OBJECT_GROWTH, max_p99_growth=SOAK_MAX_P99_GROWTH):
+        self.series = series
+        self.races = races
+        self.laps = laps
+        self.players = players
+        self.race_time = race_time
+        self.warmup = warmup
+        self.max_rss_growth_mb = max_rss_growth_mb
+        self.max_surface_growth = max_surface_growth
+        self.max_object_growth = max_object_growth
+        self.max_p99_growth = max_p99_growth
+        self.series_played = 0
+        self.records = []
+        self.failures = []
+        self.baseline = None
+        self.frame_times = []   # Racing frames: what the player's latency is judged on
+        self.menu_times = []    # Setup, pause and results frames, which may spend a budget on background work
+        self.last_frame = None
+        self.last_racing = False
+        self.gc_stats = gc.get_stats()
+
+    @property
+    def finished(self):
+        return bool(self.failures) or (self.series > 0 and self.series_played >= self.series)
+
+    def click(self, rect):
+        pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=rect.center))
+
+    def frame(self, state, sim, busy):
+        now = time.perf_counter()
+        if self.last_frame is not None:
+            (self.frame_times if self.last_racing else self.menu_times).append(now - self.last_frame)
+        self.last_frame = now
+        self.last_racing = state in (GameState.PRE_RACE, GameState.RACING)
+        if self.failures:
+            pygame.event.post(pygame.event.Event(pygame.QUIT))
+        elif busy:
+            return
+        elif state == GameState.SETUP:
+            if self.finished:
+                pygame.event.post(pygame.event.Event(pygame.QUIT))
+                return
+            self.click(ONE_PLAYER_BUTTON_RECT if self.players == 1 else TWO_PLAYER_BUTTON_RECT)
+            for minus, plus, count in ((LAPS_MINUS_BUTTON_RECT, LAPS_PLUS_BUTTON_RECT, self.laps),
+                                       (RACES_MINUS_BUTTON_RECT, RACES_PLUS_BUTTON_RECT, self.races)):
+                for _ in range(10): # Down to 1 from wherever the last series left it
+                    self.click(minus)
+                for _ in range(count - 1):
+                    self.click(plus)
+            self.click(START_SERIES_BUTTON_RECT)
+        elif state in (GameState.PRE_RACE, GameState.RACING):
+            if sim.time >= self.race_time:
+                pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_ESCAPE))
+        elif state == GameState.PAUSED:
+            self.click(FORFEIT_RACE_BUTTON_RECT)
+        elif state == GameState.RACE_RESULTS:
+            self.end_race()
+            if self.failures:
+                pygame.event.post(pygame.event.Event(pygame.QUIT))
+            else:
+                self.click(MAIN_MENU_BUTTON_RECT)
+        elif state == GameState.SERIES_END:
+            self.series_played += 1
+            self.click(MAIN_MENU_BUTTON_RECT)
+
+    def end_race(self):
+        """Records the race just run and checks it against the baseline."""
+        stats = gc.get_stats()
+        collections = [now['collections'] - before['collections'] for now, before in zip(stats, self.gc_stats)]
+        collected = sum(now['collected'] - before['collected'] for now, before in zip(stats, self.gc_stats))
+        gc.collect() # Count what's alive, not what's waiting to be collected
+        times = np.array(self.frame_times) * 1000
+        p50, p95, p99 = np.percentile(times, (50, 95, 99)) if len(times) else (0.0, 0.0, 0.0)
+        record = {
+            'race': len(self.records) + 1,
+            'series': self.series_played + 1,
+            'frames': len(times),
+            'p50_ms': float(p50),
+            'p95_ms': float(p95),
+            'p99_ms': float(p99),
+            'max_ms': float(times.max()) if len(times) else 0.0,
+            'menu_max_ms': max(self.menu_times, default=0.0) * 1000,
+            'rss_mb': rss_mb(),
+            'surfaces': count_surfaces(),
+            'objects': len(gc.get_objects()),
+            'gc_collections': collections,
+            'gc_collected': collected,
+            'gc_uncollectable': len(gc.garbage),
+        }
+        self.records.append(record)
+        self.print_record(record)
+        if len(self.records) == self.warmup:
+            self.baseline = record
+        elif self.baseline is not None:
+            self.failures = self.check(record)
+            for failure in self.failures:
+                print(f"FAIL: race {record['race']}: {failure}")
+        # Measuring took a while; don't count it as a frame of the next race
+        self.frame_times = []
+        self.menu_times = []
+        self.last_frame = None
+        self.gc_stats = gc.get_stats()
+
+    def check(self, record):
+        """What's grown past its threshold since the baseline, as messages (empty if nothing has)."""
+        base = self.baseline
+        failures = []
+        if record['rss_mb'] is not None and base['rss_mb'] is not None and record['rss_mb'] - base['rss_mb'] > self.max_rss_growth_mb:
+            failures.append(f"RSS {record['rss_mb']:.1f} MB is {record['rss_mb'] - base['rss_mb']:.1f} MB over the baseline's {base['rss_mb']:.1f} MB")
+        if record['surfaces'] - base['surfaces'] > self.max_surface_growth:
+            failures.append(f"{record['surfaces']} Surfaces alive, {record['surfaces'] - base['surfaces']} more than the baseline")
+        if record['objects'] - base['objects'] > self.max_object_growth:
+            failures.append(f"{record['objects']} gc-tracked objects, {record['objects'] - base['objects']} more than the baseline")
+        if record['gc_uncollectable'] > base['gc_uncollectable']:
+            failures.append(f"{record['gc_uncollectable'] - base['gc_uncollectable']} uncollectable objects in gc.garbage")
+        if base['p99_ms'] > 0 and record['p99_ms'] > base['p99_ms'] * self.max_p99_growth:
+            failures.append(f"p99 frame time {record['p99_ms']:.1f} ms is over {self.max_p99_growth:g}x the baseline's {base['p99_ms']:.1f} ms")
+        return failures
+
+    def print_record(self, record):
+        if record['race'] == 1:
+            print(f"{'race':>4} {'series':>6} {'frames':>6} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'max ms':>7} {'menu ms':>7} "
+                  f"{'RSS MB':>7} {'surfs':>6} {'objects':>8} {'gc 0/1/2':>12}")
+        rss = f"{record['rss_mb']:7.1f}" if record['rss_mb'] is not None else f"{'n/a':>7}"
+        marker = " (baseline)" if record['race'] == self.warmup else ""
+        print(f"{record['race']:>4} {record['series']:>6} {record['frames']:>6} {record['p50_ms']:7.2f} {record['p95_ms']:7.2f} "
+              f"{record['p99_ms']:7.2f} {record['max_ms']:7.1f} {record['menu_max_ms']:7.1f} {rss} {record['surfaces']:>6} {record['objects']:>8} "
+              f"{'/'.join(str(n) for n in record['gc_collections']):>12}{marker}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play full series headless and fail if memory or frame times grow")
+    parser.add_argument('--series', type=int, default=SOAK_SERIES, help="series to play (0 = until a threshold fails)")
+    parser.add_argument('--races', type=int, default=SOAK_RACES, help="races per series")
+    parser.add_argument('--laps', type=int, default=SOAK_LAPS)
+    parser.add_argument('--players', type=int, choices=(1, 2), default=1)
+    parser.add_argument('--race-time', type=float, default=SOAK_RACE_TIME, help="simulated seconds of each race before forfeiting")
+    parser.add_argument('--warmup', type=int, default=SOAK_WARMUP_RACES, help="races before the baseline is taken")
+    parser.add_argument('--max-rss-growth-mb', type=float, default=SOAK_MAX_RSS_GROWTH_MB)
+    parser.add_argument('--max-surface-growth', type=int, default=SOAK_MAX_SURFACE_GROWTH)
+    parser.add_argument('--max-object-growth', type=int, default=SOAK_MAX_OBJECT_GROWTH)
+    parser.add_argument('--max-p99-growth', type=float, default=SOAK_MAX_P99_GROWTH)
+    parser.add_argument('--seed', type=int, default=DETERMINISTIC_SEED)
+    parser.add_argument('--out', default=None, help="write every race's record to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.seed is not None:
+        rng.seed_all(args.seed)
+    driver = SoakDriver(args.series, args.races, args.laps, args.players, args.race_time, args.warmup,
+                        args.max_rss_growth_mb, args.max_surface_growth, args.max_object_growth, args.max_p99_growth)
+    try:
+        run_game(driver)
+    except KeyboardInterrupt:
+        print("Interrupted")
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump({'records': driver.records, 'failures': driver.failures}, f, indent=1)
+    if driver.failures:
+        return 1
+    if len(driver.records) <= args.warmup:
+        print(f"Only {len(driver.records)} races played; nothing checked against a baseline")
+    else:
+        print(f"{len(driver.records)} races over {driver.series_played} series, all within thresholds of race {args.warmup}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,210 @@
+# spatial.py
+
+from constants import *
+
+class _QuadNode:
+    """A single node of the quadtree. Holds items whose box doesn't fit a child."""
+    def __init__(self, min_x, min_y, max_x, max_y, depth):
+        self.min_x = min_x
+        self.min_y = min_y
+        self.max_x = max_x
+        self.max_y = max_y
+        self.depth = depth
+        self.items = []
+        self.children = None
+
+    def child_for(self, min_x, min_y, max_x, max_y):
+        """Returns the child that fully contains the box, or None if it straddles a split."""
+        mid_x = (self.min_x + self.max_x) / 2
+        mid_y = (self.min_y + self.max_y) / 2
+        if max_x < mid_x:
+            col = 0
+        elif min_x >= mid_x:
+            col = 1
+        else:
+            return None
+        if max_y < mid_y:
+            row = 0
+        elif min_y >= mid_y:
+            row = 1
+        else:
+            return None
+        return self.children[row * 2 + col]
+
+    def contains(self, min_x, min_y, max_x, max_y):
+        return min_x >= self.min_x and max_x <= self.max_x and min_y >= self.min_y and max_y <= self.max_y
+
+    def split(self):
+        mid_x = (self.min_x + self.max_x) / 2
+        mid_y = (self.min_y + self.max_y) / 2
+        d = self.depth + 1
+        self.children = [
+            _QuadNode(self.min_x, self.min_y, mid_x, mid_y, d),
+            _QuadNode(mid_x, self.min_y, self.max_x, mid_y, d),
+            _QuadNode(self.min_x, mid_y, mid_x, self.max_y, d),
+            _QuadNode(mid_x, mid_y, self.max_x, self.max_y, d),
+        ]
+
+def _segment_hits_box(x1, y1, x2, y2, min_x, min_y, max_x, max_y):
+    """Slab test: does the segment (x1,y1)-(x2,y2) touch the box?"""
+    t0, t1 = 0.0, 1.0
+    dx = x2 - x1
+    dy = y2 - y1
+    for p, q in ((-dx, x1 - min_x), (dx, max_x - x1), (-dy, y1 - min_y), (dy, max_y - y1)):
+        if p == 0:
+            if q < 0:
+                return False
+        else:
+            t = q / p
+            if p < 0:
+                if t > t1: return False
+                if t > t0: t0 = t
+            else:
+                if t < t0: return False
+                if t < t1: t1 = t
+    return True
+
+class SpatialIndex:
+    """
+    Loose-fit quadtree over axis-aligned bounding boxes.
+    Built once per course; supports point, circle, rectangle and segment queries.
+    """
+    def __init__(self, bounds=None, node_capacity=SPATIAL_NODE_CAPACITY, max_depth=SPATIAL_MAX_DEPTH):
+        if bounds is None:
+            bounds = (-WORLD_BOUNDS, -WORLD_BOUNDS, WORLD_BOUNDS, WORLD_BOUNDS)
+        self.root = _QuadNode(*bounds, 0)
+        self.node_capacity = node_capacity
+        self.max_depth = max_depth
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        """Removes every item but keeps the nodes, so an index rebuilt each frame reuses its tree."""
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            node.items.clear()
+            if node.children is not None:
+                stack.extend(node.children)
+        self.count = 0
+
+    def insert(self, item, bbox):
+        """Adds item with bounding box (min_x, min_y, max_x, max_y)."""
+        min_x, min_y, max_x, max_y = bbox
+        entry = (min_x, min_y, max_x, max_y, item)
+        node = self.root
+        # Boxes poking outside the root stay at the root so queries always see them
+        inside = node.contains(min_x, min_y, max_x, max_y)
+        while True:
+            if inside and node.children is not None:
+                child = node.child_for(min_x, min_y, max_x, max_y)
+                if child is not None:
+                    node = child
+                    continue
+            node.items.append(entry)
+            break
+        self.count += 1
+        if node.children is None and len(node.items) > self.node_capacity and node.depth < self.max_depth:
+            node.split()
+            kept = []
+            for e in node.items:
+                child = node.child_for(e[0], e[1], e[2], e[3]) if node.contains(e[0], e[1], e[2], e[3]) else None
+                if child is not None:
+                    child.items.append(e)
+                else:
+                    kept.append(e)
+            node.items = kept
+
+    def query_rect(self, min_x, min_y, max_x, max_y):
+        """Returns all items whose box overlaps the rectangle (edges touching don't count, like Rect.colliderect)."""
+        results = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            for e in node.items:
+                if e[0] < max_x and e[2] > min_x and e[1] < max_y and e[3] > min_y:
+                    results.append(e[4])
+            if node.children is not None:
+                for child in node.children:
+                    if child.min_x < max_x and child.max_x > min_x and child.min_y < max_y and child.max_y > min_y:
+                        stack.append(child)
+        return results
+
+    def query_point(self, x, y):
+        """Returns all items whose box contains the point."""
+        results = []
+        node = self.root
+        while node is not None:
+            for e in node.items:
+                if e[0] <= x <= e[2] and e[1] <= y <= e[3]:
+                    results.append(e[4])
+            if node.children is None:
+                break
+            mid_x = (node.min_x + node.max_x) / 2
+            mid_y = (node.min_y + node.max_y) / 2
+            node = node.children[(2 if y >= mid_y else 0) + (1 if x >= mid_x else 0)]
+        return results
+
+    def query_circle(self, x, y, radius):
+        """Returns all items whose box intersects the circle."""
+        r_sq = radius * radius
+        results = []
+        for item_box in self._query_rect_entries(x - radius, y - radius, x + radius, y + radius):
+            nx = min(max(x, item_box[0]), item_box[2])
+            ny = min(max(y, item_box[1]), item_box[3])
+            if (nx - x)**2 + (ny - y)**2 <= r_sq:
+                results.append(item_box[4])
+        return results
+
+    def query_segment(self, x1, y1, x2, y2):
+        """Returns all items whose box is touched by the segment, nearest first."""
+        hits = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            for e in node.items:
+                if _segment_hits_box(x1, y1, x2, y2, e[0], e[1], e[2], e[3]):
+                    cx = (e[0] + e[2]) / 2
+                    cy = (e[1] + e[3]) / 2
+                    hits.append(((cx - x1)**2 + (cy - y1)**2, e[4]))
+            if node.children is not None:
+                for child in node.children:
+                    if _segment_hits_box(x1, y1, x2, y2, child.min_x, child.min_y, child.max_x, child.max_y):
+                        stack.append(child)
+        hits.sort(key=lambda h: h[0])
+        return [h[1] for h in hits]
+
+    def _query_rect_entries(self, min_x, min_y, max_x, max_y):
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            for e in node.items:
+                if e[0] <= max_x and e[2] >= min_x and e[1] <= max_y and e[3] >= min_y:
+                    yield e
+            if node.children is not None:
+                for child in node.children:
+                    if child.min_x <= max_x and child.max_x >= min_x and child.min_y <= max_y and child.max_y >= min_y:
+                        stack.append(child)
+
+def build_sandbar_index(sandbars):
+    """Builds the per-course spatial index over sandbar bounding boxes."""
+    index = SpatialIndex()
+    for sandbar in sandbars:
+        index.insert(sandbar, (sandbar.rect.left, sandbar.rect.top, sandbar.rect.right, sandbar.rect.bottom))
+    return index
+
+def build_fleet_index(boats, index=None):
+    """
+    Builds a per-frame index over the boats' render bounds (boat plus wake) for viewport culling.
+    Items are (fleet_order, boat) so query results can be put back into draw order.
+    Pass last frame's index to refill it in place instead of growing a new tree.
+    """
+    if index is None:
+        index = SpatialIndex()
+    else:
+        index.clear()
+    for order, boat in enumerate(boats):
+        index.insert((order, boat), boat.render_bounds())
+    return index
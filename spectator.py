@@ -0,0 +1,112 @@
+# spectator.py
+
+import sys
+import pygame
+
+from constants import *
+from utils import *
+from entities import Boat, Sandbar
+from course import create_course_buoys
+from graphics import draw_map, draw_wind_gauge
+from terrain import generate_depth_map, generate_heightfield
+from shared_state import SharedRaceState, apply_boat_row
+from quality import QualityGovernor
+from main import render_view
+
+def build_course_view(buoy_coords, polygons, terrain_seed=None):
+    """
+    Turns a published course into the objects the renderer draws. The heightfield is
+    rebuilt from the race's terrain seed, so the depth map matches the one it raced on.
+    """
+    sandbars = [Sandbar.from_polygon(poly) for poly in polygons]
+    buoys = create_course_buoys(buoy_coords)
+    heightfield = generate_heightfield(sandbars, terrain_seed) if terrain_seed is not None else None
+    depth_map = generate_depth_map(WORLD_BOUNDS * 2, WORLD_BOUNDS * 2, sandbars, heightfield=heightfield)
+    return sandbars, buoys, depth_map
+
+def run_spectator(name=SHARED_STATE_NAME):
+    """Attaches to a running race and renders it in its own window. TAB cycles the followed boat."""
+    try:
+        state = SharedRaceState.attach(name)
+    except FileNotFoundError:
+        print(f"No race is publishing to '{name}'.")
+        return
+
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Dinghy Sailing Race - Spectator")
+    clock = pygame.time.Clock()
+    governor = QualityGovernor()
+    font = pygame.font.Font(None, 30)
+    lap_font = pygame.font.Font(None, 24)
+    wave_layers = [create_wave_layer(SCREEN_WIDTH + 100, SCREEN_HEIGHT // 2 + 100, WAVE_DENSITY, WAVE_LAYER_ALPHA, WAVE_LINE_THICKNESS) for _ in range(NUM_WAVE_LAYERS)]
+    wave_offsets = [[0.0, 0.0] for _ in range(NUM_WAVE_LAYERS)]
+
+    course_version = -1
+    sandbars, buoys, depth_map = [], [], None
+    boats = []
+    fleet_buffer = state.new_fleet_buffer()
+    camera_index = 0
+    last_seq = 0
+
+    running = True
+    while running and not state.closed:
+        dt = clock.tick(FRAME_RATE_CAP) / 1000.0
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    running = False
+                elif event.key == pygame.K_TAB and boats:
+                    camera_index = (camera_index + 1) % len(boats)
+
+        if state.course_version() != course_version:
+            course = state.read_course()
+            if course is not None:
+                course_version, buoy_coords, polygons, terrain_seed = course
+                sandbars, buoys, depth_map = build_course_view(buoy_coords, polygons, terrain_seed)
+                for boat in boats:
+                    boat.wake_particles.clear()
+
+        screen.fill(DARK_BLUE)
+        snapshot = state.read_fleet(fleet_buffer)
+        if snapshot is None or depth_map is None:
+            waiting_surf = font.render("Waiting for race...", True, WHITE)
+            screen.blit(waiting_surf, (CENTER_X - waiting_surf.get_width() // 2, CENTER_Y))
+            pygame.display.flip()
+            continue
+
+        seq, rows, race_row = snapshot
+        while len(boats) < len(rows):
+            boats.append(Boat(0, 0, name=f"Boat {len(boats) + 1}"))
+        del boats[len(rows):]
+        for boat, row in zip(boats, rows):
+            apply_boat_row(boat, row)
+            boat.snapshot_render_state()
+            if seq != last_seq:
+                boat.update_wake(dt)
+        last_seq = seq
+        if not boats:
+            pygame.display.flip()
+            continue
+        camera_index %= len(boats)
+        camera = boats[camera_index]
+
+        wind_speed, wind_direction = race_row[1], race_row[2]
+        race_info = {
+            'wind_speed': wind_speed, 'wind_dir': wind_direction,
+            'current_race': int(race_row[5]), 'total_races': int(race_row[6]),
+            'total_laps': int(race_row[4]), 'time': race_row[0]
+        }
+        governor.record(clock.get_rawtime())
+        render_view(screen, camera, [], boats, sandbars, buoys, START_FINISH_LINE, depth_map, wave_layers, wave_offsets, wind_direction, dt, font, lap_font, race_info, quality=governor.settings)
+        draw_map(screen, camera, boats, sandbars, buoys, camera.next_buoy_index, START_FINISH_LINE, MAP_RECT_P1, WORLD_BOUNDS, [camera])
+        draw_wind_gauge(screen, wind_direction, WIND_GAUGE_POS, WIND_GAUGE_RADIUS, lap_font)
+        pygame.display.flip()
+
+    state.close()
+    pygame.quit()
+
+if __name__ == '__main__':
+    run_spectator(sys.argv[1] if len(sys.argv) > 1 else SHARED_STATE_NAME)
@@ -0,0 +1,138 @@
+# statehash.py
+#
+# Per-tick fleet state hashes, for proving a reworked engine still races exactly
+# (or near enough) the same. Record a golden run once, then check builds against it:
+#
+#   python statehash.py record golden.npz --seed 1
+#   python statehash.py check golden.npz                  # bit-identical
+#   python statehash.py check golden.npz --tolerance 1e-6 # every field within 1e-6
+
+import sys
+import hashlib
+import argparse
+
+from constants import *
+import numpy as np
+
+import rng
+from course import prepare_course_steps
+from utils import run_to_completion
+from simulation import RaceSimulation, create_ai_fleet, place_boats_on_start_grid
+
+RACE_FIELDS = ('time', 'wind_speed', 'wind_direction', 'pre_race_timer')
+BOAT_FIELDS = ('world_x', 'world_y', 'heading', 'speed', 'sail_angle_rel', 'on_sandbar',
+               'next_buoy_index', 'current_lap', 'race_started', 'is_finished', 'finish_time')
+
+def fleet_state(sim):
+    """The race and every boat as one float64 vector: RACE_FIELDS, then BOAT_FIELDS per boat."""
+    values = [float(getattr(sim, name)) for name in RACE_FIELDS]
+    for boat in sim.boats:
+        values.extend(float(getattr(boat, name)) for name in BOAT_FIELDS)
+    return np.array(values, dtype=np.float64)
+
+def state_hash(state):
+    """64-bit digest of a fleet_state vector. Equal only if every bit of every field is."""
+    return int.from_bytes(hashlib.blake2b(state.tobytes(), digest_size=8).digest(), 'little')
+
+def field_names(num_boats):
+    return list(RACE_FIELDS) + [f"{i}.{name}" for i in range(num_boats) for name in BOAT_FIELDS]
+
+class StateHasher:
+    """Call record(sim) after every step; keeps the hash and full state every interval ticks."""
+    def __init__(self, interval=STATE_HASH_INTERVAL):
+        self.interval = interval
+        self.tick = 0
+        self.ticks = []
+        self.hashes = []
+        self.states = []
+
+    def record(self, sim):
+        self.tick += 1
+        if self.tick % self.interval:
+            return
+        state = fleet_state(sim)
+        self.ticks.append(self.tick)
+        self.hashes.append(state_hash(state))
+        self.states.append(state)
+
+def run_race(seed, boats=NUM_AI_BOATS, laps=1, ticks=6000, interval=STATE_HASH_INTERVAL):
+    """
+    Races an AI fleet for ticks fixed steps on the course the game races for seed
+    (chosen from scored candidates like any other), with every random stream seeded
+    from it. Returns the StateHasher.
+    """
+    rng.seed_all(seed)
+    course = run_to_completion(prepare_course_steps(seed=seed))
+    fleet = create_ai_fleet(boats)
+    place_boats_on_start_grid(fleet)
+    sim = RaceSimulation(fleet, course.course_buoys_coords, course.sandbar_index, laps,
+                         rng.wind.uniform(MIN_WIND_SPEED, MAX_WIND_SPEED), course.wind_direction, navigation=course.navigation,
+                         heightfield=course.heightfield)
+    hasher = StateHasher(interval)
+    for _ in range(ticks):
+        sim.step(SIM_TIMESTEP)
+        hasher.record(sim)
+    return hasher
+
+def save_golden(path, hasher, seed, boats, laps):
+    np.savez_compressed(path, ticks=np.array(hasher.ticks), hashes=np.array(hasher.hashes, dtype=np.uint64),
+                        states=np.array(hasher.states), seed=seed, boats=boats, laps=laps, interval=hasher.interval)
+
+def compare(golden, hasher, tolerance=0.0):
+    """
+    Checks a run against a loaded golden file. Returns None if they match, otherwise
+    (tick, field name, golden value, new value) for the first tick that differs:
+    any bit with tolerance 0, by more than tolerance otherwise.
+    """
+    names = field_names(int(golden['boats']))
+    expected = golden['states']
+    for i, tick in enumerate(golden['ticks']):
+        if i >= len(hasher.states):
+            return int(tick), 'missing tick', None, None
+        if tolerance == 0:
+            if int(golden['hashes'][i]) == hasher.hashes[i]:
+                continue
+            bad = np.flatnonzero(expected[i] != hasher.states[i])
+        else:
+            bad = np.flatnonzero(~(np.abs(expected[i] - hasher.states[i]) <= tolerance))
+        if len(bad):
+            j = bad[0]
+            return int(tick), names[j], float(expected[i][j]), float(hasher.states[i][j])
+    return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record or check per-tick fleet state hashes of a seeded race")
+    sub = parser.add_subparsers(dest='command', required=True)
+    record = sub.add_parser('record', help="race from a seed and save every tick's state as the golden run")
+    record.add_argument('path')
+    record.add_argument('--seed', type=int, default=1)
+    record.add_argument('--boats', type=int, default=NUM_AI_BOATS)
+    record.add_argument('--laps', type=int, default=1)
+    record.add_argument('--ticks', type=int, default=6000, help="fixed steps to simulate")
+    record.add_argument('--interval', type=int, default=STATE_HASH_INTERVAL, help="ticks between recorded states")
+    check = sub.add_parser('check', help="rerun a golden run's race and report the first tick that differs")
+    check.add_argument('path')
+    check.add_argument('--tolerance', type=float, nargs='?', const=STATE_HASH_TOLERANCE, default=0.0,
+                       help=f"accept per-field differences up to this (default {STATE_HASH_TOLERANCE:g} when given bare); omit for bit-identical")
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        hasher = run_race(args.seed, args.boats, args.laps, args.ticks, args.interval)
+        save_golden(args.path, hasher, args.seed, args.boats, args.laps)
+        print(f"Recorded {len(hasher.hashes)} states over {hasher.tick} ticks to {args.path}")
+        return 0
+
+    golden = np.load(args.path)
+    ticks = int(golden['ticks'][-1]) if len(golden['ticks']) else 0
+    hasher = run_race(int(golden['seed']), int(golden['boats']), int(golden['laps']), ticks, int(golden['interval']))
+    mismatch = compare(golden, hasher, args.tolerance)
+    if mismatch is None:
+        kind = "bit-identical" if args.tolerance == 0 else f"within {args.tolerance:g}"
+        print(f"{len(hasher.hashes)} states over {ticks} ticks {kind} to {args.path}")
+        return 0
+    tick, field, expected, actual = mismatch
+    print(f"DIVERGED at tick {tick} ({tick * SIM_TIMESTEP:.3f}s): {field} was {expected!r}, now {actual!r}")
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+# telemetry.py
+
+import os
+import json
+from operator import attrgetter
+
+from constants import *
+import numpy as np
+
+# Column name -> Boat attribute, sampled for every boat
+BOAT_FIELDS = (
+    ('x', 'world_x'),
+    ('y', 'world_y'),
+    ('heading', 'heading'),
+    ('speed', 'speed'),
+    ('sail_angle', 'sail_angle_rel'),
+    ('optimal_sail_trim', 'optimal_sail_trim'),
+    ('wind_effectiveness', 'wind_effectiveness'),
+    ('on_sandbar', 'on_sandbar'),
+    ('next_buoy', 'next_buoy_index'),
+    ('lap', 'current_lap'),
+)
+BOAT_FIELD_NAMES = tuple(name for name, _ in BOAT_FIELDS)
+RACE_FIELD_NAMES = ('time', 'wind_speed', 'wind_direction')
+
+class TelemetryRecorder:
+    """
+    Fixed-size ring buffers of per-boat state, sampled every 1/sample_rate seconds
+    of simulation time. Once capacity samples are taken the oldest are overwritten.
+    Each column is its own (capacity, boats) array, so a column's samples sit
+    contiguously and export straight to a .npy file.
+    """
+    def __init__(self, boats, sample_rate=TELEMETRY_SAMPLE_RATE, capacity=TELEMETRY_CAPACITY):
+        self.boats = list(boats)
+        self.names = [boat.name for boat in self.boats]
+        self.interval = 1.0 / sample_rate
+        self.capacity = capacity
+        self.race = np.zeros((len(RACE_FIELD_NAMES), capacity), dtype=np.float64)
+        self.data = np.zeros((len(BOAT_FIELDS), capacity, len(self.boats)), dtype=np.float32)
+        self._read = attrgetter(*(attr for _, attr in BOAT_FIELDS))
+        self.head = 0      # Next slot to write
+        self.samples = 0   # Samples taken in total, including overwritten ones
+        self.next_sample_time = 0.0
+
+    def __len__(self):
+        return min(self.samples, self.capacity)
+
+    @property
+    def nbytes(self):
+        return self.race.nbytes + self.data.nbytes
+
+    def record(self, sim):
+        """Called after every simulation step; takes a sample when one is due."""
+        # Half a step of slack so accumulated float error never skips a sample
+        if sim.time < self.next_sample_time - SIM_TIMESTEP / 2:
+            return
+        self.next_sample_time += self.interval
+        h = self.head
+        self.race[:, h] = (sim.time, sim.wind_speed, sim.wind_direction)
+        column = self.data[:, h]
+        read = self._read
+        for j, boat in enumerate(self.boats):
+            column[:, j] = read(boat)
+        self.head = h + 1 if h + 1 < self.capacity else 0
+        self.samples += 1
+
+    def _segments(self):
+        """(start, stop) slot ranges holding the samples, oldest first."""
+        if self.samples <= self.capacity:
+            return [(0, self.samples)]
+        return [(self.head, self.capacity), (0, self.head)]
+
+    def column(self, name):
+        """One column in time order: (samples,) for race fields, (samples, boats) for boat fields."""
+        if name in RACE_FIELD_NAMES:
+            ring = self.race[RACE_FIELD_NAMES.index(name)]
+        else:
+            ring = self.data[BOAT_FIELD_NAMES.index(name)]
+        segments = self._segments()
+        if len(segments) == 1:
+            return ring[:segments[0][1]] # A view; no copy until the ring wraps
+        return np.concatenate([ring[start:stop] for start, stop in segments])
+
+    def recent(self, name, boat_index, count):
+        """The last count samples of one boat's field, oldest first (for live charts)."""
+        count = min(count, len(self))
+        ring = self.data[BOAT_FIELD_NAMES.index(name), :, boat_index]
+        start = self.head - count
+        if start >= 0:
+            return ring[start:self.head]
+        return np.concatenate((ring[start:], ring[:self.head]))
+
+    def export(self, directory):
+        """
+        Writes every column to directory as <name>.npy, plus boats.json naming the
+        boat columns. Samples are copied from the ring straight into each file's
+        memory map, oldest first, without building intermediate arrays. Load them
+        back with load_telemetry.
+        """
+        os.makedirs(directory, exist_ok=True)
+        segments = self._segments()
+        count = len(self)
+        columns = [(name, self.race[i]) for i, name in enumerate(RACE_FIELD_NAMES)]
+        columns += [(name, self.data[i]) for i, name in enumerate(BOAT_FIELD_NAMES)]
+        for name, ring in columns:
+            path = os.path.join(directory, f"{name}.npy")
+            if count == 0:
+                np.save(path, ring[:0]) # An empty file can't be memory-mapped
+                continue
+            out = np.lib.format.open_memmap(path, mode='w+', dtype=ring.dtype, shape=(count,) + ring.shape[1:])
+            written = 0
+            for start, stop in segments:
+                out[written:written + stop - start] = ring[start:stop]
+                written += stop - start
+            out.flush()
+            del out
+        with open(os.path.join(directory, "boats.json"), 'w') as f:
+            json.dump({'boats': self.names, 'sample_rate': 1.0 / self.interval,
+                       'samples': count, 'dropped': self.samples - count}, f, indent=2)
+        return directory
+
+def load_telemetry(directory, mmap_mode='r'):
+    """
+    Opens an exported race as a dict of column name -> array, memory-mapped by
+    default so only the pages actually read are loaded. 'boats' holds the boat names
+    in column order.
+    """
+    with open(os.path.join(directory, "boats.json")) as f:
+        columns = {'boats': json.load(f)['boats']}
+    for name in RACE_FIELD_NAMES + BOAT_FIELD_NAMES:
+        columns[name] = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+    return columns
@@ -1,58 +1,360 @@
 # terrain.py
 
 import pygame
-import random
 import math
 from constants import *
+import numpy as np
+import numpy.random # numpy 2 loads it on first use, which would land in the first course's first slice
+from utils import run_to_completion
+import rng
 from entities import Sandbar
 
-def generate_random_polygon(width, height, scale_factor, num_vertices, irregularity):
-    """Generates a random, irregular polygon shape for depth layers."""
-    points = []
-    center_x, center_y = width / 2, height / 2
-    avg_radius = min(width, height) * 0.45 * scale_factor
-    
-    for i in range(num_vertices):
-        angle = (i / num_vertices) * (2 * math.pi)
-        radius_variation = random.uniform(1.0 - irregularity, 1.0 + irregularity)
-        radius = avg_radius * radius_variation
-        x = center_x + radius * math.cos(angle)
-        y = center_y + radius * math.sin(angle)
-        points.append((x, y))
-    return points
-
-def generate_depth_map(width, height, sandbars):
-    """Generates a surface representing water depth with layered contour lines."""
-    depth_surface = pygame.Surface((width, height))
-    depth_surface.fill(DARK_BLUE)  # Base ocean color
-
-    # Draw base depth contour layers
-    # These create the general, large-scale depth variations.
-    for i, color in enumerate(DEPTH_COLORS):
-        scale = 1.2 - (i * 0.2) # Larger scale for more coverage
-        verts = 16 - (i * 3)
-        irregularity = 0.2 + (i * 0.1)
-        poly = generate_random_polygon(width, height, scale, verts, irregularity)
-        pygame.draw.polygon(depth_surface, color, poly)
-
-    # For each sandbar, create a surrounding shallow area on the map.
-    # This makes them look like the peak of an underwater mound.
-    for sandbar in sandbars:
-        for i, color in enumerate(SHALLOW_COLORS):
-            # Create a larger, more irregular polygon around the sandbar
-            mound_points = []
-            for point in sandbar.points_world:
-                offset_x = (point[0] - sandbar.world_x) * (1.8 + i * 0.8) * random.uniform(0.7, 1.3)
-                offset_y = (point[1] - sandbar.world_y) * (1.8 + i * 0.8) * random.uniform(0.7, 1.3)
-                mound_points.append((sandbar.world_x + offset_x + WORLD_BOUNDS, sandbar.world_y + offset_y + WORLD_BOUNDS))
-            
-            pygame.draw.polygon(depth_surface, color, mound_points)
-    
+def depth_color(depth):
+    """The chart colour for a depth in metres."""
+    colors = [DARK_BLUE, *DEPTH_COLORS, *SHALLOW_COLORS]
+    for threshold, color in zip(TERRAIN_DEPTH_BANDS, colors):
+        if depth >= threshold:
+            return color
+    return SAND_COLOR
+
+def depth_codes(depths):
+    """Depths in metres as the 8-bit values the depth map stores."""
+    low, high = TERRAIN_DEPTH_RANGE
+    codes = (depths - low) * (255 / (high - low))
+    np.clip(codes, 0, 255, out=codes)
+    return codes.astype(np.uint8)
+
+def code_depth(code):
+    low, high = TERRAIN_DEPTH_RANGE
+    return low + code * (high - low) / 255
+
+# The depth map stores depth itself; its palette turns that into chart bands
+DEPTH_PALETTE = [depth_color(code_depth(code)) for code in range(256)]
+
+class Heightfield:
+    """
+    Water depth in metres over the whole world, sampled every cell world units
+    (samples sit at cell centres) and indexed [x, y] like pygame.surfarray.
+    Negative depth is dry sand. Physics reads it through depth_at and drag_at.
+    """
+    def __init__(self, depths, cell=HEIGHTFIELD_CELL, seed=None):
+        self.depths = depths
+        self.cell = cell
+        self.seed = seed # What the noise was drawn from, so the same bottom can be rebuilt
+
+    @property
+    def nbytes(self):
+        return self.depths.nbytes
+
+    def depth_at(self, x, y):
+        """Bilinearly interpolated depth at a world position; the edge samples carry on beyond the grid."""
+        depths = self.depths
+        n_x, n_y = depths.shape
+        gx = min(max((x + WORLD_BOUNDS) / self.cell - 0.5, 0.0), n_x - 1.000001)
+        gy = min(max((y + WORLD_BOUNDS) / self.cell - 0.5, 0.0), n_y - 1.000001)
+        i = int(gx)
+        j = int(gy)
+        fx = gx - i
+        fy = gy - j
+        top = depths.item(i, j) + (depths.item(i + 1, j) - depths.item(i, j)) * fx
+        bottom = depths.item(i, j + 1) + (depths.item(i + 1, j + 1) - depths.item(i, j + 1)) * fx
+        return top + (bottom - top) * fy
+
+    def drag_at(self, x, y):
+        """Drag multiplier for a hull at a world position: 1 in open water, rising as the water shoals."""
+        shallowness = 1.0 - self.depth_at(x, y) / SHALLOW_DRAG_DEPTH
+        if shallowness <= 0:
+            return 1.0
+        return 1.0 + (SHALLOW_DRAG_MULTIPLIER - 1.0) * min(1.0, shallowness)**2
+
+def upsample_weights(k, n):
+    """(n, k+1) weights that smoothly interpolate k lattice cells across n samples covering the same span."""
+    u = ((np.arange(n) + 0.5) * (k / n)).astype(np.float32)
+    i = np.minimum(u.astype(np.intp), k - 1)
+    f = u - i
+    f = f * f * (3 - 2 * f) # Smoothstep, so the lattice doesn't show as creases
+    weights = np.zeros((n, k + 1), dtype=np.float32)
+    rows = np.arange(n)
+    weights[rows, i] = 1 - f
+    weights[rows, i + 1] = f
+    return weights
+
+def outline_tables(sandbars, bins):
+    """
+    Each sandbar's outline radius, the distance from the middle of its corners to its
+    outline, in bins + 1 directions from -pi to pi, as a (len(sandbars), bins + 1) table;
+    and the middles. Sandbars are drawn round their middle, so every ray leaves through
+    one edge, found by angle. Only the outline is used, so a sandbar rebuilt from its
+    vertices gives the same answer.
+    """
+    angles = np.linspace(-math.pi, math.pi, bins + 1)
+    counts = np.array([len(sandbar.vertices) // 2 for sandbar in sandbars])
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    corners = np.array([c for sandbar in sandbars for c in sandbar.vertices], dtype=np.float64).reshape(-1, 2)
+    middles = np.add.reduceat(corners, starts) / counts[:, None]
+    owner = np.repeat(np.arange(len(sandbars)), counts)
+    px, py = (corners - middles[owner]).T
+    keys = np.arctan2(py, px) + 8 * owner # Every sandbar's corners in one sorted array
+    order = np.argsort(keys)
+    px, py, keys = px[order], py[order], keys[order]
+    starts = starts[:, None]
+    counts = counts[:, None]
+    k = np.searchsorted(keys, angles + 8 * np.arange(len(sandbars))[:, None]) - starts
+    k %= counts # Past the last corner wraps round to the first
+    a = starts + (k - 1) % counts
+    b = starts + k
+    ax, ay = px[a], py[a]
+    ex, ey = px[b] - ax, py[b] - ay
+    denom = np.cos(angles) * ey - np.sin(angles) * ex
+    return ((ax * ey - ay * ex) / np.where(denom != 0, denom, 1e-9)).astype(np.float32), middles
+
+def shoal_distances(sandbars, centres):
+    """
+    Distance of the heightfield cells round each sandbar from its outline, along the ray
+    from its middle: negative inside, zero on the outline. Each sandbar's cells are its
+    box widened by TERRAIN_SHOAL_REACH. Returns the boxes as (x0, x1, y0, y1) index
+    ranges and one flat float32 array of every box's distances, box after box, worked
+    out in one pass: the outline radius comes from a table per sandbar, interpolated by angle.
+    """
+    bins = TERRAIN_OUTLINE_BINS
+    tables, middles = outline_tables(sandbars, bins)
+    rects = np.array([(b.rect.left, b.rect.right, b.rect.top, b.rect.bottom) for b in sandbars], dtype=np.float32)
+    x0s = np.searchsorted(centres, rects[:, 0] - TERRAIN_SHOAL_REACH)
+    x1s = np.searchsorted(centres, rects[:, 1] + TERRAIN_SHOAL_REACH)
+    y0s = np.searchsorted(centres, rects[:, 2] - TERRAIN_SHOAL_REACH)
+    y1s = np.searchsorted(centres, rects[:, 3] + TERRAIN_SHOAL_REACH)
+    sizes = np.maximum(x1s - x0s, 0) * np.maximum(y1s - y0s, 0)
+    total = int(sizes.sum())
+    dx = np.empty(total, dtype=np.float32)
+    dy = np.empty(total, dtype=np.float32)
+    base = np.empty(total, dtype=np.intp) # Where each cell's sandbar's table starts in tables.ravel()
+    boxes = []
+    offset = 0
+    for i, (cx, cy) in enumerate(middles):
+        x0, x1, y0, y1 = int(x0s[i]), int(x1s[i]), int(y0s[i]), int(y1s[i])
+        boxes.append((x0, x1, y0, y1))
+        size = int(sizes[i])
+        if size == 0:
+            continue
+        w, h = x1 - x0, y1 - y0
+        dx[offset:offset + size].reshape(w, h)[:] = (centres[x0:x1] - cx)[:, None]
+        dy[offset:offset + size].reshape(w, h)[:] = (centres[y0:y1] - cy)[None, :]
+        base[offset:offset + size] = i * (bins + 1)
+        offset += size
+
+    t = np.arctan2(dy, dx)
+    dx *= dx
+    dy *= dy
+    dx += dy
+    r = np.sqrt(dx, out=dx)
+    t += math.pi
+    t *= bins / (2 * math.pi)
+    j = t.astype(np.intp)
+    np.minimum(j, bins - 1, out=j)
+    t -= j # Now the fraction of the way to the next table entry
+    j += base
+    flat = tables.ravel()
+    lower = flat.take(j)
+    j += 1
+    upper = flat.take(j)
+    r -= lower
+    upper -= lower
+    upper *= t
+    r -= upper
+    return boxes, r
+
+def generate_heightfield(sandbars, seed=None):
+    """Builds the course's Heightfield in one go."""
+    return run_to_completion(generate_heightfield_steps(sandbars, seed))
+
+def generate_heightfield_steps(sandbars, seed=None):
+    """
+    Generator form of generate_heightfield: yields after the open-water bottom and after
+    laying on the shoals of each TERRAIN_SHOAL_CHUNK sandbars, returns the Heightfield. The bottom deepens away from the middle of the
+    course, with smooth noise on top; each sandbar rises out of it on a slope. A chunk's
+    shoals are worked out in one array pass.
+    Without a seed, one is drawn from rng.terrain.
+    """
+    if seed is None:
+        seed = rng.terrain.getrandbits(32)
+    noise_rng = np.random.default_rng(seed)
+    cell = HEIGHTFIELD_CELL
+    n = math.ceil(2 * WORLD_BOUNDS / cell)
+    centres = ((np.arange(n) + 0.5) * cell - WORLD_BOUNDS).astype(np.float32)
+
+    # Each octave of noise is weights @ lattice @ weights.T, so all of them together are one
+    # (n, m) @ (m, n) product; the bottom is too, with two more columns for its deepening to the edge
+    amplitudes = [0.5**octave for octave in range(len(TERRAIN_NOISE_CELLS))]
+    left, right = [], []
+    for amplitude, cells in zip(amplitudes, TERRAIN_NOISE_CELLS):
+        weights = upsample_weights(cells, n)
+        lattice = noise_rng.uniform(-1, 1, (cells + 1, cells + 1)).astype(np.float32)
+        left.append(weights @ (lattice * np.float32(amplitude / sum(amplitudes)))) # Scaled back to -1..1 overall
+        right.append(weights)
+    left = np.hstack(left)
+    right = np.hstack(right)
+    noise = left @ right.T
+    rise = (TERRAIN_EDGE_DEPTH / 2 * (centres / WORLD_BOUNDS)**2)[:, None]
+    ones = np.ones((n, 1), dtype=np.float32)
+    depths = np.hstack((TERRAIN_NOISE_DEPTH * left, TERRAIN_BASE_DEPTH + rise, ones)) @ np.hstack((right, ones, rise)).T
+    yield
+
+    # A chunk of sandbars per slice; where shoals overlap the shallowest wins, so the order doesn't matter
+    for start in range(0, len(sandbars), TERRAIN_SHOAL_CHUNK):
+        boxes, distances = shoal_distances(sandbars[start:start + TERRAIN_SHOAL_CHUNK], centres)
+        # Steepening towards the reach, so the shoal has always met the bottom by the edge of the box
+        flatten = np.minimum(distances * (1 / TERRAIN_SHOAL_REACH), 0.99)
+        flatten *= flatten
+        np.subtract(1, flatten, out=flatten)
+        distances *= TERRAIN_SHOAL_SLOPE
+        distances /= flatten
+        offset = 0
+        for x0, x1, y0, y1 in boxes:
+            if x1 <= x0 or y1 <= y0:
+                continue
+            size = (x1 - x0) * (y1 - y0)
+            shoal = distances[offset:offset + size].reshape(x1 - x0, y1 - y0)
+            shoal *= 1 + TERRAIN_SHOAL_VARIATION * noise[x0:x1, y0:y1]
+            np.minimum(depths[x0:x1, y0:y1], shoal, out=depths[x0:x1, y0:y1])
+            offset += size
+        yield
+
+    return Heightfield(depths, cell, seed)
+
+class DepthMap:
+    """
+    The course's depth chart stored compactly: 8-bit palettized, optionally at
+    1/scale resolution and upscaled only for the part of it that's on screen.
+    Each pixel holds the depth there (see depth_codes); the palette bands it.
+    """
+    def __init__(self, width, height, scale=DEPTH_MAP_SCALE):
+        self.width = width
+        self.height = height
+        self.scale = scale
+        self.surface = pygame.Surface((math.ceil(width / scale), math.ceil(height / scale)), 0, 8)
+        self.surface.set_palette(DEPTH_PALETTE)
+        self._view_buffer = None
+
+    def get_size(self):
+        """Size in world pixels, matching the full-resolution surface this replaces."""
+        return (self.width, self.height)
+
+    @property
+    def nbytes(self):
+        return self.surface.get_pitch() * self.surface.get_height()
+
+    def to_map(self, points):
+        """Converts depth-map pixel coordinates into storage coordinates."""
+        s = self.scale
+        return [(x / s, y / s) for x, y in points]
+
+    def blit_view(self, target, area_x, area_y, view_scale=1.0):
+        """
+        Draws the region starting at (area_x, area_y) in depth-map pixels so it fills target,
+        at view_scale target pixels per depth-map pixel.
+        """
+        view_w, view_h = target.get_size()
+        s = self.scale * view_scale # Target pixels per stored pixel
+        if s == 1:
+            target.blit(self.surface, (0, 0), area=pygame.Rect(area_x / self.scale, area_y / self.scale, view_w, view_h))
+            return
+        src_w, src_h = self.surface.get_size()
+        x0 = max(0, math.floor(area_x / self.scale))
+        y0 = max(0, math.floor(area_y / self.scale))
+        x1 = min(src_w, math.ceil((area_x + view_w / view_scale) / self.scale))
+        y1 = min(src_h, math.ceil((area_y + view_h / view_scale) / self.scale))
+        if x1 <= x0 or y1 <= y0:
+            return
+        source = self.surface.subsurface(pygame.Rect(x0, y0, x1 - x0, y1 - y0))
+        scaled_size = (round((x1 - x0) * s), round((y1 - y0) * s))
+        buffer = self._view_buffer
+        if buffer is None or buffer.get_width() < scaled_size[0] or buffer.get_height() < scaled_size[1]:
+            margin = 2 * math.ceil(s)
+            buffer = pygame.Surface((view_w + margin, view_h + margin), 0, 8)
+            buffer.set_palette(DEPTH_PALETTE)
+            self._view_buffer = buffer
+        dest = buffer.subsurface(pygame.Rect((0, 0), scaled_size))
+        pygame.transform.scale(source, scaled_size, dest)
+        target.blit(dest, (int((x0 * self.scale - area_x) * view_scale), int((y0 * self.scale - area_y) * view_scale)))
+
+def double_codes(codes):
+    """
+    Bilinearly interpolates a grid of depth codes, sampled at cell centres, to twice the
+    resolution: each new sample is 3/4 its own cell and 1/4 the neighbour it's nearer.
+    """
+    a = codes.astype(np.uint16)
+    w, h = a.shape
+    a3 = a * 3
+    a3 += 2 # Rounds the quarter
+    rows = np.empty((2 * w, h), dtype=np.uint16)
+    np.add(a3[1:], a[:-1], out=rows[2::2])
+    np.add(a3[:-1], a[1:], out=rows[1:-1:2])
+    np.add(a3[0], a[0], out=rows[0])
+    np.add(a3[-1], a[-1], out=rows[-1])
+    rows >>= 2
+    r3 = rows * 3
+    r3 += 2
+    out = np.empty((2 * w, 2 * h), dtype=np.uint16)
+    np.add(r3[:, 1:], rows[:, :-1], out=out[:, 2::2])
+    np.add(r3[:, :-1], rows[:, 1:], out=out[:, 1:-1:2])
+    np.add(r3[:, 0], rows[:, 0], out=out[:, 0])
+    np.add(r3[:, -1], rows[:, -1], out=out[:, -1])
+    out >>= 2
+    return out.astype(np.uint8)
+
+def generate_depth_map_steps(width, height, sandbars, depth_map=None, heightfield=None):
+    """
+    Generator form of generate_depth_map. Yields between small slices of work so the
+    map can be built across frames; returns the finished DepthMap. The heightfield's
+    depths are turned into 8-bit codes and scaled up to the map's resolution without
+    leaving 8 bits, then the sandbars are stamped on top so their outlines are exactly
+    what boats hit.
+    Pass the previous race's DepthMap to reuse its storage instead of allocating new,
+    and the course's Heightfield to draw that rather than a new one.
+    """
+    if depth_map is not None and depth_map.get_size() == (width, height) and depth_map.scale == DEPTH_MAP_SCALE:
+        depth_surface = depth_map.surface
+    else:
+        depth_map = DepthMap(width, height, DEPTH_MAP_SCALE)
+        depth_surface = depth_map.surface
+        yield
+    if heightfield is None:
+        heightfield = yield from generate_heightfield_steps(sandbars)
+
+    # Depths to 8-bit codes at the heightfield's resolution, interpolated to twice that in
+    # integer arithmetic, then scaled the rest of the way to the map's straight into its 8-bit storage
+    codes = depth_codes(heightfield.depths)
+    factor = max(1, round(heightfield.cell / depth_map.scale)) # Map pixels per heightfield cell
+    if factor % 2 == 0:
+        codes = double_codes(codes)
+        factor //= 2
+    yield
+    source = pygame.Surface(codes.shape, 0, 8)
+    pygame.surfarray.pixels2d(source)[:] = codes
+    scaled_size = (codes.shape[0] * factor, codes.shape[1] * factor)
+    if scaled_size == depth_surface.get_size():
+        pygame.transform.scale(source, scaled_size, depth_surface)
+    else:
+        scaled = pygame.transform.scale(source, scaled_size)
+        map_w, map_h = depth_surface.get_size()
+        copy_w = min(map_w, scaled_size[0])
+        copy_h = min(map_h, scaled_size[1])
+        pixels = pygame.surfarray.pixels2d(depth_surface)
+        pixels[:copy_w, :copy_h] = pygame.surfarray.pixels2d(scaled)[:copy_w, :copy_h]
+        del pixels, scaled
+    del source
+    yield
+
     # Stamp the sandbars themselves on the very top as the lightest, shallowest area.
+    to_map = depth_map.to_map
+    border_width = max(1, 2 // depth_map.scale)
     for sandbar in sandbars:
-        sandbar_poly_on_surface = [(p[0] + WORLD_BOUNDS, p[1] + WORLD_BOUNDS) for p in sandbar.points_world]
+        sandbar_poly_on_surface = to_map([(p[0] + WORLD_BOUNDS, p[1] + WORLD_BOUNDS) for p in sandbar.points_world])
         pygame.draw.polygon(depth_surface, sandbar.color, sandbar_poly_on_surface)
-        pygame.draw.polygon(depth_surface, sandbar.border_color, sandbar_poly_on_surface, 2)
+        pygame.draw.polygon(depth_surface, sandbar.border_color, sandbar_poly_on_surface, border_width)
 
+    return depth_map
 
-    return depth_surface
+def generate_depth_map(width, height, sandbars, depth_map=None, heightfield=None):
+    """Renders a DepthMap of the water depth from the course's Heightfield (a new one if not given)."""
+    return run_to_completion(generate_depth_map_steps(width, height, sandbars, depth_map, heightfield))
@@ -0,0 +1,277 @@
+# tuning.py
+#
+# Evolves the AIBoat style parameters over seeded headless races and writes tuned
+# presets plus difficulty tiers for the game to load.
+#   python tuning.py                                  all styles, default budget
+#   python tuning.py --styles PERFECTIONIST --generations 4 --seeds 3
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from constants import *
+import numpy as np
+
+from entities import AIBoat, SailingStyle
+from course import prepare_course_steps
+from bundle import generation_hash
+from simulation import RaceSimulation, place_boats_on_start_grid
+from utils import run_to_completion
+import rng
+
+# (name, lowest, highest): the union of the hand-picked ranges in AIBoat.__init__
+PARAMETERS = (
+    ('turn_rate_modifier', 0.8, 1.2),
+    ('sail_trim_error', -10.0, 10.0),
+    ('heading_error', -7.0, 7.0),
+    ('tack_anticipation', 5.0, 18.0),
+)
+PARAMETER_NAMES = tuple(name for name, _, _ in PARAMETERS)
+PARAMETER_LOW = np.array([low for _, low, _ in PARAMETERS])
+PARAMETER_HIGH = np.array([high for _, _, high in PARAMETERS])
+
+def to_profile(params):
+    return dict(zip(PARAMETER_NAMES, (float(v) for v in params)))
+
+_courses = {} # Seed -> Course, generated once per process
+
+def seeded_course(seed):
+    """The course the game races for seed, chosen from scored candidates like any other (see course.py)."""
+    if seed not in _courses:
+        _courses[seed] = run_to_completion(prepare_course_steps(seed=seed))
+    return _courses[seed]
+
+def race_time(style_name, params, seed, laps):
+    """
+    Races one AI boat with the given parameters solo around the course for seed.
+    Returns its finish time, or the time limit plus a penalty per mark still to go.
+    """
+    course = seeded_course(seed) # Drawn from its own stream, so every candidate sails the same water for a given seed
+    course_buoys_coords = course.course_buoys_coords
+    rng.seed_all(seed)
+    wind_speed = rng.wind.uniform(MIN_WIND_SPEED, MAX_WIND_SPEED)
+
+    boat = AIBoat(0, 0, "Tuning", SailingStyle[style_name], WHITE, to_profile(params))
+    place_boats_on_start_grid([boat])
+    sim = RaceSimulation([boat], course_buoys_coords, course.sandbar_index, laps,
+                         wind_speed, course.wind_direction, pre_race_timer=0, navigation=course.navigation,
+                         heightfield=course.heightfield)
+    while sim.time < TUNING_MAX_RACE_TIME and not boat.is_finished:
+        sim.step(SIM_TIMESTEP)
+    if boat.is_finished:
+        return boat.finish_time
+
+    num_buoys = len(course_buoys_coords)
+    marks = laps * num_buoys + 2 # Start and finish crossings count as marks
+    rounded = int(boat.race_started) + (boat.current_lap - 1) * num_buoys + boat.next_buoy_index
+    return TUNING_MAX_RACE_TIME + TUNING_DNF_PENALTY * (marks - rounded)
+
+def _race_time_job(job):
+    return race_time(*job)
+
+class EvaluationCache:
+    """
+    Race times keyed by style, laps, seed and parameters, kept in a JSON file between runs.
+    Keys include the course generation settings' hash, so times raced on other courses aren't reused.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.generation = generation_hash()[:12]
+        self.times = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.times = json.load(f)
+
+    def key(self, style_name, params, seed, laps):
+        return f"{style_name}|{laps}|{seed}|{self.generation}|" + ",".join(f"{v:.4f}" for v in params)
+
+    def get(self, style_name, params, seed, laps):
+        return self.times.get(self.key(style_name, params, seed, laps))
+
+    def put(self, style_name, params, seed, laps, value):
+        self.times[self.key(style_name, params, seed, laps)] = value
+
+    def save(self):
+        if self.path is None:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.times, f)
+        os.replace(tmp, self.path)
+
+class Evaluator:
+    """Scores candidates as their mean race time over a fixed set of seeds, racing uncached ones in a pool."""
+    def __init__(self, seeds, laps=1, cache=None, pool=None):
+        self.seeds = list(seeds)
+        self.laps = laps
+        self.cache = cache or EvaluationCache()
+        self.pool = pool
+        self.races = 0
+        self.cache_hits = 0
+
+    def fitness(self, style_name, candidates):
+        """Mean race time of each candidate (lower is better)."""
+        candidates = [tuple(round(float(v), 4) for v in params) for params in candidates]
+        jobs = []
+        for params in candidates:
+            for seed in self.seeds:
+                job = (style_name, params, seed, self.laps)
+                if self.cache.get(*job) is None and job not in jobs:
+                    jobs.append(job)
+        self.cache_hits += len(candidates) * len(self.seeds) - len(jobs)
+        results = self.pool.map(_race_time_job, jobs, chunksize=1) if self.pool is not None else map(_race_time_job, jobs)
+        for job, value in zip(jobs, results):
+            self.cache.put(*job, value)
+        self.races += len(jobs)
+        return [float(np.mean([self.cache.get(style_name, params, seed, self.laps) for seed in self.seeds]))
+                for params in candidates]
+
+def hand_picked_samples(style, count):
+    """Parameter sets drawn from AIBoat's own hand-picked ranges for style."""
+    samples = []
+    for _ in range(count):
+        boat = AIBoat(0, 0, "", style, WHITE)
+        samples.append([getattr(boat, name) for name in PARAMETER_NAMES])
+    return np.array(samples, dtype=float).reshape(count, len(PARAMETERS))
+
+def evolve(style, evaluator, population=TUNING_POPULATION, generations=TUNING_GENERATIONS, gen=None, log=None):
+    """
+    Genetic algorithm over the style's parameters: tournament selection, blend
+    crossover and Gaussian mutation, with the best TUNING_ELITE kept each generation.
+    Starts from the hand-picked ranges plus uniform samples. Returns (params, mean time).
+    """
+    gen = gen or np.random.default_rng()
+    span = PARAMETER_HIGH - PARAMETER_LOW
+    seeded = population // 2
+    pop = np.vstack([hand_picked_samples(style, seeded),
+                     gen.uniform(PARAMETER_LOW, PARAMETER_HIGH, (population - seeded, len(PARAMETERS)))])
+    best, best_fitness = None, float('inf')
+
+    def tournament(fitness):
+        picks = gen.choice(population, size=3, replace=False)
+        return pop[min(picks, key=lambda i: fitness[i])]
+
+    for generation in range(generations):
+        fitness = evaluator.fitness(style.name, pop)
+        order = np.argsort(fitness)
+        if fitness[order[0]] < best_fitness:
+            best, best_fitness = pop[order[0]].copy(), fitness[order[0]]
+        if log is not None:
+            log(f"{style.name} gen {generation + 1}/{generations}: best {best_fitness:.1f}s, "
+                f"median {float(np.median(fitness)):.1f}s")
+        if generation == generations - 1:
+            break
+
+        # Mutation narrows as the run goes on
+        sigma = TUNING_MUTATION * span * (1.0 - 0.5 * generation / max(1, generations - 1))
+        children = [pop[i] for i in order[:TUNING_ELITE]]
+        while len(children) < population:
+            a, b = tournament(fitness), tournament(fitness)
+            blend = gen.uniform(-0.25, 1.25, len(PARAMETERS))
+            child = a + blend * (b - a) + gen.normal(0.0, sigma)
+            children.append(np.clip(child, PARAMETER_LOW, PARAMETER_HIGH))
+        pop = np.round(np.array(children), 4)
+    return best, best_fitness
+
+def degrade(params, amount):
+    """Moves params amount (0..1) of the way toward the sloppiest sailing: slow turns and maximum errors."""
+    params = np.asarray(params, dtype=float)
+    sloppy = params.copy()
+    sloppy[0] = PARAMETER_LOW[0]
+    # Keep the sign of each error, just make it as large as the hand-picked ranges allow
+    sloppy[1:3] = np.where(params[1:3] < 0, PARAMETER_LOW[1:3], PARAMETER_HIGH[1:3])
+    return np.round(params + amount * (sloppy - params), 4)
+
+def calibrate_tiers(style, tuned, tuned_time, evaluator, tiers=AI_DIFFICULTY_TIERS, steps=TUNING_CALIBRATION_STEPS):
+    """
+    Finds, for each tier, how far to degrade the tuned parameters so the mean race
+    time lands on the tier's ratio of the tuned time. Bisects all tiers together so
+    each round's races share the pool. Returns {tier: (params, mean time)}.
+    """
+    low = {tier: 0.0 for tier in tiers}
+    high = {tier: 1.0 for tier in tiers}
+    result = {tier: (tuned, tuned_time) for tier in tiers}
+    searching = [tier for tier, ratio in tiers.items() if ratio > 1.0]
+    for _ in range(steps):
+        if not searching:
+            break
+        amounts = [(low[tier] + high[tier]) / 2 for tier in searching]
+        times = evaluator.fitness(style.name, [degrade(tuned, amount) for amount in amounts])
+        for tier, amount, mean_time in zip(searching, amounts, times):
+            target = tuned_time * tiers[tier]
+            if mean_time < target:
+                low[tier] = amount
+            else:
+                high[tier] = amount
+            best_params, best_time = result[tier]
+            if abs(mean_time - target) < abs(best_time - target):
+                result[tier] = (degrade(tuned, amount), mean_time)
+    return result
+
+def tune(styles, seeds, laps=1, population=TUNING_POPULATION, generations=TUNING_GENERATIONS, workers=None,
+         cache_path=TUNING_CACHE_FILE, rng_seed=None, log=None):
+    """Runs evolve and calibrate_tiers for each style. Returns the presets dict written by main."""
+    gen = np.random.default_rng(rng_seed)
+    rng.seed_all(rng_seed) # hand_picked_samples builds AIBoats, which draw from rng.fleet
+    cache = EvaluationCache(cache_path)
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) if workers > 1 else None
+    evaluator = Evaluator(seeds, laps, cache, pool)
+    presets = {'styles': {}, 'tiers': {tier: {} for tier in AI_DIFFICULTY_TIERS}, 'race_times': {},
+               'seeds': list(seeds), 'laps': laps}
+    try:
+        for style in styles:
+            tuned, tuned_time = evolve(style, evaluator, population, generations, gen, log)
+            cache.save()
+            presets['styles'][style.name] = to_profile(tuned)
+            presets['race_times'][style.name] = {}
+            for tier, (params, mean_time) in calibrate_tiers(style, tuned, tuned_time, evaluator).items():
+                presets['tiers'][tier][style.name] = to_profile(params)
+                presets['race_times'][style.name][tier] = mean_time
+                if log is not None:
+                    log(f"{style.name} {tier}: {mean_time:.1f}s ({mean_time / tuned_time:.2f}x tuned)")
+            cache.save()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        cache.save()
+    presets['evaluations'] = {'races': evaluator.races, 'cache_hits': evaluator.cache_hits}
+    return presets
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evolve AI sailing style parameters over seeded headless races")
+    parser.add_argument('--styles', nargs='+', choices=[style.name for style in SailingStyle],
+                        default=[style.name for style in SailingStyle])
+    parser.add_argument('--population', type=int, default=TUNING_POPULATION)
+    parser.add_argument('--generations', type=int, default=TUNING_GENERATIONS)
+    parser.add_argument('--seeds', type=int, default=TUNING_SEEDS, help="number of seeded courses per candidate")
+    parser.add_argument('--seed', type=int, default=1, help="first course seed; also seeds the optimizer")
+    parser.add_argument('--laps', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=None, help="race processes (default: CPU count)")
+    parser.add_argument('--cache', default=TUNING_CACHE_FILE, help="evaluation cache file ('' to disable)")
+    parser.add_argument('--out', default=AI_PRESETS_FILE)
+    args = parser.parse_args(argv)
+
+    def report(message):
+        print(message, flush=True)
+
+    start = time.perf_counter()
+    presets = tune([SailingStyle[name] for name in args.styles], range(args.seed, args.seed + args.seeds),
+                   args.laps, args.population, args.generations, args.workers, args.cache or None, args.seed, report)
+    with open(args.out, 'w') as f:
+        json.dump(presets, f, indent=2)
+    evaluations = presets['evaluations']
+    print(f"Wrote {args.out}: {evaluations['races']} races run, {evaluations['cache_hits']} cached, "
+          f"{time.perf_counter() - start:.1f}s")
+    return 0
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -2,9 +2,10 @@
 
 import pygame
 import math
-import random
+from concurrent.futures import wait
 
 from constants import *
+import rng
 
 def deg_to_rad(degrees):
     return degrees * math.pi / 180.0
@@ -44,6 +45,19 @@ def check_line_crossing(p1, p2, line_p1, line_p2):
 
     return False
 
+def run_to_completion(steps):
+    """
+    Drives a work-slicing generator to the end and returns its result. A slice that
+    yields a future is only waiting on another process, so this blocks on it instead.
+    """
+    while True:
+        try:
+            waiting = next(steps)
+        except StopIteration as done:
+            return done.value
+        if waiting is not None:
+            wait([waiting])
+
 def format_time(seconds):
     """Formats seconds into MM:SS.ss"""
     if seconds < 0 or not math.isfinite(seconds):
@@ -58,17 +72,17 @@ def create_wave_layer(width, height, density, alpha, thickness):
     layer = pygame.Surface((width, height), pygame.SRCALPHA)
     layer.fill((0,0,0,0))
     for _ in range(density):
-        x = random.randint(0, width)
-        y = random.randint(0, height)
-        length = random.randint(5, 15)
-        angle = random.uniform(0, 360)
+        x = rng.visual.randint(0, width)
+        y = rng.visual.randint(0, height)
+        length = rng.visual.randint(5, 15)
+        angle = rng.visual.uniform(0, 360)
         end_x = x + math.cos(deg_to_rad(angle)) * length
         end_y = y + math.sin(deg_to_rad(angle)) * length
         pygame.draw.line(layer, (*LIGHT_BLUE, alpha), (x, y), (end_x, end_y), thickness)
     return layer
 
-def draw_scrolling_water(surface, layers, offsets, wind_direction_rad, dt):
-    """Draws and scrolls the wave layers on the given surface."""
+def draw_scrolling_water(surface, layers, offsets, wind_direction_rad, dt, scale=1.0):
+    """Draws and scrolls the wave layers on the given surface, scrolling scale pixels per world unit."""
     base_speed_factor = 50.0
     wind_influence = 0.3
     wind_dx = math.cos(wind_direction_rad)
@@ -83,7 +97,7 @@ def draw_scrolling_water(surface, layers, offsets, wind_direction_rad, dt):
             scroll_dx /= norm
             scroll_dy /= norm
         
-        speed = WAVE_SCROLL_SPEED_BASE[i] * base_speed_factor
+        speed = WAVE_SCROLL_SPEED_BASE[i] * base_speed_factor * scale
         offsets[i][0] += scroll_dx * speed * dt
         offsets[i][1] += scroll_dy * speed * dt
         